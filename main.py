@@ -9,9 +9,19 @@ from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
 
 from src.config import settings, LOGGING_CONFIG
-from src.database import init_db
+from src.database import init_db, SessionLocal
 from src.routers import auth, knowledge, search, chat, admin
 from src.middleware import AuthMiddleware
+from src.search_index import search_index
+from src.index_sync import register_index_sync, add_commit_listener
+from src.suggest import suggester
+from src.search_log import search_logger
+from src.chat_log import chat_logger
+from src.vector_index import vector_index
+from src.fuzzy import fuzzy_corrector
+from src.segmenter import segmenter
+from src.ai_service import ai_service
+from src.answer_cache import answer_cache
 
 
 # 配置日志
@@ -33,12 +43,57 @@ async def lifespan(app: FastAPI):
         logger.error(f"数据库初始化失败: {e}")
         raise
     
+    # 注册知识库变更同步：问答缓存失效不依赖搜索引擎类型，内存索引就绪后才增量更新
+    add_commit_listener(answer_cache.on_commit)
+    register_index_sync()
+
+    # 构建搜索索引
+    if settings.search_engine == "memory":
+        db = SessionLocal()
+        try:
+            search_index.add_listener(suggester)
+            search_index.add_listener(vector_index)
+            search_index.add_listener(fuzzy_corrector)
+            search_index.add_listener(segmenter)
+            search_index.build(db)
+            logger.info(f"搜索索引构建完成: {search_index.stats()}, 搜索建议: {suggester.stats()}, 向量索引: {vector_index.stats()}")
+        except Exception as e:
+            logger.error(f"搜索索引构建失败，搜索将回退到数据库查询: {e}")
+        finally:
+            db.close()
+    
+    # 加载搜索统计并启动搜索日志批量落库
+    db = SessionLocal()
+    try:
+        search_logger.load(db)
+    except Exception as e:
+        logger.error(f"搜索统计加载失败: {e}")
+    finally:
+        db.close()
+    search_logger.add_listener(suggester.bump)
+    await search_logger.start()
+    
+    # 启动聊天记录批量落库
+    await chat_logger.start()
+    
+    # 创建AI服务的共享HTTP客户端（连接池复用）
+    await ai_service.start()
+    
     logger.info("ISP知识库系统启动完成")
     
     yield
     
     # 关闭时执行
     logger.info("正在关闭ISP知识库系统...")
+    
+    # 刷写未落库的搜索日志
+    await search_logger.stop()
+    
+    # 刷写未落库的聊天记录
+    await chat_logger.stop()
+    
+    # 关闭AI服务的HTTP连接
+    await ai_service.close()
 
 
 # 创建FastAPI应用
@@ -88,7 +143,8 @@ async def http_exception_handler(request, exc):
             "success": False,
             "message": exc.detail,
             "error_code": f"HTTP_{exc.status_code}"
-        }
+        },
+        headers=getattr(exc, "headers", None)
     )
 
 
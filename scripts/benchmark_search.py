@@ -0,0 +1,371 @@
+"""
+搜索性能基准测试脚本
+对指定数据库（通常由 generate_isp_corpus.py 生成）回放固定的查询组合，
+分别测量 search_knowledge、/knowledge/search 和 /search/suggestions 的延迟分位数、QPS 和内存占用，
+内存索引下还对比 /search/batch 与逐条 /search 执行同一组查询的吞吐，
+结果写入JSON文件，可通过 --compare 与上一次结果对比发现性能回退
+
+用法:
+    python scripts/benchmark_search.py --database-url sqlite:///./bench_10k.db --output bench_10k.json
+    python scripts/benchmark_search.py --database-url sqlite:///./bench_10k.db --compare bench_10k.json
+"""
+import sys
+import os
+import argparse
+import asyncio
+import json
+import platform
+import random
+import resource
+import subprocess
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.generate_isp_corpus import MODULES, ASPECTS, SYMPTOMS, SCENES
+
+# 查询类型及其在查询组合中的占比
+QUERY_MIX = {
+    "term": 0.35,        # 单个中文术语，如 "自动白平衡"
+    "phrase": 0.2,       # 术语 + 现象/场景，如 "低照度 噪点"
+    "latin": 0.2,        # 英文缩写，如 "AWB"
+    "typo": 0.1,         # 拼错的英文缩写
+    "miss": 0.15,        # 无结果查询
+}
+
+# 性能回退判定阈值（p95相对上次增长比例）
+REGRESSION_THRESHOLD = 0.2
+
+
+def make_typo(rng: random.Random, word: str) -> str:
+    """交换相邻两个字符制造拼写错误"""
+    if len(word) < 3:
+        return word + word[-1]
+    i = rng.randrange(len(word) - 1)
+    return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+
+
+def generate_queries(rng: random.Random, count: int) -> List[str]:
+    """按 QUERY_MIX 生成查询序列"""
+    kinds = list(QUERY_MIX)
+    weights = list(QUERY_MIX.values())
+    queries = []
+    for kind in rng.choices(kinds, weights, k=count):
+        name, abbr = rng.choice(MODULES)
+        if kind == "term":
+            query = name
+        elif kind == "phrase":
+            query = f"{rng.choice(SCENES + [name])} {rng.choice(SYMPTOMS + ASPECTS)}"
+        elif kind == "latin":
+            query = abbr
+        elif kind == "typo":
+            query = make_typo(rng, abbr.lower())
+        else:
+            query = f"不存在的主题{rng.randint(0, 10 ** 6)}"
+        queries.append(query)
+    return queries
+
+
+def suggestion_prefixes(queries: List[str]) -> List[str]:
+    """把查询截成输入中的前缀（模拟逐字输入时的建议请求）"""
+    return [query[:max(1, len(query) // 2)] for query in queries]
+
+
+def current_rss_mb() -> Optional[float]:
+    """当前常驻内存（MB），仅Linux可用"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024, 1)
+    except (OSError, ValueError):
+        return None
+
+
+def peak_rss_mb() -> float:
+    """进程峰值常驻内存（MB）"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 以字节为单位，Linux 以KB为单位
+    return round(peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """最近秩法计算分位数"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(fraction * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    """汇总延迟（毫秒）"""
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "errors": errors,
+        "p50_ms": round(percentile(values, 0.50), 3),
+        "p95_ms": round(percentile(values, 0.95), 3),
+        "p99_ms": round(percentile(values, 0.99), 3),
+        "mean_ms": round(sum(values) / len(values), 3) if values else 0.0,
+        "max_ms": round(values[-1], 3) if values else 0.0,
+        "qps": round(len(values) / elapsed, 1) if elapsed > 0 else 0.0,
+    }
+
+
+async def replay(call: Callable, queries: List[str], warmup: int) -> Dict[str, Any]:
+    """顺序回放查询，返回延迟统计"""
+    for query in queries[:warmup]:
+        await call(query)
+
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    for query in queries:
+        begin = time.perf_counter()
+        try:
+            await call(query)
+        except Exception:
+            errors += 1
+            continue
+        latencies.append((time.perf_counter() - begin) * 1000)
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+async def batch_versus_serial(
+    serial: Callable,
+    batch: Callable,
+    queries: List[str],
+    batch_size: int,
+    warmup: int
+) -> Dict[str, Dict[str, Any]]:
+    """
+    把查询按 batch_size 分组，每组分别逐条执行和批量执行一次，
+    返回两种方式的每组延迟统计（QPS为每秒完成的组数）
+    """
+    groups = [queries[i:i + batch_size] for i in range(0, len(queries), batch_size)]
+    for group in groups[:max(1, warmup // batch_size)]:
+        await serial(group)
+        await batch(group)
+
+    targets = {}
+    for name, call in (("search_serial", serial), ("search_batch", batch)):
+        latencies = []
+        errors = 0
+        started = time.perf_counter()
+        for group in groups:
+            begin = time.perf_counter()
+            try:
+                await call(group)
+            except Exception:
+                errors += 1
+                continue
+            latencies.append((time.perf_counter() - begin) * 1000)
+        targets[name] = summarize(latencies, errors, time.perf_counter() - started)
+    return targets
+
+
+def git_commit() -> Optional[str]:
+    """当前代码版本"""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """与基线结果对比，打印各目标p95变化，返回发生回退的目标"""
+    regressions = []
+    print(f"\n与基线对比（基线版本 {baseline.get('meta', {}).get('git_commit')}）:")
+    for target, stats in current["targets"].items():
+        before = baseline.get("targets", {}).get(target)
+        if not before or not before.get("p95_ms"):
+            print(f"  {target}: 基线中无数据")
+            continue
+        change = (stats["p95_ms"] - before["p95_ms"]) / before["p95_ms"]
+        flag = ""
+        if change > threshold:
+            regressions.append(target)
+            flag = "  <-- 性能回退"
+        print(f"  {target}: p95 {before['p95_ms']}ms -> {stats['p95_ms']}ms ({change:+.1%}), "
+              f"QPS {before['qps']} -> {stats['qps']}{flag}")
+    return regressions
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="搜索性能基准测试")
+    parser.add_argument("--database-url", default=None, help="数据库地址（默认使用 DATABASE_URL）")
+    parser.add_argument("--engine", choices=["memory", "database"], default="memory",
+                        help="搜索引擎：memory 为内存倒排索引，database 为数据库全文索引")
+    parser.add_argument("--queries", type=int, default=2000, help="每个目标回放的查询数")
+    parser.add_argument("--warmup", type=int, default=100, help="预热查询数（不计入统计）")
+    parser.add_argument("--limit", type=int, default=20, help="search_knowledge 返回数量")
+    parser.add_argument("--batch-size", type=int, default=20, help="批量搜索每组的查询数（1~50）")
+    parser.add_argument("--seed", type=int, default=7, help="查询组合的随机种子")
+    parser.add_argument("--output", default="benchmark_results.json", help="结果JSON文件")
+    parser.add_argument("--compare", default=None, help="用于对比的上一次结果JSON文件")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="p95增长超过该比例判定为性能回退")
+    return parser.parse_args()
+
+
+async def run(args) -> Dict[str, Any]:
+    """执行基准测试"""
+    # 数据库引擎、全文检索后端和搜索引擎配置在导入时读取，必须先设置环境变量
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    os.environ["SEARCH_ENGINE"] = args.engine
+    # 关闭SQL回显，避免日志输出计入延迟
+    os.environ["DEBUG"] = "false"
+
+    from src.database import SessionLocal, init_db
+    from src.models import KnowledgeItem, KnowledgeDetail
+    from src.fulltext import fulltext_backend
+    from src.search_index import search_index
+    from src.suggest import suggester
+    from src.vector_index import vector_index
+    from src.fuzzy import fuzzy_corrector
+    from src.segmenter import segmenter
+    from src.routers import knowledge
+    from src.routers.search import search_knowledge, get_search_suggestions, run_search, run_batch
+    from src.schemas import BatchSearchRequest
+    from src.cache import cache_manager
+
+    init_db()
+    rss_before = current_rss_mb()
+
+    db = SessionLocal()
+    try:
+        corpus = {
+            "items": db.query(KnowledgeItem).count(),
+            "details": db.query(KnowledgeDetail).count(),
+        }
+        print(f"语料规模: {corpus['items']} 个知识项, {corpus['details']} 个详情")
+
+        index_build_ms = None
+        if args.engine == "memory":
+            print("正在构建内存索引...")
+            begin = time.perf_counter()
+            search_index.build(db)
+            index_build_ms = {"search_index": round((time.perf_counter() - begin) * 1000, 1)}
+            # 与服务启动时相同的监听器，逐个计时后再注册（效果等同于先注册再构建）
+            for listener in (suggester, vector_index, fuzzy_corrector, segmenter):
+                begin = time.perf_counter()
+                listener.on_rebuild(search_index)
+                index_build_ms[type(listener).__name__] = round((time.perf_counter() - begin) * 1000, 1)
+                search_index.add_listener(listener)
+            print(f"索引构建耗时(ms): {index_build_ms}")
+        rss_after_index = current_rss_mb()
+
+        rng = random.Random(args.seed)
+        queries = generate_queries(rng, args.queries)
+        prefixes = suggestion_prefixes(queries)
+        categories = [row[0] for row in db.query(KnowledgeItem.category_id).distinct().limit(50)]
+
+        async def call_search_knowledge(q):
+            search_knowledge(db, q, args.limit)
+
+        async def call_knowledge_search(q):
+            # 三分之一的请求带分类过滤
+            category_id = rng.choice(categories) if categories and rng.random() < 1 / 3 else None
+            await knowledge.search_knowledge(
+                q=q, category_id=category_id, status=None, cursor=None, limit=50, db=db
+            )
+
+        async def call_suggestions(q):
+            await get_search_suggestions(q=q, limit=10, db=db)
+
+        targets = {}
+        for name, call, workload in (
+            ("search_knowledge", call_search_knowledge, queries),
+            ("knowledge_search", call_knowledge_search, queries),
+            ("search_suggestions", call_suggestions, prefixes),
+        ):
+            print(f"正在测试 {name}...")
+            targets[name] = await replay(call, workload, args.warmup)
+            stats = targets[name]
+            print(f"  p50 {stats['p50_ms']}ms, p95 {stats['p95_ms']}ms, p99 {stats['p99_ms']}ms, "
+                  f"QPS {stats['qps']}, 错误 {stats['errors']}")
+
+        batch_speedup = None
+        if args.engine == "memory":
+            async def call_serial(group):
+                for q in group:
+                    await run_search(db, q, 10)
+
+            async def call_batch(group):
+                await asyncio.to_thread(run_batch, db, BatchSearchRequest(queries=[{"q": q} for q in group]))
+
+            print(f"正在对比批量搜索与逐条搜索（每组 {args.batch_size} 个查询）...")
+            # 关闭结果缓存，两种方式都完整执行检索
+            redis_client, cache_manager.redis_client = cache_manager.redis_client, None
+            try:
+                targets.update(await batch_versus_serial(
+                    call_serial, call_batch, queries, args.batch_size, args.warmup
+                ))
+            finally:
+                cache_manager.redis_client = redis_client
+            serial_stats, batch_stats = targets["search_serial"], targets["search_batch"]
+            if serial_stats["qps"]:
+                batch_speedup = round(batch_stats["qps"] / serial_stats["qps"], 2)
+            print(f"  逐条: 每组 p50 {serial_stats['p50_ms']}ms, {serial_stats['qps']} 组/秒; "
+                  f"批量: 每组 p50 {batch_stats['p50_ms']}ms, {batch_stats['qps']} 组/秒; 吞吐提升 {batch_speedup}x")
+    finally:
+        db.close()
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": args.database_url or os.environ.get("DATABASE_URL", "default"),
+            "fulltext_backend": fulltext_backend.name,
+            "engine": args.engine,
+            "queries": args.queries,
+            "warmup": args.warmup,
+            "seed": args.seed,
+            "query_mix": QUERY_MIX,
+        },
+        "corpus": corpus,
+        "index_build_ms": index_build_ms,
+        "batch": {"batch_size": args.batch_size, "speedup": batch_speedup},
+        "memory_mb": {
+            "rss_before_index": rss_before,
+            "rss_after_index": rss_after_index,
+            "rss_end": current_rss_mb(),
+            "peak_rss": peak_rss_mb(),
+        },
+        "targets": targets,
+    }
+
+
+def main():
+    """主函数"""
+    args = parse_args()
+    # 先读取基线，允许 --output 与 --compare 指向同一文件
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    result = asyncio.run(run(args))
+
+    print(f"内存: {result['memory_mb']}")
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {args.output}")
+
+    if baseline is not None:
+        regressions = compare(result, baseline, args.threshold)
+        if regressions:
+            print(f"检测到性能回退: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""
+搜索索引重建脚本
+重建数据库全文索引，并校验内存倒排索引能否从当前数据完整构建
+运行中服务的内存索引请通过 POST /api/v1/admin/search/index/rebuild 重建
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.database import init_db, SessionLocal
+from src.index_sync import rebuild_search_indexes
+
+
+def main():
+    """主函数"""
+    print("正在重建搜索索引...")
+    init_db()
+    
+    db = SessionLocal()
+    try:
+        result = rebuild_search_indexes(db)
+        print(f"全文检索后端: {result['fulltext_backend']}")
+        print(f"内存索引: {result['search_index']}")
+        print("搜索索引重建完成！")
+    except Exception as e:
+        print(f"搜索索引重建失败: {e}")
+        sys.exit(1)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+大模型调用准入控制模块
+全局并发上限 + 每用户令牌桶限流 + 有界等待队列：
+- 用户请求速率超过令牌桶时立即返回429，Retry-After为下一个令牌的到达时间
+- 并发已满时进入先进先出的等待队列；队列已满，或按当前服务耗时估算的等待时间超过排队期限时立即拒绝（快速失败）
+- 排队超过期限仍未获得名额的请求被拒绝
+准入状态只在当前工作进程内生效
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+from fastapi import HTTPException
+
+
+class TokenBucket:
+    """令牌桶"""
+
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, capacity: float, now: float):
+        self.tokens = capacity
+        self.updated = now
+
+    def take(self, rate: float, capacity: float, now: float) -> float:
+        """取一个令牌，成功返回0，否则返回还需等待的秒数"""
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / rate
+
+
+class AdmissionTicket:
+    """准入名额，release 可重复调用"""
+
+    def __init__(self, controller: "AdmissionController"):
+        self.controller = controller
+        self.started = time.monotonic()
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.controller._release(time.monotonic() - self.started)
+
+
+class AdmissionController:
+    """准入控制器"""
+
+    def __init__(
+        self,
+        max_concurrent: int,
+        max_queue: int,
+        queue_timeout: float,
+        user_rate: float,
+        user_burst: int,
+        max_users: int = 10000,
+        sample_size: int = 500
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        # 每用户每秒补充的令牌数和桶容量（突发上限），速率为0时不限流
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.max_users = max_users
+
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._buckets: Dict[str, TokenBucket] = {}
+        # 最近的排队耗时和服务耗时（秒）
+        self._wait_samples: Deque[float] = deque(maxlen=sample_size)
+        self._service_samples: Deque[float] = deque(maxlen=sample_size)
+
+        # 统计指标
+        self.admitted = 0
+        self.queued = 0
+        self.rate_limited = 0
+        self.rejected_full = 0
+        self.shed = 0
+        self.timed_out = 0
+        self.peak_queue = 0
+
+    # ---- 限流 ----
+
+    def _take_token(self, user_id: Optional[str], now: float) -> float:
+        if not user_id or self.user_rate <= 0:
+            return 0.0
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            if len(self._buckets) >= self.max_users:
+                self._prune(now)
+            bucket = self._buckets[user_id] = TokenBucket(self.user_burst, now)
+        return bucket.take(self.user_rate, self.user_burst, now)
+
+    def _prune(self, now: float):
+        """删除已补满的令牌桶（等价于新建），仍超出上限时删除最早创建的"""
+        refill = self.user_burst / self.user_rate
+        for user_id in [user_id for user_id, bucket in self._buckets.items() if now - bucket.updated >= refill]:
+            del self._buckets[user_id]
+        while len(self._buckets) >= self.max_users:
+            del self._buckets[next(iter(self._buckets))]
+
+    # ---- 排队 ----
+
+    def _service_time(self) -> float:
+        """平均服务耗时，暂无样本时按排队期限的一半估计"""
+        if not self._service_samples:
+            return self.queue_timeout / 2
+        return sum(self._service_samples) / len(self._service_samples)
+
+    def estimate_wait(self, position: Optional[int] = None) -> float:
+        """估算排在第 position 位（默认队尾）的请求需要等待的秒数"""
+        position = len(self._waiters) if position is None else position
+        return (position + 1) * self._service_time() / self.max_concurrent
+
+    def _reject(self, retry_after: float, detail: str) -> HTTPException:
+        return HTTPException(
+            status_code=429,
+            detail=detail,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+
+    async def acquire(self, user_id: Optional[str] = None) -> AdmissionTicket:
+        """获取调用名额，无法在期限内获得时抛出429"""
+        now = time.monotonic()
+        wait = self._take_token(user_id, now)
+        if wait > 0:
+            self.rate_limited += 1
+            raise self._reject(wait, "请求过于频繁，请稍后再试")
+
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            self._admit(0.0)
+            return AdmissionTicket(self)
+
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_full += 1
+            raise self._reject(self.estimate_wait(), "AI服务繁忙，请稍后再试")
+        estimated = self.estimate_wait()
+        if estimated > self.queue_timeout:
+            # 预计排到时已超过期限，与其排队超时不如立即拒绝
+            self.shed += 1
+            raise self._reject(estimated, "AI服务繁忙，请稍后再试")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        self.peak_queue = max(self.peak_queue, len(self._waiters))
+        try:
+            await asyncio.wait({waiter}, timeout=self.queue_timeout)
+        except BaseException:
+            # 客户端断开时取消排队；名额已转交给自己时归还
+            self._abandon(waiter)
+            raise
+        if not waiter.done():
+            self._abandon(waiter)
+            self.timed_out += 1
+            raise self._reject(self.estimate_wait(), "AI服务繁忙，请稍后再试")
+
+        self._admit(time.monotonic() - now)
+        return AdmissionTicket(self)
+
+    def _admit(self, waited: float):
+        self.admitted += 1
+        self._wait_samples.append(waited)
+
+    def _abandon(self, waiter: asyncio.Future):
+        if waiter.done() and not waiter.cancelled():
+            self._release(None)
+            return
+        waiter.cancel()
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def _release(self, service_time: Optional[float]):
+        """归还名额：直接转交给队首仍在等待的请求"""
+        if service_time is not None:
+            self._service_samples.append(service_time)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self, user_id: Optional[str] = None) -> AsyncIterator[AdmissionTicket]:
+        """在名额内执行一次调用"""
+        ticket = await self.acquire(user_id)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """准入统计信息"""
+        waits = sorted(self._wait_samples)
+        return {
+            "active": self.active,
+            "max_concurrent": self.max_concurrent,
+            "queue_depth": len(self._waiters),
+            "max_queue": self.max_queue,
+            "peak_queue": self.peak_queue,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rate_limited": self.rate_limited,
+            "rejected_full": self.rejected_full,
+            "shed": self.shed,
+            "timed_out": self.timed_out,
+            "avg_wait_ms": round(sum(waits) / len(waits) * 1000, 2) if waits else 0.0,
+            "p95_wait_ms": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 2) if waits else 0.0,
+            "avg_service_ms": round(self._service_time() * 1000, 2) if self._service_samples else 0.0,
+            "tracked_users": len(self._buckets),
+        }
@@ -1,12 +1,62 @@
 """
 AI服务模块 - QWEN大模型集成
 """
+import asyncio
 import hashlib
+import importlib.util
 import json
+import logging
 import time
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
 import httpx
+from src.admission import AdmissionController
 from src.config import QWEN_CONFIG
+from src.resilience import CircuitBreaker, CircuitOpenError, DeadlineExceededError, ResilientCaller
+from src.segmenter import segmenter
+from src.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+# 文本生成接口路径（相对 base_url）
+GENERATION_PATH = "/services/aigc/text-generation/generation"
+
+# 熔断时返回的错误信息
+CIRCUIT_OPEN_ERROR = "上游服务暂不可用（熔断中）"
+
+# 超过总期限时返回的错误信息
+DEADLINE_ERROR = "上游服务响应超时"
+
+
+def request_fingerprint(request_data: Dict[str, Any]) -> str:
+    """请求指纹：模型参数和完整消息列表相同的请求视为同一请求"""
+    payload = json.dumps(request_data, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def parse_stream_line(line: str) -> Optional[Dict[str, Any]]:
+    """解析SSE响应中的一行，非数据行或无法解析时返回None"""
+    if not line.startswith("data:"):
+        return None
+    payload = line[5:].strip()
+    if not payload or payload == "[DONE]":
+        return None
+    try:
+        return json.loads(payload)
+    except ValueError:
+        return None
+
+
+def stream_chunk_text(chunk: Dict[str, Any]) -> str:
+    """取出一帧中新生成的文本（兼容 text 与 choices 两种输出格式）"""
+    output = chunk.get("output") or {}
+    if output.get("text"):
+        return output["text"]
+    choices = output.get("choices") or chunk.get("choices") or []
+    if choices:
+        message = choices[0].get("message") or choices[0].get("delta") or {}
+        return message.get("content") or ""
+    return ""
 
 
 class QWENService:
@@ -19,24 +69,145 @@ class QWENService:
         self.max_tokens = QWEN_CONFIG["max_tokens"]
         self.temperature = QWEN_CONFIG["temperature"]
         self.top_p = QWEN_CONFIG["top_p"]
+        self.http_config = QWEN_CONFIG["http"]
+        self._client: Optional[httpx.AsyncClient] = None
+        # 相同请求合并
+        flight_config = QWEN_CONFIG["singleflight"]
+        self.singleflight_enabled = flight_config["enabled"]
+        self.flights = SingleFlight(
+            "qwen",
+            lock_ttl=flight_config["lock_ttl"],
+            result_ttl=flight_config["result_ttl"],
+            poll_interval=flight_config["poll_interval"]
+        )
+        # 准入控制（并发上限、排队和每用户限流）
+        admission_config = QWEN_CONFIG["admission"]
+        self.admission = AdmissionController(
+            max_concurrent=admission_config["max_concurrent"],
+            max_queue=admission_config["max_queue"],
+            queue_timeout=admission_config["queue_timeout"],
+            user_rate=admission_config["user_rate"],
+            user_burst=admission_config["user_burst"]
+        )
+        # 上游重试、对冲和熔断
+        resilience_config = QWEN_CONFIG["resilience"]
+        self.retry_status = set(resilience_config["retry_status"])
+        self.resilience = ResilientCaller(
+            CircuitBreaker(**resilience_config["breaker"]),
+            max_attempts=resilience_config["max_attempts"],
+            base_delay=resilience_config["base_delay"],
+            max_delay=resilience_config["max_delay"],
+            deadline=resilience_config["deadline"],
+            hedge=resilience_config["hedge"]["enabled"],
+            hedge_quantile=resilience_config["hedge"]["quantile"],
+            hedge_min_delay=resilience_config["hedge"]["min_delay"],
+            hedge_min_samples=resilience_config["hedge"]["min_samples"]
+        )
+        # 请求计数（用于评估连接池大小）
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
     
-    async def chat_completion(
-        self, 
-        messages: List[Dict[str, str]], 
-        context: Optional[str] = None
+    def _create_client(self) -> httpx.AsyncClient:
+        """创建带连接池的共享HTTP客户端"""
+        config = self.http_config
+        http2 = config["http2"]
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("未安装h2，QWEN客户端回退到HTTP/1.1")
+            http2 = False
+        return httpx.AsyncClient(
+            base_url=self.base_url,
+            limits=httpx.Limits(
+                max_connections=config["max_connections"],
+                max_keepalive_connections=config["max_keepalive_connections"],
+                keepalive_expiry=config["keepalive_expiry"]
+            ),
+            timeout=httpx.Timeout(**config["timeout"]),
+            http2=http2
+        )
+    
+    async def start(self):
+        """创建共享HTTP客户端（应用启动时调用）"""
+        if self._client is None or self._client.is_closed:
+            self._client = self._create_client()
+    
+    async def close(self):
+        """关闭共享HTTP客户端及其连接（应用关闭时调用）"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """共享HTTP客户端（未启动时按需创建，便于脚本和测试直接调用）"""
+        if self._client is None or self._client.is_closed:
+            self._client = self._create_client()
+        return self._client
+    
+    def _begin_request(self):
+        """记录请求开始"""
+        self.requests += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+    
+    def _end_request(self, success: bool):
+        """记录请求结束"""
+        self.in_flight -= 1
+        if not success:
+            self.errors += 1
+    
+    def stats(self) -> Dict[str, Any]:
+        """连接池统计信息"""
+        result = {
+            "client_started": self._client is not None and not self._client.is_closed,
+            "http2": self.http_config["http2"],
+            "limits": {
+                "max_connections": self.http_config["max_connections"],
+                "max_keepalive_connections": self.http_config["max_keepalive_connections"],
+                "keepalive_expiry": self.http_config["keepalive_expiry"],
+            },
+            "timeout": self.http_config["timeout"],
+            "requests": self.requests,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+        }
+        # httpcore未公开连接池统计接口，尽力读取内部状态
+        pool = getattr(getattr(self._client, "_transport", None), "_pool", None)
+        if pool is not None:
+            connections = list(getattr(pool, "connections", []))
+            idle = sum(1 for conn in connections if conn.is_idle())
+            result["connections"] = {
+                "total": len(connections),
+                "idle": idle,
+                "active": len(connections) - idle,
+                # 尚未分配到连接、正在等待连接池的请求
+                "queued_requests": sum(
+                    1 for pending in getattr(pool, "_requests", [])
+                    if getattr(pending, "connection", None) is None
+                ),
+            }
+        return result
+    
+    def _build_request(
+        self,
+        messages: List[Dict[str, str]],
+        context: Optional[str] = None,
+        stream: bool = False
     ) -> Dict[str, Any]:
-        """聊天完成"""
-        start_time = time.time()
-        
-        # 构建请求数据
+        """构建请求数据"""
         request_data = {
             "model": self.model_name,
-            "messages": messages,
+            "messages": list(messages),
             "max_tokens": self.max_tokens,
             "temperature": self.temperature,
             "top_p": self.top_p,
-            "stream": False
+            "stream": stream
         }
+        if stream:
+            # 增量输出：每帧只返回新生成的文本
+            request_data["incremental_output"] = True
         
         # 添加上下文信息
         if context:
@@ -45,52 +216,245 @@ class QWENService:
                 "content": f"你是ISP知识库系统的AI助手。请基于以下上下文回答问题：\n{context}"
             }
             request_data["messages"].insert(0, system_message)
-        
+        return request_data
+    
+    def _headers(self, stream: bool = False) -> Dict[str, str]:
+        """请求头"""
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
+        if stream:
+            headers["X-DashScope-SSE"] = "enable"
+            headers["Accept"] = "text/event-stream"
+        return headers
+    
+    async def chat_completion(
+        self, 
+        messages: List[Dict[str, str]], 
+        context: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """聊天完成（相同请求并发时合并为一次上游调用，上游失败时按弹性策略重试）"""
+        # 构建请求数据
+        request_data = self._build_request(messages, context)
+        if not self.singleflight_enabled:
+            return await self._resilient_completion(request_data)
+        return await self.flights.do(
+            request_fingerprint(request_data),
+            lambda: self._resilient_completion(request_data),
+            publish=lambda result: result.get("success", False)
+        )
+    
+    async def _resilient_completion(self, request_data: Dict[str, Any]) -> Dict[str, Any]:
+        """带重试、对冲和熔断的非流式请求"""
+        start_time = time.time()
+        try:
+            return await self.resilience.call(
+                lambda: self._post_completion(request_data),
+                is_success=lambda result: result["success"],
+                is_retriable=lambda result: result.get("retriable", False)
+            )
+        except CircuitOpenError as e:
+            return {
+                "success": False,
+                "error": CIRCUIT_OPEN_ERROR,
+                "retry_after": e.retry_after,
+                "response_time_ms": 0
+            }
+        except DeadlineExceededError:
+            return {
+                "success": False,
+                "error": DEADLINE_ERROR,
+                "response_time_ms": int((time.time() - start_time) * 1000)
+            }
+    
+    async def _post_completion(self, request_data: Dict[str, Any]) -> Dict[str, Any]:
+        """向上游发起一次非流式请求"""
+        start_time = time.time()
+        headers = self._headers()
         
+        self._begin_request()
+        success = False
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.base_url}/services/aigc/text-generation/generation",
-                    headers=headers,
-                    json=request_data,
-                    timeout=30.0
-                )
+            response = await self.client.post(
+                GENERATION_PATH,
+                headers=headers,
+                json=request_data
+            )
+            
+            if response.status_code == 200:
+                result = response.json()
+                response_time = int((time.time() - start_time) * 1000)
+                success = True
                 
-                if response.status_code == 200:
-                    result = response.json()
-                    response_time = int((time.time() - start_time) * 1000)
-                    
-                    return {
-                        "success": True,
-                        "response": result.get("output", {}).get("text", ""),
-                        "response_time_ms": response_time,
-                        "usage": result.get("usage", {})
-                    }
-                else:
-                    return {
-                        "success": False,
+                return {
+                    "success": True,
+                    "response": result.get("output", {}).get("text", ""),
+                    "response_time_ms": response_time,
+                    "usage": result.get("usage", {})
+                }
+            else:
+                return {
+                    "success": False,
+                    "error": f"API请求失败: {response.status_code}",
+                    "retriable": response.status_code in self.retry_status,
+                    "response_time_ms": int((time.time() - start_time) * 1000)
+                }
+                
+        except Exception as e:
+            return {
+                "success": False,
+                "error": f"请求异常: {str(e)}",
+                # 超时、连接失败等网络错误可重试
+                "retriable": isinstance(e, httpx.TransportError),
+                "response_time_ms": int((time.time() - start_time) * 1000)
+            }
+        finally:
+            self._end_request(success)
+    
+    def chat_completion_stream(
+        self,
+        messages: List[Dict[str, str]],
+        context: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        流式聊天完成（DashScope SSE增量输出）
+        依次产出 {"type": "delta", "text": ...}，最后产出一个 done 或 error 事件；
+        相同请求并发时共享同一个上游事件流，所有调用方都停止迭代（如客户端断开）时关闭上游连接
+        """
+        request_data = self._build_request(messages, context, stream=True)
+        if not self.singleflight_enabled:
+            return self._resilient_stream(request_data)
+        return self.flights.stream(
+            request_fingerprint(request_data),
+            lambda: self._resilient_stream(request_data),
+            publish=lambda event: event if event["type"] == "done" else None,
+            replay=lambda done: [{"type": "delta", "text": done["response"]}, done]
+        )
+    
+    async def _resilient_stream(self, request_data: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        带重试和熔断的流式请求：只在尚未产出任何文本时重试，已推送的文本无法撤回；
+        流式请求不做对冲（会让生成的token翻倍）
+        """
+        resilience = self.resilience
+        breaker = resilience.breaker
+        resilience.count("calls")
+        start = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                breaker.before_call()
+            except CircuitOpenError as e:
+                yield {
+                    "type": "error",
+                    "error": CIRCUIT_OPEN_ERROR,
+                    "retry_after": e.retry_after,
+                    "response_time_ms": int((time.monotonic() - start) * 1000)
+                }
+                return
+            
+            if attempt:
+                resilience.count("retries")
+            resilience.count("attempts")
+            attempt += 1
+            failure = None
+            emitted = False
+            finished = False
+            source = self._stream_completion(request_data)
+            try:
+                async for event in source:
+                    if event["type"] == "error":
+                        breaker.record(event.get("retriable", False))
+                        finished = True
+                        if not emitted:
+                            failure = event
+                            break
+                    elif event["type"] == "done":
+                        breaker.record(False)
+                        finished = True
+                    else:
+                        emitted = True
+                    yield event
+            finally:
+                if not finished:
+                    breaker.abort()
+                await source.aclose()
+            
+            if failure is None:
+                return
+            delay = resilience.backoff(attempt - 1)
+            if (not failure.get("retriable") or attempt >= resilience.max_attempts
+                    or time.monotonic() - start + delay >= resilience.deadline):
+                yield failure
+                return
+            await asyncio.sleep(delay)
+    
+    async def _stream_completion(self, request_data: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """向上游发起一次流式请求"""
+        start_time = time.time()
+        first_token_ms = None
+        parts: List[str] = []
+        usage: Dict[str, Any] = {}
+        
+        self._begin_request()
+        success = False
+        try:
+            async with self.client.stream(
+                "POST",
+                GENERATION_PATH,
+                headers=self._headers(stream=True),
+                json=request_data
+            ) as response:
+                if response.status_code != 200:
+                    yield {
+                        "type": "error",
                         "error": f"API请求失败: {response.status_code}",
+                        "retriable": response.status_code in self.retry_status,
                         "response_time_ms": int((time.time() - start_time) * 1000)
                     }
-                    
+                    return
+                
+                async for line in response.aiter_lines():
+                    chunk = parse_stream_line(line)
+                    if chunk is None:
+                        continue
+                    if chunk.get("usage"):
+                        usage = chunk["usage"]
+                    text = stream_chunk_text(chunk)
+                    if text:
+                        if first_token_ms is None:
+                            first_token_ms = int((time.time() - start_time) * 1000)
+                        parts.append(text)
+                        yield {"type": "delta", "text": text}
+            success = True
         except Exception as e:
-            return {
-                "success": False,
+            yield {
+                "type": "error",
                 "error": f"请求异常: {str(e)}",
+                "retriable": isinstance(e, httpx.TransportError),
                 "response_time_ms": int((time.time() - start_time) * 1000)
             }
+            return
+        finally:
+            self._end_request(success)
+        
+        yield {
+            "type": "done",
+            "response": "".join(parts),
+            "response_time_ms": int((time.time() - start_time) * 1000),
+            "first_token_ms": first_token_ms,
+            "usage": usage
+        }
     
-    async def generate_answer(
-        self, 
-        question: str, 
+    def _answer_messages(
+        self,
+        question: str,
         knowledge_context: Optional[str] = None,
-        chat_history: Optional[List[Dict[str, str]]] = None
-    ) -> Dict[str, Any]:
-        """生成答案"""
+        chat_history: Optional[List[Dict[str, str]]] = None,
+        summary: Optional[str] = None
+    ) -> Tuple[List[Dict[str, str]], str]:
+        """构建问答的消息列表和上下文（知识上下文和更早对话的摘要）"""
         messages = []
         
         # 添加聊天历史
@@ -103,13 +467,37 @@ class QWENService:
             "content": question
         })
         
-        # 构建知识上下文
-        context = ""
+        # 构建上下文
+        parts = []
+        if summary:
+            parts.append(f"更早的对话摘要：\n{summary}")
         if knowledge_context:
-            context = f"相关知识：\n{knowledge_context}\n\n请基于以上知识回答用户问题。"
+            parts.append(f"相关知识：\n{knowledge_context}\n\n请基于以上知识回答用户问题。")
         
+        return messages, "\n\n".join(parts)
+    
+    async def generate_answer(
+        self, 
+        question: str, 
+        knowledge_context: Optional[str] = None,
+        chat_history: Optional[List[Dict[str, str]]] = None,
+        summary: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """生成答案"""
+        messages, context = self._answer_messages(question, knowledge_context, chat_history, summary)
         return await self.chat_completion(messages, context)
     
+    def generate_answer_stream(
+        self,
+        question: str,
+        knowledge_context: Optional[str] = None,
+        chat_history: Optional[List[Dict[str, str]]] = None,
+        summary: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """流式生成答案"""
+        messages, context = self._answer_messages(question, knowledge_context, chat_history, summary)
+        return self.chat_completion_stream(messages, context)
+    
     async def search_enhancement(
         self, 
         query: str, 
@@ -136,13 +524,8 @@ class QWENService:
         return await self.chat_completion(messages, context)
     
     def extract_keywords(self, text: str) -> List[str]:
-        """提取关键词"""
-        # 简单的关键词提取逻辑
-        # 在实际项目中可以使用更复杂的NLP技术
-        stop_words = {"的", "是", "在", "有", "和", "与", "或", "但", "而", "如果", "因为", "所以"}
-        words = text.split()
-        keywords = [word for word in words if word not in stop_words and len(word) > 1]
-        return keywords[:10]  # 返回前10个关键词
+        """提取关键词（词典分词后去掉停用词）"""
+        return segmenter.extract_keywords(text, limit=10)
     
     def calculate_similarity(self, text1: str, text2: str) -> float:
         """计算文本相似度（简单实现）"""
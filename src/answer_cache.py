@@ -0,0 +1,142 @@
+"""
+问答缓存模块
+相同的首轮问题在知识上下文和模型参数不变时直接返回缓存的回答，避免重复调用大模型
+缓存键由规范化问题、知识上下文指纹和模型参数组成；同时维护 知识项 -> 回答 的反向索引，
+被引用的知识项变更时删除相关回答
+"""
+import hashlib
+import json
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set
+from src.cache import cache_manager
+from src.config import CACHE_KEYS, CACHE_TTL, QWEN_CONFIG
+from src.index_sync import ChangeSet
+from src.search_index import TOKEN_PATTERN, normalize_text
+
+logger = logging.getLogger(__name__)
+
+# 参与缓存键的模型参数
+MODEL_PARAMS = ("model_name", "max_tokens", "temperature", "top_p")
+
+
+def normalize_question(question: str) -> str:
+    """规范化问题：统一全半角和大小写，忽略标点和多余空白"""
+    return " ".join(TOKEN_PATTERN.findall(normalize_text(question)))
+
+
+def fingerprint(text: str) -> str:
+    """文本指纹"""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """问答缓存（存储在Redis中，未配置Redis时不生效）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.invalidated = 0
+        # 命中时节省的大模型耗时
+        self.saved_ms = 0
+
+    def make_key(self, question: str, knowledge_context: str) -> str:
+        """生成缓存键"""
+        payload = json.dumps({
+            "question": normalize_question(question),
+            "context": fingerprint(knowledge_context or ""),
+            "model": {name: QWEN_CONFIG[name] for name in MODEL_PARAMS},
+        }, sort_keys=True, ensure_ascii=False)
+        return cache_manager._generate_key(CACHE_KEYS["chat_answer"], key_hash=fingerprint(payload))
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """查询缓存的回答"""
+        if cache_manager.redis_client is None:
+            return None
+        cached = cache_manager.get(key)
+        with self._lock:
+            if cached is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.saved_ms += cached.get("response_time_ms") or 0
+        return cached
+
+    def set(self, key: str, answer: str, response_time_ms: int, item_ids: Iterable[str]):
+        """缓存回答，并登记到所引用知识项的反向索引"""
+        item_ids = list(item_ids)
+        if not cache_manager.set(key, {
+            "response": answer,
+            "response_time_ms": response_time_ms,
+            "item_ids": item_ids,
+        }, CACHE_TTL["answer"]):
+            return
+
+        client = cache_manager.redis_client
+        try:
+            pipe = client.pipeline()
+            for item_id in item_ids:
+                items_key = cache_manager._generate_key(CACHE_KEYS["chat_answer_items"], item_id=item_id)
+                pipe.sadd(items_key, key)
+                pipe.expire(items_key, CACHE_TTL["answer"])
+            pipe.execute()
+        except Exception as e:
+            # 反向索引写入失败时删除回答，避免知识项变更后返回过期内容
+            logger.warning(f"问答缓存反向索引写入失败: {e}")
+            cache_manager.delete(key)
+            return
+
+        with self._lock:
+            self.stores += 1
+
+    def invalidate_items(self, item_ids: Iterable[str]) -> int:
+        """删除引用了这些知识项的回答，返回删除数量"""
+        client = cache_manager.redis_client
+        if client is None:
+            return 0
+
+        try:
+            answer_keys: Set[bytes] = set()
+            items_keys: List[str] = []
+            for item_id in item_ids:
+                items_key = cache_manager._generate_key(CACHE_KEYS["chat_answer_items"], item_id=item_id)
+                items_keys.append(items_key)
+                answer_keys.update(client.smembers(items_key))
+            if items_keys:
+                client.delete(*items_keys, *answer_keys)
+        except Exception as e:
+            logger.warning(f"问答缓存失效失败: {e}")
+            return 0
+
+        with self._lock:
+            self.invalidated += len(answer_keys)
+        return len(answer_keys)
+
+    def on_commit(self, changes: ChangeSet):
+        """
+        知识项或其详情变更的事务提交后删除引用它们的回答
+        挂在提交事件上而不是搜索索引上，使用数据库全文检索时同样生效
+        """
+        changed = changes.item_ids()
+        if changed:
+            self.invalidate_items(changed)
+
+    def stats(self) -> Dict[str, Any]:
+        """命中率统计（当前进程）"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": cache_manager.redis_client is not None,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "stores": self.stores,
+                "invalidated": self.invalidated,
+                "saved_ms": self.saved_ms,
+            }
+
+
+# 全局问答缓存实例
+answer_cache = AnswerCache()
@@ -184,6 +184,12 @@ def set_cached_chat_session(session_id: str, data: Dict[str, Any]):
     return cache_manager.set(key, data, CACHE_TTL["chat"])
 
 
+def delete_cached_chat_session(session_id: str):
+    """删除缓存的聊天会话"""
+    key = cache_manager._generate_key(CACHE_KEYS["chat_session"], session_id=session_id)
+    return cache_manager.delete(key)
+
+
 def clear_knowledge_cache():
     """清除知识库缓存"""
     cache_manager.clear_pattern("knowledge:*")
@@ -0,0 +1,95 @@
+"""
+聊天记录落库
+一问一答两条记录放入内存队列后立即返回，由后台任务批量多行插入；
+队列已满时拒绝入队，改为在请求中直接写入，聊天记录不会被丢弃
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from src.config import settings
+from src.models import ChatHistory, generate_uuid
+from src.write_behind import WriteBehindQueue
+
+logger = logging.getLogger(__name__)
+
+
+class ChatLogger:
+    """聊天记录写入器"""
+
+    def __init__(self):
+        self.queue = WriteBehindQueue(
+            "chat_history",
+            ChatHistory,
+            batch_size=settings.chat_log_batch_size,
+            flush_interval=settings.chat_log_flush_interval,
+            max_size=settings.chat_log_max_buffer,
+            drop_oldest=False
+        )
+
+    def record_exchange(
+        self,
+        db: Session,
+        user_id: str,
+        session_id: str,
+        question: str,
+        answer: str,
+        response_time_ms: int
+    ) -> List[Dict[str, Any]]:
+        """记录一问一答，返回写入的记录"""
+        # 主键和时间在入队时生成：提问时间取回答完成时间减去耗时，保证问题排在回答之前
+        answered_at = datetime.now(timezone.utc)
+        records = [
+            {
+                "id": generate_uuid(),
+                "user_id": user_id,
+                "session_id": session_id,
+                "message_type": "user",
+                "content": question,
+                "response_time_ms": None,
+                "created_at": answered_at - timedelta(milliseconds=response_time_ms or 0),
+            },
+            {
+                "id": generate_uuid(),
+                "user_id": user_id,
+                "session_id": session_id,
+                "message_type": "assistant",
+                "content": answer,
+                "response_time_ms": response_time_ms,
+                "created_at": answered_at,
+            },
+        ]
+
+        if not self.queue.put_many(records):
+            logger.warning("聊天记录队列已满，直接写入数据库")
+            db.execute(insert(ChatHistory), records)
+            db.commit()
+        return records
+
+    def pending(self, session_id: str, user_id: str) -> List[Dict[str, Any]]:
+        """会话中尚未落库的记录"""
+        return self.queue.pending(
+            lambda record: record["session_id"] == session_id and record["user_id"] == user_id
+        )
+
+    async def flush(self):
+        """立即刷写队列（删除会话前调用，避免删除后再写入）"""
+        await asyncio.to_thread(self.queue.flush)
+
+    async def start(self):
+        """启动批量落库任务"""
+        await self.queue.start()
+
+    async def stop(self):
+        """停止任务并刷写剩余记录"""
+        await self.queue.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        """队列统计信息"""
+        return self.queue.stats()
+
+
+# 全局聊天记录实例
+chat_logger = ChatLogger()
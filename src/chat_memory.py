@@ -0,0 +1,170 @@
+"""
+会话记忆模块
+每个会话在Redis会话键中保存最近若干条消息和一段滚动摘要：
+消息条数或token数超出窗口时，最早的消息被压缩成摘要行（问题原文、回答首句），摘要本身也有token上限；
+只有缓存未命中（过期、未配置Redis）时才从数据库读取最近的消息重建
+"""
+import threading
+from typing import Any, Dict, List, Optional
+from sqlalchemy.orm import Session
+from src.cache import delete_cached_chat_session, get_cached_chat_session, set_cached_chat_session
+from src.chat_log import chat_logger
+from src.config import CHAT_MEMORY_CONFIG
+from src.models import ChatHistory
+from src.rag import SENTENCE_END, estimate_tokens
+
+
+def _clip(text: str, max_chars: int) -> str:
+    """压缩空白并截断到 max_chars"""
+    text = " ".join((text or "").split())
+    return text if len(text) <= max_chars else text[:max_chars - 1] + "…"
+
+
+def summarize_message(message: Dict[str, str]) -> str:
+    """把一条消息压缩成一行摘要：问题保留原文，回答保留首句"""
+    max_chars = CHAT_MEMORY_CONFIG["summary_line_chars"]
+    if message["role"] == "user":
+        return f"问：{_clip(message['content'], max_chars)}"
+    first = next((s for s in SENTENCE_END.split((message["content"] or "").strip()) if s.strip()), "")
+    return f"答：{_clip(first, max_chars)}"
+
+
+class SessionMemory:
+    """单个会话的记忆：滚动摘要 + 最近消息窗口"""
+
+    def __init__(
+        self,
+        user_id: str,
+        summary: Optional[List[str]] = None,
+        messages: Optional[List[Dict[str, str]]] = None
+    ):
+        self.user_id = user_id
+        self.summary = list(summary or [])
+        self.messages = list(messages or [])
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SessionMemory":
+        return cls(data["user_id"], data.get("summary"), data.get("messages"))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "user_id": self.user_id,
+            "summary": self.summary,
+            "messages": self.messages,
+        }
+
+    def add(self, role: str, content: str):
+        self.messages.append({"role": role, "content": content})
+
+    @property
+    def empty(self) -> bool:
+        """是否没有任何历史（首轮对话）"""
+        return not self.messages and not self.summary
+
+    def tokens(self) -> int:
+        """消息窗口的估算token数"""
+        return sum(estimate_tokens(message["content"]) for message in self.messages)
+
+    def trim(self) -> int:
+        """把超出窗口的最早消息压缩进摘要，返回压缩的消息数"""
+        max_messages = CHAT_MEMORY_CONFIG["max_messages"]
+        token_budget = CHAT_MEMORY_CONFIG["token_budget"]
+        folded = 0
+        while self.messages and (
+            len(self.messages) > max_messages
+            or self.tokens() > token_budget
+            # 窗口总是从用户消息开始
+            or self.messages[0]["role"] != "user"
+        ):
+            self.summary.append(summarize_message(self.messages.pop(0)))
+            folded += 1
+
+        # 摘要超出上限时丢弃最早的摘要行
+        summary_tokens = CHAT_MEMORY_CONFIG["summary_tokens"]
+        while self.summary and sum(estimate_tokens(line) for line in self.summary) > summary_tokens:
+            self.summary.pop(0)
+        return folded
+
+    def history(self) -> List[Dict[str, str]]:
+        """发送给大模型的历史消息"""
+        return [dict(message) for message in self.messages]
+
+    def summary_text(self) -> str:
+        """更早对话的摘要"""
+        return "\n".join(self.summary)
+
+
+class ChatMemory:
+    """会话记忆存取"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # 压缩进摘要的消息数
+        self.folded = 0
+
+    def _trim(self, memory: SessionMemory):
+        folded = memory.trim()
+        if folded:
+            with self._lock:
+                self.folded += folded
+
+    def load(self, db: Session, session_id: str, user_id: str) -> SessionMemory:
+        """读取会话记忆，缓存未命中时从数据库最近的消息重建"""
+        cached = get_cached_chat_session(session_id)
+        if cached and cached.get("user_id") == user_id and "messages" in cached:
+            with self._lock:
+                self.hits += 1
+            return SessionMemory.from_dict(cached)
+
+        with self._lock:
+            self.misses += 1
+        limit = CHAT_MEMORY_CONFIG["rebuild_messages"]
+        # 先读写入队列中尚未落库的记录再查库，合并后按主键去重
+        pending = chat_logger.pending(session_id, user_id)
+        # 同一时刻写入的一问一答按消息类型排序，保证问题在回答之前
+        rows = db.query(ChatHistory).filter(
+            ChatHistory.session_id == session_id,
+            ChatHistory.user_id == user_id
+        ).order_by(
+            ChatHistory.created_at.desc(), ChatHistory.message_type
+        ).limit(limit).all()
+
+        stored = {row.id for row in rows}
+        records = [(row.message_type, row.content) for row in reversed(rows)]
+        records.extend(
+            (record["message_type"], record["content"]) for record in pending if record["id"] not in stored
+        )
+
+        memory = SessionMemory(user_id)
+        for message_type, content in records[-limit:]:
+            memory.add("user" if message_type == "user" else "assistant", content)
+        self._trim(memory)
+        return memory
+
+    def append(self, session_id: str, memory: SessionMemory, question: str, answer: str):
+        """追加一问一答并写回缓存"""
+        memory.add("user", question)
+        memory.add("assistant", answer)
+        self._trim(memory)
+        set_cached_chat_session(session_id, memory.to_dict())
+
+    def clear(self, session_id: str):
+        """删除会话记忆"""
+        delete_cached_chat_session(session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """命中率统计（当前进程）"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "folded_messages": self.folded,
+            }
+
+
+# 全局会话记忆实例
+chat_memory = ChatMemory()
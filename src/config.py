@@ -17,6 +17,27 @@ class Settings(BaseSettings):
     qwen_api_key: str = Field(..., env="QWEN_API_KEY")
     qwen_base_url: str = Field(default="https://dashscope.aliyuncs.com/api/v1", env="QWEN_BASE_URL")
     
+    # QWEN HTTP连接池配置
+    qwen_max_connections: int = Field(default=20, env="QWEN_MAX_CONNECTIONS")
+    qwen_max_keepalive_connections: int = Field(default=10, env="QWEN_MAX_KEEPALIVE_CONNECTIONS")
+    qwen_keepalive_expiry: float = Field(default=30.0, env="QWEN_KEEPALIVE_EXPIRY")
+    qwen_http2: bool = Field(default=False, env="QWEN_HTTP2")  # 需要安装 h2
+    qwen_connect_timeout: float = Field(default=5.0, env="QWEN_CONNECT_TIMEOUT")
+    qwen_read_timeout: float = Field(default=60.0, env="QWEN_READ_TIMEOUT")
+    qwen_write_timeout: float = Field(default=10.0, env="QWEN_WRITE_TIMEOUT")
+    qwen_pool_timeout: float = Field(default=5.0, env="QWEN_POOL_TIMEOUT")
+    qwen_singleflight: bool = Field(default=True, env="QWEN_SINGLEFLIGHT")
+    qwen_max_concurrent: int = Field(default=8, env="QWEN_MAX_CONCURRENT")
+    qwen_queue_size: int = Field(default=32, env="QWEN_QUEUE_SIZE")
+    qwen_queue_timeout: float = Field(default=10.0, env="QWEN_QUEUE_TIMEOUT")
+    chat_user_rate_per_minute: float = Field(default=20, env="CHAT_USER_RATE_PER_MINUTE")  # 0 表示不限流
+    chat_user_burst: int = Field(default=5, env="CHAT_USER_BURST")
+    qwen_max_attempts: int = Field(default=3, env="QWEN_MAX_ATTEMPTS")
+    qwen_retry_deadline: float = Field(default=30.0, env="QWEN_RETRY_DEADLINE")
+    qwen_hedge: bool = Field(default=False, env="QWEN_HEDGE")
+    qwen_breaker_error_rate: float = Field(default=0.5, env="QWEN_BREAKER_ERROR_RATE")
+    qwen_breaker_open_seconds: float = Field(default=30.0, env="QWEN_BREAKER_OPEN_SECONDS")
+    
     # JWT配置
     secret_key: str = Field(..., env="SECRET_KEY")
     algorithm: str = Field(default="HS256", env="ALGORITHM")
@@ -25,6 +46,25 @@ class Settings(BaseSettings):
     # Redis配置
     redis_url: Optional[str] = Field(default=None, env="REDIS_URL")
     
+    # 搜索配置
+    search_engine: str = Field(default="memory", env="SEARCH_ENGINE")  # 'memory' | 'database'
+    search_log_batch_size: int = Field(default=200, env="SEARCH_LOG_BATCH_SIZE")
+    search_log_flush_interval: float = Field(default=5.0, env="SEARCH_LOG_FLUSH_INTERVAL")
+    search_log_max_buffer: int = Field(default=10000, env="SEARCH_LOG_MAX_BUFFER")
+    search_trending_window_seconds: int = Field(default=3600, env="SEARCH_TRENDING_WINDOW_SECONDS")
+    search_trending_windows: int = Field(default=24, env="SEARCH_TRENDING_WINDOWS")
+    search_trending_capacity: int = Field(default=200, env="SEARCH_TRENDING_CAPACITY")
+    
+    # 聊天记录批量写入配置（刷写间隔即聊天记录接口可见的最大延迟）
+    chat_log_batch_size: int = Field(default=100, env="CHAT_LOG_BATCH_SIZE")
+    chat_log_flush_interval: float = Field(default=1.0, env="CHAT_LOG_FLUSH_INTERVAL")
+    chat_log_max_buffer: int = Field(default=5000, env="CHAT_LOG_MAX_BUFFER")
+    
+    # 向量检索配置
+    vector_embedder: str = Field(default="hashing", env="VECTOR_EMBEDDER")
+    vector_dim: int = Field(default=512, env="VECTOR_DIM")
+    vector_index_path: str = Field(default="data/vector_index.npy", env="VECTOR_INDEX_PATH")  # 为空时只保存在内存
+    
     # 服务器配置
     host: str = Field(default="0.0.0.0", env="HOST")
     port: int = Field(default=8000, env="PORT")
@@ -49,7 +89,137 @@ QWEN_CONFIG = {
     "base_url": settings.qwen_base_url,
     "max_tokens": 2048,
     "temperature": 0.7,
-    "top_p": 0.9
+    "top_p": 0.9,
+    # 相同请求合并：跨进程锁有效期、结果保留时间（秒）和等待结果的轮询间隔
+    "singleflight": {
+        "enabled": settings.qwen_singleflight,
+        "lock_ttl": 60,
+        "result_ttl": 15,
+        "poll_interval": 0.1,
+    },
+    # 准入控制：全局并发上限、等待队列长度和排队期限（秒），每用户令牌桶（每秒补充速率、容量）
+    "admission": {
+        "max_concurrent": settings.qwen_max_concurrent,
+        "max_queue": settings.qwen_queue_size,
+        "queue_timeout": settings.qwen_queue_timeout,
+        "user_rate": settings.chat_user_rate_per_minute / 60,
+        "user_burst": settings.chat_user_burst,
+    },
+    # 上游弹性：重试（尝试次数、退避基数和上限、总期限，秒）、对冲请求和熔断
+    "resilience": {
+        "max_attempts": settings.qwen_max_attempts,
+        "base_delay": 0.2,
+        "max_delay": 2.0,
+        "deadline": settings.qwen_retry_deadline,
+        # 触发重试的HTTP状态码
+        "retry_status": [429, 500, 502, 503, 504],
+        "hedge": {
+            "enabled": settings.qwen_hedge,
+            # 对冲延迟取近期成功耗时的分位数，不低于 min_delay，样本不足 min_samples 时不对冲
+            "quantile": 0.95,
+            "min_delay": 0.5,
+            "min_samples": 20,
+        },
+        "breaker": {
+            # 最近 window 次调用中至少 min_requests 次且失败率达到 error_rate 时熔断 open_seconds 秒
+            "window": 20,
+            "min_requests": 10,
+            "error_rate": settings.qwen_breaker_error_rate,
+            "open_seconds": settings.qwen_breaker_open_seconds,
+        },
+    },
+    # 共享HTTP客户端的连接池与分阶段超时
+    "http": {
+        "max_connections": settings.qwen_max_connections,
+        "max_keepalive_connections": settings.qwen_max_keepalive_connections,
+        "keepalive_expiry": settings.qwen_keepalive_expiry,
+        "http2": settings.qwen_http2,
+        "timeout": {
+            "connect": settings.qwen_connect_timeout,
+            "read": settings.qwen_read_timeout,
+            "write": settings.qwen_write_timeout,
+            "pool": settings.qwen_pool_timeout,
+        },
+    },
+}
+
+# 搜索排序配置（BM25F）
+SEARCH_CONFIG = {
+    "bm25_k1": 1.2,
+    # 字段权重
+    "field_weights": {
+        "title": 3.0,
+        "description": 1.5,
+        "content": 1.0,
+        "detail": 1.2
+    },
+    # 字段长度归一化系数
+    "field_b": {
+        "title": 0.5,
+        "description": 0.75,
+        "content": 0.75,
+        "detail": 0.75
+    },
+    # 单次搜索缓存的最大结果数（翻页在缓存的结果上定位）
+    "max_results": 200,
+    # 搜索结果摘要
+    "snippet": {
+        "max_length": 160,
+        # 按优先级参与摘要选择的字段
+        "fields": ["description", "content", "detail"]
+    },
+    # 模糊匹配（拼写纠错）
+    "fuzzy": {
+        # 精确检索结果少于该数量时才尝试纠错
+        "min_hits": 3,
+        # 三元组Jaccard相似度下限
+        "min_similarity": 0.3,
+        # 参与编辑距离计算的候选数量上限
+        "max_candidates": 20,
+        "max_edits": 2
+    },
+    # 混合检索（关键词 + 向量）
+    "hybrid": {
+        # 融合方式: rrf（倒数排名融合）或 weighted（归一化分数加权）
+        "method": "rrf",
+        "rrf_k": 60,
+        "weights": {
+            "lexical": 1.0,
+            "semantic": 1.0
+        },
+        # 每路检索的候选数量
+        "candidates": 50,
+        # 向量检索的最低余弦相似度，过滤弱相关结果
+        "min_semantic_score": 0.1,
+        # 延迟预算（毫秒），超时的检索器结果被丢弃
+        "budget_ms": 300
+    }
+}
+
+# RAG上下文构建配置
+RAG_CONFIG = {
+    # 检索的候选知识项数
+    "candidates": 8,
+    # 知识上下文的token预算
+    "token_budget": 1200,
+    # 单个段落的最大字符数
+    "passage_max_chars": 240,
+    # 每个知识项最多选入的段落数
+    "max_passages_per_item": 4,
+}
+
+# 会话记忆配置
+CHAT_MEMORY_CONFIG = {
+    # 窗口内保留的最近消息数（一问一答为两条）
+    "max_messages": 12,
+    # 窗口内消息的token预算
+    "token_budget": 1500,
+    # 滚动摘要的token上限
+    "summary_tokens": 300,
+    # 每条摘要行的最大字符数
+    "summary_line_chars": 80,
+    # 缓存未命中时从数据库读取的最近消息数
+    "rebuild_messages": 24,
 }
 
 # 缓存键设计
@@ -57,14 +227,21 @@ CACHE_KEYS = {
     "knowledge_categories": "knowledge:categories",
     "knowledge_item": "knowledge:item:{item_id}",
     "search_result": "search:result:{query_hash}",
-    "chat_session": "chat:session:{session_id}"
+    "chat_session": "chat:session:{session_id}",
+    "chat_answer": "chat:answer:{key_hash}",
+    # 知识项 -> 引用它的回答缓存键集合
+    "chat_answer_items": "chat:answer_items:{item_id}",
+    # 请求合并的跨进程锁和结果
+    "flight_lock": "chat:flight:{name}:lock:{key_hash}",
+    "flight_result": "chat:flight:{name}:result:{key_hash}"
 }
 
 # 缓存过期时间
 CACHE_TTL = {
     "knowledge": 3600,      # 1小时
     "search": 300,         # 5分钟
-    "chat": 1800          # 30分钟
+    "chat": 1800,         # 30分钟
+    "answer": 86400       # 1天
 }
 
 # 日志配置
@@ -44,8 +44,13 @@ def get_db():
 def init_db():
     """初始化数据库"""
     from src.models import (
-        User, KnowledgeCategory, KnowledgeItem, KnowledgeDetail, ChatHistory
+        User, KnowledgeCategory, KnowledgeItem, KnowledgeDetail, ChatHistory, SearchLog
     )
     
+    from src.fulltext import fulltext_backend
+    
     # 创建所有表
     Base.metadata.create_all(bind=engine)
+    
+    # 创建全文索引
+    fulltext_backend.setup(engine)
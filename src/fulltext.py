@@ -0,0 +1,385 @@
+"""
+数据库全文检索后端
+SQLite 使用 FTS5 虚拟表，PostgreSQL 使用 tsvector 生成列 + GIN 索引，均不可用时回退到 LIKE 查询
+"""
+import logging
+import re
+from typing import List, Optional, Tuple
+from sqlalchemy import text, or_
+from sqlalchemy.orm import Session
+from src.config import settings, SEARCH_CONFIG
+from src.models import KnowledgeItem, KnowledgeCategory
+from src.search_index import normalize_text, CJK_CHARS
+
+logger = logging.getLogger(__name__)
+
+# 中日韩字符
+CJK_PATTERN = re.compile("[" + CJK_CHARS + "]")
+
+
+def split_terms(query: str) -> List[str]:
+    """按空白切分查询词"""
+    return [term for term in normalize_text(query).split() if term]
+
+
+def escape_like(term: str) -> str:
+    """转义LIKE通配符"""
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class LikeBackend:
+    """LIKE查询后端（无全文索引时的回退实现）"""
+
+    name = "like"
+
+    def __init__(self):
+        self.available = True
+
+    def setup(self, engine) -> bool:
+        """初始化全文索引"""
+        return True
+
+    def rebuild(self, db: Session):
+        """重建全文索引"""
+        pass
+
+    def search(
+        self,
+        db: Session,
+        query: str,
+        limit: Optional[int] = None,
+        category_id: Optional[str] = None,
+        status: Optional[str] = None,
+        active_only: bool = True
+    ) -> List[Tuple[KnowledgeItem, Optional[str], Optional[float]]]:
+        """检索知识项，返回 (知识项, 分类标题, 相关性分数)"""
+        search_conditions = or_(
+            KnowledgeItem.title.contains(query),
+            KnowledgeItem.description.contains(query),
+            KnowledgeItem.content.contains(query)
+        )
+
+        q = db.query(KnowledgeItem, KnowledgeCategory.title).join(
+            KnowledgeCategory, KnowledgeCategory.id == KnowledgeItem.category_id
+        ).filter(search_conditions)
+        q = self._apply_filters(q, category_id, status, active_only)
+        q = q.order_by(KnowledgeItem.sort_order, KnowledgeItem.id)
+        if limit:
+            q = q.limit(limit)
+
+        return [(item, category_title, None) for item, category_title in q.all()]
+
+    def _apply_filters(self, q, category_id, status, active_only):
+        """应用分类、状态筛选"""
+        if category_id:
+            q = q.filter(KnowledgeItem.category_id == category_id)
+        if status:
+            q = q.filter(KnowledgeItem.status == status)
+        if active_only:
+            q = q.filter(KnowledgeCategory.is_active == True)
+        return q
+
+    def _load_ranked(
+        self, db: Session, ranked: List[Tuple[str, float]]
+    ) -> List[Tuple[KnowledgeItem, Optional[str], Optional[float]]]:
+        """按排序结果批量加载知识项"""
+        if not ranked:
+            return []
+
+        rows = db.query(KnowledgeItem, KnowledgeCategory.title).join(
+            KnowledgeCategory, KnowledgeCategory.id == KnowledgeItem.category_id
+        ).filter(KnowledgeItem.id.in_([item_id for item_id, _ in ranked])).all()
+
+        by_id = {item.id: (item, category_title) for item, category_title in rows}
+        return [
+            (by_id[item_id][0], by_id[item_id][1], score)
+            for item_id, score in ranked if item_id in by_id
+        ]
+
+    def _filter_sql(self, category_id, status, active_only, params: dict) -> str:
+        """构建筛选条件SQL片段"""
+        clauses = []
+        if category_id:
+            clauses.append("i.category_id = :category_id")
+            params["category_id"] = category_id
+        if status:
+            clauses.append("i.status = :status")
+            params["status"] = status
+        if active_only:
+            clauses.append("c.is_active = :is_active")
+            params["is_active"] = True
+        return "".join(f" AND {clause}" for clause in clauses)
+
+
+class SQLiteFTSBackend(LikeBackend):
+    """SQLite FTS5 全文检索后端（trigram分词，支持中文子串匹配）"""
+
+    name = "sqlite_fts5"
+
+    # trigram分词器要求查询词至少3个字符
+    MIN_TERM_LENGTH = 3
+
+    DETAIL_TEXT_SQL = (
+        "(SELECT group_concat(d.title || ' ' || coalesce(d.description, ''), ' ') "
+        "FROM knowledge_details d WHERE d.knowledge_id = {item_id})"
+    )
+
+    # 知识项ID对应的FTS行号（knowledge_items 的主键是字符串，其隐式rowid在VACUUM后可能变化，不能作为FTS行号）
+    FTS_ROW_SQL = "(SELECT id FROM knowledge_fts_rows WHERE item_id = {item_id})"
+
+    # 同步触发器（旧版本以 knowledge_items.rowid 为FTS行号，启动时删除后重建）
+    TRIGGERS = (
+        "knowledge_fts_item_insert", "knowledge_fts_item_update", "knowledge_fts_item_delete",
+        "knowledge_fts_detail_insert", "knowledge_fts_detail_update", "knowledge_fts_detail_delete",
+    )
+
+    def __init__(self):
+        self.available = False
+
+    def setup(self, engine) -> bool:
+        """创建FTS5虚拟表、行号映射表和同步触发器"""
+        item_detail = self.DETAIL_TEXT_SQL.format(item_id="new.id")
+        new_detail = self.DETAIL_TEXT_SQL.format(item_id="new.knowledge_id")
+        old_detail = self.DETAIL_TEXT_SQL.format(item_id="old.knowledge_id")
+        new_row = self.FTS_ROW_SQL.format(item_id="new.id")
+        old_row = self.FTS_ROW_SQL.format(item_id="old.id")
+        insert_row = (
+            "INSERT OR IGNORE INTO knowledge_fts_rows(item_id) VALUES (new.id); "
+            "INSERT INTO knowledge_fts(rowid, item_id, title, description, content, detail) "
+            f"VALUES ({new_row}, new.id, new.title, coalesce(new.description, ''), "
+            f"coalesce(new.content, ''), coalesce({item_detail}, ''));"
+        )
+        delete_row = (
+            f"DELETE FROM knowledge_fts WHERE rowid = {old_row}; "
+            "DELETE FROM knowledge_fts_rows WHERE item_id = old.id;"
+        )
+
+        def update_detail(detail_sql: str, item_id: str) -> str:
+            return (
+                f"UPDATE knowledge_fts SET detail = coalesce({detail_sql}, '') "
+                f"WHERE rowid = {self.FTS_ROW_SQL.format(item_id=item_id)};"
+            )
+
+        statements = [
+            "CREATE VIRTUAL TABLE IF NOT EXISTS knowledge_fts USING fts5("
+            "item_id UNINDEXED, title, description, content, detail, tokenize='trigram')",
+            # INTEGER PRIMARY KEY 即rowid，VACUUM后保持不变；item_id 唯一索引供触发器按知识项ID定位FTS行
+            "CREATE TABLE IF NOT EXISTS knowledge_fts_rows("
+            "id INTEGER PRIMARY KEY, item_id TEXT NOT NULL UNIQUE)",
+        ]
+        statements.extend(f"DROP TRIGGER IF EXISTS {name}" for name in self.TRIGGERS)
+        statements.extend([
+            # 知识项变更
+            "CREATE TRIGGER knowledge_fts_item_insert AFTER INSERT ON knowledge_items "
+            f"BEGIN {insert_row} END",
+            "CREATE TRIGGER knowledge_fts_item_update AFTER UPDATE ON knowledge_items "
+            f"BEGIN {delete_row} {insert_row} END",
+            "CREATE TRIGGER knowledge_fts_item_delete AFTER DELETE ON knowledge_items "
+            f"BEGIN {delete_row} END",
+            # 知识项详情变更
+            "CREATE TRIGGER knowledge_fts_detail_insert AFTER INSERT ON knowledge_details "
+            f"BEGIN {update_detail(new_detail, 'new.knowledge_id')} END",
+            "CREATE TRIGGER knowledge_fts_detail_update AFTER UPDATE ON knowledge_details "
+            f"BEGIN {update_detail(old_detail, 'old.knowledge_id')} "
+            f"{update_detail(new_detail, 'new.knowledge_id')} END",
+            "CREATE TRIGGER knowledge_fts_detail_delete AFTER DELETE ON knowledge_details "
+            f"BEGIN {update_detail(old_detail, 'old.knowledge_id')} END",
+        ])
+
+        try:
+            with engine.begin() as conn:
+                for statement in statements:
+                    conn.execute(text(statement))
+
+                # 首次创建或映射不一致时（含旧版本按rowid建立的索引）全量填充
+                total = conn.execute(text("SELECT count(*) FROM knowledge_items")).scalar()
+                indexed = conn.execute(text("SELECT count(*) FROM knowledge_fts")).scalar()
+                consistent = conn.execute(text(
+                    "SELECT count(*) FROM knowledge_fts f "
+                    "JOIN knowledge_fts_rows r ON r.id = f.rowid AND r.item_id = f.item_id "
+                    "JOIN knowledge_items i ON i.id = r.item_id"
+                )).scalar()
+                if not (indexed == total == consistent):
+                    self._populate(conn)
+            self.available = True
+        except Exception as e:
+            logger.warning(f"SQLite FTS5不可用，回退到LIKE查询: {e}")
+            self.available = False
+
+        return self.available
+
+    def _populate(self, conn):
+        """全量填充FTS表（重新分配行号）"""
+        detail = self.DETAIL_TEXT_SQL.format(item_id="i.id")
+        conn.execute(text("DELETE FROM knowledge_fts"))
+        conn.execute(text("DELETE FROM knowledge_fts_rows"))
+        conn.execute(text("INSERT INTO knowledge_fts_rows(item_id) SELECT id FROM knowledge_items"))
+        conn.execute(text(
+            "INSERT INTO knowledge_fts(rowid, item_id, title, description, content, detail) "
+            "SELECT r.id, i.id, i.title, coalesce(i.description, ''), coalesce(i.content, ''), "
+            f"coalesce({detail}, '') FROM knowledge_items i JOIN knowledge_fts_rows r ON r.item_id = i.id"
+        ))
+
+    def rebuild(self, db: Session):
+        """重建全文索引"""
+        if not self.available:
+            return
+        self._populate(db.connection())
+        db.commit()
+
+    def search(self, db, query, limit=None, category_id=None, status=None, active_only=True):
+        """FTS5检索，按bm25排序"""
+        if not self.available:
+            return super().search(db, query, limit, category_id, status, active_only)
+
+        terms = split_terms(query)
+        if not terms:
+            return []
+
+        params = {}
+        conditions = []
+        match_terms = [term for term in terms if len(term) >= self.MIN_TERM_LENGTH]
+        if match_terms:
+            # 每个词作为短语查询，转义双引号
+            params["match"] = " AND ".join('"' + term.replace('"', '""') + '"' for term in match_terms)
+            conditions.append("knowledge_fts MATCH :match")
+
+        # 过短的词无法使用trigram索引，在FTS表内做子串匹配
+        for i, term in enumerate(t for t in terms if len(t) < self.MIN_TERM_LENGTH):
+            params[f"like_{i}"] = f"%{escape_like(term)}%"
+            conditions.append("(" + " OR ".join(
+                f"knowledge_fts.{column} LIKE :like_{i} ESCAPE '\\'"
+                for column in ("title", "description", "content", "detail")
+            ) + ")")
+
+        weights = SEARCH_CONFIG["field_weights"]
+        if match_terms:
+            rank_sql = "-bm25(knowledge_fts, 0, {title}, {description}, {content}, {detail})".format(**weights)
+            order_sql = "score DESC, i.sort_order"
+        else:
+            rank_sql = "0"
+            order_sql = "i.sort_order, i.id"
+
+        sql = (
+            f"SELECT knowledge_fts.item_id, {rank_sql} AS score FROM knowledge_fts "
+            "JOIN knowledge_items i ON i.id = knowledge_fts.item_id "
+            "JOIN knowledge_categories c ON c.id = i.category_id "
+            f"WHERE {' AND '.join(conditions)}"
+            f"{self._filter_sql(category_id, status, active_only, params)} "
+            f"ORDER BY {order_sql}"
+        )
+        if limit:
+            sql += " LIMIT :limit"
+            params["limit"] = limit
+
+        ranked = [
+            (row[0], float(row[1]) if match_terms else None)
+            for row in db.execute(text(sql), params)
+        ]
+        return self._load_ranked(db, ranked)
+
+
+class PostgresFTSBackend(LikeBackend):
+    """PostgreSQL 全文检索后端（tsvector生成列 + GIN索引）"""
+
+    name = "postgres_tsvector"
+
+    def __init__(self):
+        self.available = False
+        self.trigram_available = False
+
+    def setup(self, engine) -> bool:
+        """创建tsvector生成列和GIN索引"""
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(
+                    "ALTER TABLE knowledge_items ADD COLUMN IF NOT EXISTS search_vector tsvector "
+                    "GENERATED ALWAYS AS ("
+                    "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+                    "setweight(to_tsvector('simple', coalesce(description, '')), 'B') || "
+                    "setweight(to_tsvector('simple', coalesce(content, '')), 'C')"
+                    ") STORED"
+                ))
+                conn.execute(text(
+                    "CREATE INDEX IF NOT EXISTS idx_knowledge_items_search_vector "
+                    "ON knowledge_items USING GIN (search_vector)"
+                ))
+            self.available = True
+        except Exception as e:
+            logger.warning(f"PostgreSQL全文索引不可用，回退到LIKE查询: {e}")
+            self.available = False
+            return False
+
+        # 'simple'配置不切分中文，中文查询使用pg_trgm索引加速子串匹配
+        try:
+            with engine.begin() as conn:
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+                for column in ("title", "description", "content"):
+                    conn.execute(text(
+                        f"CREATE INDEX IF NOT EXISTS idx_knowledge_items_{column}_trgm "
+                        f"ON knowledge_items USING GIN ({column} gin_trgm_ops)"
+                    ))
+            self.trigram_available = True
+        except Exception as e:
+            logger.warning(f"pg_trgm不可用，中文查询将不使用索引: {e}")
+
+        return True
+
+    def search(self, db, query, limit=None, category_id=None, status=None, active_only=True):
+        """tsvector检索，按ts_rank_cd排序"""
+        if not self.available:
+            return super().search(db, query, limit, category_id, status, active_only)
+
+        terms = split_terms(query)
+        if not terms:
+            return []
+
+        params = {}
+        conditions = []
+        latin_terms = [term for term in terms if not CJK_PATTERN.search(term)]
+        if latin_terms:
+            params["tsquery"] = " ".join(latin_terms)
+            conditions.append("i.search_vector @@ plainto_tsquery('simple', :tsquery)")
+
+        for i, term in enumerate(t for t in terms if CJK_PATTERN.search(t)):
+            params[f"like_{i}"] = f"%{escape_like(term)}%"
+            conditions.append("(" + " OR ".join(
+                f"i.{column} ILIKE :like_{i}" for column in ("title", "description", "content")
+            ) + ")")
+
+        if latin_terms:
+            rank_sql = "ts_rank_cd(i.search_vector, plainto_tsquery('simple', :tsquery))"
+            order_sql = "score DESC, i.sort_order"
+        else:
+            rank_sql = "0"
+            order_sql = "i.sort_order, i.id"
+
+        sql = (
+            f"SELECT i.id, {rank_sql} AS score FROM knowledge_items i "
+            "JOIN knowledge_categories c ON c.id = i.category_id "
+            f"WHERE {' AND '.join(conditions)}"
+            f"{self._filter_sql(category_id, status, active_only, params)} "
+            f"ORDER BY {order_sql}"
+        )
+        if limit:
+            sql += " LIMIT :limit"
+            params["limit"] = limit
+
+        ranked = [
+            (row[0], float(row[1]) if latin_terms else None)
+            for row in db.execute(text(sql), params)
+        ]
+        return self._load_ranked(db, ranked)
+
+
+def create_fulltext_backend(database_url: str) -> LikeBackend:
+    """根据数据库地址选择全文检索后端"""
+    if database_url.startswith("sqlite"):
+        return SQLiteFTSBackend()
+    if database_url.startswith("postgresql"):
+        return PostgresFTSBackend()
+    return LikeBackend()
+
+
+# 全局全文检索后端实例
+fulltext_backend = create_fulltext_backend(settings.database_url)
@@ -0,0 +1,197 @@
+"""
+模糊搜索模块 - 基于字符三元组的拼写纠错
+词表由知识库中的拉丁单词和标题中的中文片段组成，按三元组重合度生成候选，再按编辑距离排序
+"""
+import threading
+from typing import List, Dict, Optional, Set, Tuple
+from src.config import SEARCH_CONFIG
+from src.search_index import SearchIndex, IndexedDocument, FIELDS, TOKEN_PATTERN, normalize_text
+
+
+def trigrams(term: str) -> Set[str]:
+    """生成带边界填充的字符三元组"""
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """
+    编辑距离（允许相邻字符交换），超过 max_distance 时提前返回 max_distance + 1
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+
+    previous2: List[int] = []
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def _is_cjk(token: str) -> bool:
+    """判断词元是否为中日韩字符"""
+    return not token[0].isascii()
+
+
+def document_terms(doc: IndexedDocument, detail_titles: List[str]) -> Set[str]:
+    """提取文档的词表：各字段的拉丁单词 + 标题中长度2~4的中文片段"""
+    terms = set()
+    for field in FIELDS:
+        for match in TOKEN_PATTERN.finditer(normalize_text(doc.field_text(field))):
+            token = match.group()
+            if not _is_cjk(token) and len(token) >= 3 and not token.isdigit():
+                terms.add(token)
+
+    for title in [doc.title] + detail_titles:
+        for match in TOKEN_PATTERN.finditer(normalize_text(title)):
+            token = match.group()
+            if not _is_cjk(token):
+                continue
+            for n in range(2, 5):
+                for i in range(len(token) - n + 1):
+                    terms.add(token[i:i + n])
+    return terms
+
+
+class FuzzyCorrector:
+    """三元组模糊匹配索引"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # 词 -> 包含该词的文档数
+        self.vocabulary: Dict[str, int] = {}
+        # 三元组 -> 词集合
+        self.trigram_index: Dict[str, Set[str]] = {}
+        # 知识项ID -> 词集合（用于增量更新）
+        self._item_terms: Dict[str, Set[str]] = {}
+        self.ready = False
+
+    def _add_term(self, term: str):
+        """词表计数加一"""
+        count = self.vocabulary.get(term, 0)
+        self.vocabulary[term] = count + 1
+        if count == 0:
+            for gram in trigrams(term):
+                self.trigram_index.setdefault(gram, set()).add(term)
+
+    def _remove_term(self, term: str):
+        """词表计数减一"""
+        count = self.vocabulary.get(term, 0) - 1
+        if count > 0:
+            self.vocabulary[term] = count
+            return
+        self.vocabulary.pop(term, None)
+        for gram in trigrams(term):
+            terms = self.trigram_index.get(gram)
+            if terms is not None:
+                terms.discard(term)
+                if not terms:
+                    del self.trigram_index[gram]
+
+    def _sync_item(self, index: SearchIndex, item_id: str):
+        """同步知识项的词表"""
+        for term in self._item_terms.pop(item_id, set()):
+            self._remove_term(term)
+
+        doc = index.get_document(item_id)
+        if doc is None:
+            return
+        detail_titles = [detail.get("title") or "" for detail in index.item_details(item_id)]
+        terms = document_terms(doc, detail_titles)
+        for term in terms:
+            self._add_term(term)
+        self._item_terms[item_id] = terms
+
+    def on_rebuild(self, index: SearchIndex):
+        """索引全量构建后重建词表"""
+        with self._lock:
+            self.vocabulary = {}
+            self.trigram_index = {}
+            self._item_terms = {}
+            for item_id in index.item_ids():
+                self._sync_item(index, item_id)
+            self.ready = True
+
+    def on_change(self, index: SearchIndex, upserted: Set[str], removed: Set[str]):
+        """索引增量更新后同步词表"""
+        with self._lock:
+            for item_id in upserted | removed:
+                self._sync_item(index, item_id)
+
+    def candidates(self, term: str, limit: Optional[int] = None) -> List[Tuple[str, int]]:
+        """
+        返回词的纠错候选 (候选词, 编辑距离)，按编辑距离、长度差和文档数排序
+        先按三元组Jaccard相似度筛出有限个候选，再计算编辑距离
+        """
+        config = SEARCH_CONFIG["fuzzy"]
+        limit = limit or config["max_candidates"]
+        # 短词只允许一次编辑
+        max_edits = 1 if len(term) <= 4 else config["max_edits"]
+        grams = trigrams(term)
+
+        with self._lock:
+            overlap: Dict[str, int] = {}
+            for gram in grams:
+                for candidate in self.trigram_index.get(gram, ()):
+                    overlap[candidate] = overlap.get(candidate, 0) + 1
+
+            similar = []
+            for candidate, shared in overlap.items():
+                similarity = shared / (len(grams) + len(trigrams(candidate)) - shared)
+                if similarity >= config["min_similarity"]:
+                    similar.append((similarity, candidate))
+            similar.sort(reverse=True)
+
+            ranked = []
+            for _, candidate in similar[:limit]:
+                distance = edit_distance(term, candidate, max_edits)
+                if distance <= max_edits:
+                    ranked.append((
+                        (distance, abs(len(candidate) - len(term)), -self.vocabulary[candidate]),
+                        candidate,
+                        distance
+                    ))
+        ranked.sort()
+        return [(candidate, distance) for _, candidate, distance in ranked]
+
+    def correct(self, query: str, is_known) -> Optional[str]:
+        """
+        纠正查询中索引未收录的词，is_known(词) 判断词是否可被精确检索
+        无需纠正或无法纠正时返回None
+        """
+        normalized = normalize_text(query)
+        parts = []
+        position = 0
+        changed = False
+        for match in TOKEN_PATTERN.finditer(normalized):
+            token = match.group()
+            parts.append(normalized[position:match.start()])
+            position = match.end()
+
+            replacement = token
+            if len(token) >= 2 and not token.isdigit() and not is_known(token):
+                candidates = self.candidates(token)
+                if candidates:
+                    replacement = candidates[0][0]
+                    changed = True
+            parts.append(replacement)
+        parts.append(normalized[position:])
+
+        return "".join(parts).strip() if changed else None
+
+    def stats(self) -> Dict[str, int]:
+        """模糊索引统计信息"""
+        with self._lock:
+            return {"terms": len(self.vocabulary), "trigrams": len(self.trigram_index)}
+
+
+# 全局模糊匹配实例
+fuzzy_corrector = FuzzyCorrector()
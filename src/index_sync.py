@@ -0,0 +1,157 @@
+"""
+搜索索引增量同步
+监听SQLAlchemy会话事件，在事务提交后把知识库变更应用到搜索索引，并通知提交监听器
+"""
+import logging
+from typing import Dict, Any, Set, List, Callable
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from src.models import KnowledgeCategory, KnowledgeItem, KnowledgeDetail
+from src.search_index import search_index
+
+logger = logging.getLogger(__name__)
+
+# 会话info中保存待应用变更的键
+CHANGES_KEY = "knowledge_changes"
+
+# 各模型需要同步的字段
+SYNC_FIELDS = {
+    KnowledgeCategory: ("id", "title", "is_active"),
+    KnowledgeItem: ("id", "category_id", "title", "description", "content", "status", "sort_order"),
+    KnowledgeDetail: ("id", "knowledge_id", "title", "description", "external_link", "sort_order"),
+}
+
+# 事务提交监听器，callback(ChangeSet)；与搜索引擎类型及索引是否就绪无关
+_commit_listeners: List[Callable[["ChangeSet"], None]] = []
+
+
+class ChangeSet:
+    """一次事务内的知识库变更"""
+
+    def __init__(self):
+        self.categories: Dict[str, Dict[str, Any]] = {}
+        self.deleted_categories: Set[str] = set()
+        self.items: Dict[str, Dict[str, Any]] = {}
+        self.deleted_items: Set[str] = set()
+        self.details: Dict[str, Dict[str, Any]] = {}
+        self.deleted_details: Dict[str, str] = {}  # 详情ID -> 知识项ID
+
+    def __bool__(self):
+        return any((
+            self.categories, self.deleted_categories, self.items,
+            self.deleted_items, self.details, self.deleted_details
+        ))
+
+    def item_ids(self) -> Set[str]:
+        """本次变更涉及的知识项ID（包括详情所属的知识项）"""
+        item_ids = set(self.items) | self.deleted_items | set(self.deleted_details.values())
+        item_ids.update(
+            detail["knowledge_id"] for detail in self.details.values() if detail.get("knowledge_id")
+        )
+        return item_ids
+
+    def record_upsert(self, obj):
+        """记录新增或更新的对象"""
+        snapshot = _snapshot(obj)
+        if isinstance(obj, KnowledgeCategory):
+            self.categories.setdefault(snapshot["id"], {}).update(snapshot)
+            self.deleted_categories.discard(snapshot["id"])
+        elif isinstance(obj, KnowledgeItem):
+            self.items.setdefault(snapshot["id"], {}).update(snapshot)
+            self.deleted_items.discard(snapshot["id"])
+        elif isinstance(obj, KnowledgeDetail):
+            self.details.setdefault(snapshot["id"], {}).update(snapshot)
+            self.deleted_details.pop(snapshot["id"], None)
+
+    def record_delete(self, obj):
+        """记录删除的对象"""
+        if isinstance(obj, KnowledgeCategory):
+            self.categories.pop(obj.id, None)
+            self.deleted_categories.add(obj.id)
+        elif isinstance(obj, KnowledgeItem):
+            self.items.pop(obj.id, None)
+            self.deleted_items.add(obj.id)
+        elif isinstance(obj, KnowledgeDetail):
+            self.details.pop(obj.id, None)
+            self.deleted_details[obj.id] = obj.knowledge_id
+
+
+def _snapshot(obj) -> Dict[str, Any]:
+    """读取对象已加载的字段值（不触发数据库查询）"""
+    loaded = inspect(obj).dict
+    return {
+        field: loaded[field]
+        for field in SYNC_FIELDS[type(obj)] if field in loaded
+    }
+
+
+def _after_flush(session: Session, flush_context):
+    """收集本次flush中的知识库变更"""
+    upserted = [
+        obj for obj in session.new if type(obj) in SYNC_FIELDS
+    ] + [
+        obj for obj in session.dirty
+        if type(obj) in SYNC_FIELDS and session.is_modified(obj, include_collections=False)
+    ]
+    deleted = [obj for obj in session.deleted if type(obj) in SYNC_FIELDS]
+    if not upserted and not deleted:
+        return
+
+    changes = session.info.setdefault(CHANGES_KEY, ChangeSet())
+    for obj in upserted:
+        changes.record_upsert(obj)
+    for obj in deleted:
+        changes.record_delete(obj)
+
+
+def _after_commit(session: Session):
+    """事务提交后应用变更"""
+    changes = session.info.pop(CHANGES_KEY, None)
+    if not changes:
+        return
+    for callback in _commit_listeners:
+        try:
+            callback(changes)
+        except Exception as e:
+            logger.error(f"提交监听器执行失败: {e}")
+    # 索引未就绪时只在全量构建期间应用（构建完成时重放到新版本）
+    if not (search_index.ready or search_index.building):
+        return
+    try:
+        search_index.apply_changes(changes)
+    except Exception as e:
+        # 增量更新失败时标记索引需要重建，避免返回过期结果
+        logger.error(f"搜索索引增量更新失败，需要全量重建: {e}")
+        search_index.ready = False
+
+
+def _after_rollback(session: Session):
+    """事务回滚时丢弃变更"""
+    session.info.pop(CHANGES_KEY, None)
+
+
+def add_commit_listener(callback: Callable[[ChangeSet], None]):
+    """注册事务提交回调（需同时调用 register_index_sync 才会收到变更）"""
+    if callback not in _commit_listeners:
+        _commit_listeners.append(callback)
+
+
+def register_index_sync():
+    """注册会话事件监听"""
+    if event.contains(Session, "after_flush", _after_flush):
+        return
+    event.listen(Session, "after_flush", _after_flush)
+    event.listen(Session, "after_commit", _after_commit)
+    event.listen(Session, "after_rollback", _after_rollback)
+
+
+def rebuild_search_indexes(db: Session) -> Dict[str, Any]:
+    """全量重建搜索索引（用于故障恢复，耗时较长，异步接口中应放到线程池执行）"""
+    from src.fulltext import fulltext_backend
+
+    search_index.build(db)
+    fulltext_backend.rebuild(db)
+    return {
+        "search_index": search_index.stats(),
+        "fulltext_backend": fulltext_backend.name,
+    }
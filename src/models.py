@@ -84,6 +84,19 @@ class ChatHistory(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 
+class SearchLog(Base):
+    """搜索日志表"""
+    __tablename__ = "search_logs"
+    
+    id = Column(String(36), primary_key=True, default=generate_uuid, index=True)
+    user_id = Column(String(36), ForeignKey("users.id"))
+    query = Column(String(200), nullable=False)
+    normalized_query = Column(String(200), nullable=False)
+    result_count = Column(Integer, default=0)
+    response_time_ms = Column(Integer)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
 # 创建索引
 Index("idx_knowledge_categories_active", KnowledgeCategory.is_active)
 Index("idx_knowledge_categories_sort", KnowledgeCategory.sort_order)
@@ -95,3 +108,8 @@ Index("idx_knowledge_details_sort", KnowledgeDetail.sort_order)
 Index("idx_chat_history_session", ChatHistory.session_id)
 Index("idx_chat_history_user", ChatHistory.user_id)
 Index("idx_chat_history_created", ChatHistory.created_at)
+# 游标分页按 (created_at, id) 定位
+Index("idx_chat_history_user_created", ChatHistory.user_id, ChatHistory.created_at, ChatHistory.id)
+Index("idx_users_created", User.created_at, User.id)
+Index("idx_search_logs_created", SearchLog.created_at)
+Index("idx_search_logs_query", SearchLog.normalized_query)
@@ -0,0 +1,164 @@
+"""
+游标分页（keyset / seek 分页）
+游标是排序键的不透明编码，翻页时按 "排序键 > 游标" 直接定位，深页与首页开销相同
+"""
+import base64
+import bisect
+import json
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from fastapi import HTTPException
+from sqlalchemy import tuple_, literal, String
+
+NEXT = "next"
+PREV = "prev"
+
+
+def _encode_value(value: Any) -> Any:
+    """编码排序键中的单个值"""
+    if isinstance(value, datetime):
+        return {"$dt": value.isoformat()}
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    """解码排序键中的单个值"""
+    if isinstance(value, dict) and "$dt" in value:
+        return datetime.fromisoformat(value["$dt"])
+    return value
+
+
+def encode_cursor(key: Sequence[Any], direction: str = NEXT) -> str:
+    """将排序键编码为游标"""
+    payload = json.dumps(
+        {"k": [_encode_value(value) for value in key], "d": direction},
+        separators=(",", ":"),
+        ensure_ascii=False
+    )
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, key_size: Optional[int] = None) -> Tuple[Tuple[Any, ...], str]:
+    """解码游标，返回 (排序键, 翻页方向)"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+        key = tuple(_decode_value(value) for value in payload["k"])
+        direction = payload.get("d", NEXT)
+    except Exception:
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+
+    if (key_size is not None and len(key) != key_size) or direction not in (NEXT, PREV):
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+    return key, direction
+
+
+class Page:
+    """分页结果"""
+
+    def __init__(self, items: List[Any], next_cursor: Optional[str] = None, prev_cursor: Optional[str] = None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def headers(self) -> Dict[str, str]:
+        """以响应头返回游标（用于返回列表的接口）"""
+        headers = {}
+        if self.next_cursor:
+            headers["X-Next-Cursor"] = self.next_cursor
+        if self.prev_cursor:
+            headers["X-Prev-Cursor"] = self.prev_cursor
+        return headers
+
+
+def _build_page(
+    items: List[Any],
+    key_of: Callable[[Any], Sequence[Any]],
+    forward: bool,
+    has_more: bool,
+    has_cursor: bool
+) -> Page:
+    """根据本页数据生成前后游标"""
+    if not items:
+        return Page([])
+    # 向前翻页时"后面还有"取决于是否多取到一条；向后翻页时来源页一定在后面
+    has_next = has_more if forward else True
+    has_prev = has_cursor if forward else has_more
+    return Page(
+        items,
+        next_cursor=encode_cursor(key_of(items[-1]), NEXT) if has_next else None,
+        prev_cursor=encode_cursor(key_of(items[0]), PREV) if has_prev else None
+    )
+
+
+def _bind_value(query, value: Any) -> Any:
+    """
+    绑定游标值
+    SQLite 中 server_default 写入的时间为无小数秒的文本，而绑定参数总带微秒，
+    文本比较会把同一时刻判为不等，因此按存储格式绑定为文本
+    """
+    if isinstance(value, datetime) and query.session.get_bind().dialect.name == "sqlite":
+        fmt = "%Y-%m-%d %H:%M:%S" if not value.microsecond else "%Y-%m-%d %H:%M:%S.%f"
+        return literal(value.replace(tzinfo=None).strftime(fmt), String)
+    return value
+
+
+def paginate_query(
+    query,
+    columns: Sequence[Any],
+    key_of: Callable[[Any], Sequence[Any]],
+    limit: int,
+    cursor: Optional[str] = None,
+    descending: bool = False
+) -> Page:
+    """
+    对SQLAlchemy查询做keyset分页
+    columns 为唯一确定顺序的排序列（末列通常是主键），key_of 从结果行取出对应的排序键
+    """
+    forward = True
+    if cursor:
+        key, direction = decode_cursor(cursor, len(columns))
+        forward = direction == NEXT
+        bound = tuple_(*[_bind_value(query, value) for value in key])
+        # 行值比较可直接利用联合索引定位
+        if forward != descending:
+            query = query.filter(tuple_(*columns) > bound)
+        else:
+            query = query.filter(tuple_(*columns) < bound)
+
+    # 向后翻页时反向排序取最近的 limit 条，再恢复顺序
+    ascending = forward != descending
+    query = query.order_by(*[column.asc() if ascending else column.desc() for column in columns])
+    rows = query.limit(limit + 1).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if not forward:
+        rows.reverse()
+    return _build_page(rows, key_of, forward, has_more, bool(cursor))
+
+
+def paginate_sequence(
+    items: Sequence[Any],
+    key_of: Callable[[Any], Tuple[Any, ...]],
+    limit: int,
+    cursor: Optional[str] = None
+) -> Page:
+    """对已按 key_of 升序排列的内存列表做keyset分页（二分定位）"""
+    if not cursor:
+        return _build_page(list(items[:limit]), key_of, True, len(items) > limit, False)
+
+    key, direction = decode_cursor(cursor)
+    if not items:
+        return Page([])
+    if len(key) != len(key_of(items[0])):
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+
+    if direction == NEXT:
+        start = bisect.bisect_right(items, key, key=key_of)
+        page = list(items[start:start + limit])
+        return _build_page(page, key_of, True, start + limit < len(items), True)
+
+    end = bisect.bisect_left(items, key, key=key_of)
+    start = max(end - limit, 0)
+    return _build_page(list(items[start:end]), key_of, False, start > 0, True)
@@ -0,0 +1,301 @@
+"""
+RAG上下文构建模块
+一次排序检索取回候选知识项，把描述、正文分段和详情切成段落，
+按 文档排名 × 关键词覆盖 打分、去重后在token预算内装填，保证提示词有界且相关
+"""
+import math
+import re
+from typing import Any, Dict, List, Optional
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from src.config import RAG_CONFIG
+from src.models import KnowledgeItem, KnowledgeCategory, KnowledgeDetail
+from src.retrieval import hybrid_search
+from src.search_index import search_index, CJK_CHARS, TOKEN_PATTERN, normalize_text
+from src.segmenter import segmenter
+
+CJK_CHAR = re.compile(r"[" + CJK_CHARS + "]")
+LATIN_WORD = re.compile(r"[A-Za-z0-9]+")
+
+# 段落切分的句末标点
+SENTENCE_END = re.compile(r"(?<=[。！？；!?;])")
+
+
+def estimate_tokens(text: str) -> int:
+    """估算token数：中文约每字一个token，拉丁单词约每4个字符一个token，其余符号按4个一个计"""
+    if not text:
+        return 0
+    cjk = len(CJK_CHAR.findall(text))
+    words = LATIN_WORD.findall(text)
+    latin = sum(max(1, math.ceil(len(word) / 4)) for word in words)
+    others = len(text) - cjk - sum(len(word) for word in words)
+    return cjk + latin + math.ceil(max(others, 0) / 4)
+
+
+def split_passages(text: Optional[str], max_chars: int) -> List[str]:
+    """按段落切分正文，超长段落再按句子合并到不超过 max_chars"""
+    passages = []
+    for paragraph in (text or "").split("\n"):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= max_chars:
+            passages.append(paragraph)
+            continue
+
+        current = ""
+        for sentence in SENTENCE_END.split(paragraph):
+            if not sentence:
+                continue
+            if current and len(current) + len(sentence) > max_chars:
+                passages.append(current)
+                current = ""
+            # 单句超长时硬切
+            while len(sentence) > max_chars:
+                passages.append(sentence[:max_chars])
+                sentence = sentence[max_chars:]
+            current += sentence
+        if current:
+            passages.append(current)
+    return passages
+
+
+def _dedupe_key(text: str) -> str:
+    """去重键：忽略大小写、全半角、标点和空白"""
+    return "".join(TOKEN_PATTERN.findall(normalize_text(text)))
+
+
+class Passage:
+    """候选段落"""
+
+    __slots__ = ("item_id", "source", "text", "tokens", "score")
+
+    def __init__(self, item_id: str, source: str, text: str, score: float):
+        self.item_id = item_id
+        # 段落来源：description / content / detail
+        self.source = source
+        self.text = text
+        self.tokens = estimate_tokens(text)
+        self.score = score
+
+
+class RAGContext:
+    """构建好的知识上下文"""
+
+    def __init__(
+        self,
+        text: str,
+        item_ids: List[str],
+        sources: List[Dict[str, Any]],
+        passages: List[Passage],
+        tokens: int,
+        candidates: int
+    ):
+        self.text = text
+        # 被引用（至少选入一个段落）的知识项及其来源记录，按检索排名排序
+        self.item_ids = item_ids
+        self.sources = sources
+        self.passages = passages
+        self.tokens = tokens
+        # 检索到的候选知识项数
+        self.candidates = candidates
+
+
+class Candidate:
+    """检索到的候选知识项"""
+
+    def __init__(
+        self,
+        item: Dict[str, Any],
+        details: List[Dict[str, Any]],
+        rank: int,
+        category_title: Optional[str] = None,
+        score: Optional[float] = None
+    ):
+        self.item = item
+        self.details = details
+        self.rank = rank
+        self.category_title = category_title
+        # 检索分数（混合检索为融合分数，数据库检索为关键词覆盖数）
+        self.score = score
+
+    def source(self) -> Dict[str, Any]:
+        """引用来源记录"""
+        links = [
+            {"id": detail.get("id"), "title": detail.get("title"), "external_link": detail["external_link"]}
+            for detail in self.details if detail.get("external_link")
+        ]
+        return {
+            "type": "knowledge",
+            "id": self.item["id"],
+            "title": self.item["title"],
+            "category_id": self.item.get("category_id"),
+            "category": self.category_title,
+            "score": round(self.score, 4) if self.score is not None else None,
+            "external_link": links[0]["external_link"] if links else None,
+            "details": links,
+        }
+
+
+def _keyword_coverage(text: str, keywords: List[str]) -> int:
+    """段落覆盖的关键词数量"""
+    normalized = normalize_text(text)
+    return sum(1 for keyword in keywords if keyword in normalized)
+
+
+def _candidate_passages(candidate: Candidate, keywords: List[str], max_chars: int) -> List[Passage]:
+    """生成候选知识项的全部段落并打分"""
+    item = candidate.item
+    # 排名越靠前权重越高
+    weight = 1.0 / (1 + candidate.rank)
+    texts = []
+    if item.get("description"):
+        texts.append(("description", item["description"]))
+    texts.extend(("content", text) for text in split_passages(item.get("content"), max_chars))
+    for detail in candidate.details:
+        text = f"{detail.get('title') or ''}: {detail.get('description') or ''}".strip(": ")
+        texts.extend(("detail", chunk) for chunk in split_passages(text, max_chars))
+
+    return [
+        Passage(item["id"], source, text, weight * (1 + _keyword_coverage(text, keywords)))
+        for source, text in texts
+    ]
+
+
+def pack_context(
+    candidates: List[Candidate],
+    keywords: List[str],
+    token_budget: Optional[int] = None,
+    max_chars: Optional[int] = None,
+    max_passages_per_item: Optional[int] = None
+) -> RAGContext:
+    """按分数从高到低装填段落，直到用完token预算；同一知识项的段落合并在其标题下输出"""
+    token_budget = token_budget or RAG_CONFIG["token_budget"]
+    max_chars = max_chars or RAG_CONFIG["passage_max_chars"]
+    max_passages_per_item = max_passages_per_item or RAG_CONFIG["max_passages_per_item"]
+
+    passages: List[Passage] = []
+    for candidate in candidates:
+        passages.extend(_candidate_passages(candidate, keywords, max_chars))
+    passages.sort(key=lambda passage: -passage.score)
+
+    by_id = {candidate.item["id"]: candidate for candidate in candidates}
+    selected: Dict[str, List[Passage]] = {}
+    seen_keys: List[str] = []
+    used = 0
+    for passage in passages:
+        chosen = selected.get(passage.item_id, [])
+        if len(chosen) >= max_passages_per_item:
+            continue
+        key = _dedupe_key(passage.text)
+        # 与已选段落重复或被其包含时跳过
+        if not key or any(key in seen for seen in seen_keys):
+            continue
+
+        cost = passage.tokens
+        if not chosen:
+            cost += estimate_tokens(f"知识项: {by_id[passage.item_id].item['title']}")
+        if used + cost > token_budget:
+            continue
+
+        used += cost
+        seen_keys.append(key)
+        selected.setdefault(passage.item_id, []).append(passage)
+
+    ordered = [candidate for candidate in candidates if candidate.item["id"] in selected]
+    sections = []
+    for candidate in ordered:
+        body = "\n".join(passage.text for passage in selected[candidate.item["id"]])
+        sections.append(f"知识项: {candidate.item['title']}\n{body}")
+
+    return RAGContext(
+        text="\n\n".join(sections),
+        item_ids=[candidate.item["id"] for candidate in ordered],
+        sources=[candidate.source() for candidate in ordered],
+        passages=[passage for candidate in ordered for passage in selected[candidate.item["id"]]],
+        tokens=used,
+        candidates=len(candidates)
+    )
+
+
+async def _retrieve_from_index(question: str, keywords: List[str], limit: int) -> List[Candidate]:
+    """从内存索引混合检索（问句不要求命中全部词项）"""
+    result = await hybrid_search(
+        question,
+        limit=limit,
+        lexical_query=" ".join(keywords) or question,
+        require_all=False
+    )
+    return [
+        Candidate(
+            hit.doc.to_item(),
+            search_index.item_details(hit.doc.id),
+            rank,
+            category_title=search_index.category_title(hit.doc.category_id),
+            score=hit.score
+        )
+        for rank, hit in enumerate(result.hits)
+    ]
+
+
+def _retrieve_from_database(db: Session, keywords: List[str], limit: int) -> List[Candidate]:
+    """索引不可用时从数据库检索：一次查询取回命中任一关键词的知识项，按命中关键词数排序"""
+    if not keywords:
+        return []
+
+    conditions = [
+        column.contains(keyword)
+        for keyword in keywords
+        for column in (KnowledgeItem.title, KnowledgeItem.description, KnowledgeItem.content)
+    ]
+    rows = db.query(KnowledgeItem, KnowledgeCategory.title).join(
+        KnowledgeCategory, KnowledgeCategory.id == KnowledgeItem.category_id
+    ).filter(
+        KnowledgeCategory.is_active == True,
+        or_(*conditions)
+    ).order_by(KnowledgeItem.sort_order).limit(limit * 5).all()
+
+    def coverage(item: KnowledgeItem) -> int:
+        # 标题命中的关键词计双倍
+        return (2 * _keyword_coverage(item.title, keywords)
+                + _keyword_coverage(f"{item.description or ''} {item.content or ''}", keywords))
+
+    ranked = sorted(((item, title, coverage(item)) for item, title in rows), key=lambda row: -row[2])[:limit]
+    if not ranked:
+        return []
+    items = [item for item, _, _ in ranked]
+
+    details: Dict[str, List[Dict[str, Any]]] = {}
+    for detail in db.query(KnowledgeDetail).filter(
+        KnowledgeDetail.knowledge_id.in_([item.id for item in items])
+    ).order_by(KnowledgeDetail.sort_order):
+        details.setdefault(detail.knowledge_id, []).append({
+            "id": detail.id,
+            "title": detail.title,
+            "description": detail.description,
+            "external_link": detail.external_link,
+        })
+
+    return [
+        Candidate({
+            "id": item.id,
+            "category_id": item.category_id,
+            "title": item.title,
+            "description": item.description,
+            "content": item.content,
+        }, details.get(item.id, []), rank, category_title=category_title, score=float(score))
+        for rank, (item, category_title, score) in enumerate(ranked)
+    ]
+
+
+async def build_context(db: Session, question: str, token_budget: Optional[int] = None) -> RAGContext:
+    """为问题构建知识上下文"""
+    keywords = segmenter.extract_keywords(question)
+    limit = RAG_CONFIG["candidates"]
+
+    if search_index.ready:
+        candidates = await _retrieve_from_index(question, keywords, limit)
+    else:
+        candidates = _retrieve_from_database(db, keywords, limit)
+
+    return pack_context(candidates, [normalize_text(keyword) for keyword in keywords], token_budget)
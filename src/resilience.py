@@ -0,0 +1,302 @@
+"""
+上游调用弹性模块
+- 重试：可重试的失败（限流、5xx、网络错误）按带抖动的指数退避重试，总耗时（含进行中的尝试）不超过期限
+- 对冲：单次尝试超过近期成功耗时的p95仍未返回时，再发起一个并行请求，采用先成功的结果；只在熔断器闭合时对冲
+- 熔断：滑动窗口内失败率过高时断开，冷却期内直接失败；冷却后放行一个探测请求，成功则恢复
+每次尝试的耗时都被记录，对冲延迟随上游的实际表现自适应
+"""
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(Exception):
+    """熔断中，拒绝调用"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"熔断中，{retry_after:.1f}秒后重试")
+        self.retry_after = retry_after
+
+
+class DeadlineExceededError(Exception):
+    """超过总期限仍未得到结果"""
+
+    def __init__(self, deadline: float):
+        super().__init__(f"上游调用超过{deadline:.1f}秒期限")
+        self.deadline = deadline
+
+
+class LatencyTracker:
+    """最近若干次尝试的耗时（秒）"""
+
+    def __init__(self, size: int = 200):
+        self._samples: Deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+class CircuitBreaker:
+    """基于滑动窗口失败率的熔断器"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, window: int, min_requests: int, error_rate: float, open_seconds: float):
+        self.window = window
+        self.min_requests = min_requests
+        self.error_rate = error_rate
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self._probing = False
+        self._lock = threading.Lock()
+        self.opens = 0
+        self.rejected = 0
+
+    def before_call(self):
+        """调用前检查，熔断中抛出 CircuitOpenError"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            remaining = self.opened_at + self.open_seconds - time.monotonic()
+            if self.state == self.OPEN and remaining <= 0:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._probing:
+                # 半开状态只放行一个探测请求
+                self._probing = True
+                return
+            self.rejected += 1
+            raise CircuitOpenError(max(remaining, 1.0))
+
+    def record(self, failed: bool):
+        """记录一次调用结果"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probing = False
+                if failed:
+                    self._open()
+                else:
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+                return
+            if self.state == self.OPEN:
+                return
+
+            self._outcomes.append(failed)
+            failures = sum(self._outcomes)
+            if len(self._outcomes) >= self.min_requests and failures / len(self._outcomes) >= self.error_rate:
+                self._open()
+
+    def abort(self):
+        """调用被取消或异常退出（结果未知），释放半开状态的探测名额"""
+        with self._lock:
+            self._probing = False
+
+    def _open(self):
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self._outcomes.clear()
+        self.opens += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "window_requests": len(self._outcomes),
+                "window_failures": sum(self._outcomes),
+                "opens": self.opens,
+                "rejected": self.rejected,
+            }
+
+
+class ResilientCaller(Generic[T]):
+    """重试 + 对冲 + 熔断"""
+
+    def __init__(
+        self,
+        breaker: CircuitBreaker,
+        max_attempts: int = 3,
+        base_delay: float = 0.2,
+        max_delay: float = 2.0,
+        deadline: float = 30.0,
+        hedge: bool = False,
+        hedge_quantile: float = 0.95,
+        hedge_min_delay: float = 0.5,
+        hedge_min_samples: int = 20
+    ):
+        self.breaker = breaker
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.latency = LatencyTracker()
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.attempts = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.timeouts = 0
+
+    def count(self, field: str):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def backoff(self, attempt: int) -> float:
+        """第 attempt 次重试前的等待时间（full jitter）"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def hedge_delay(self) -> Optional[float]:
+        """对冲延迟：近期成功耗时的分位数，样本不足时不对冲"""
+        if not self.hedge or len(self.latency) < self.hedge_min_samples:
+            return None
+        return max(self.hedge_min_delay, self.latency.percentile(self.hedge_quantile))
+
+    async def _attempt(
+        self,
+        fn: Callable[[], Awaitable[T]],
+        is_success: Callable[[T], bool],
+        is_retriable: Callable[[T], bool],
+        hedge: bool = False
+    ) -> T:
+        """
+        执行一次尝试并记录耗时和熔断结果（被取消的尝试不计入）
+        对冲请求只记录成功，失败由主请求记录，一次尝试至多计入一次失败
+        """
+        self.count("attempts")
+        start = time.monotonic()
+        try:
+            result = await fn()
+        except BaseException:
+            if not hedge:
+                self.breaker.abort()
+            raise
+        if is_success(result):
+            self.latency.record(time.monotonic() - start)
+            self.breaker.record(False)
+        elif not hedge:
+            self.breaker.record(is_retriable(result))
+        return result
+
+    async def _hedged(
+        self,
+        fn: Callable[[], Awaitable[T]],
+        is_success: Callable[[T], bool],
+        is_retriable: Callable[[T], bool]
+    ) -> T:
+        """
+        一次（可能对冲的）尝试：主请求超过对冲延迟仍未返回时发起第二个请求，采用先成功的结果
+        熔断器不是闭合状态时不对冲（半开状态只允许一个探测请求）
+        """
+        delay = self.hedge_delay()
+        if delay is None or self.breaker.state != CircuitBreaker.CLOSED:
+            return await self._attempt(fn, is_success, is_retriable)
+
+        primary = asyncio.ensure_future(self._attempt(fn, is_success, is_retriable))
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and self.breaker.state == CircuitBreaker.CLOSED:
+                self.count("hedges")
+                tasks.append(asyncio.ensure_future(self._attempt(fn, is_success, is_retriable, hedge=True)))
+
+            result = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    if is_success(result):
+                        if task is not primary:
+                            self.count("hedge_wins")
+                        return result
+            # 都失败时返回最后完成的结果
+            return result
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def call(
+        self,
+        fn: Callable[[], Awaitable[T]],
+        is_success: Callable[[T], bool],
+        is_retriable: Callable[[T], bool]
+    ) -> T:
+        """
+        调用 fn 直到成功、遇到不可重试的失败、用完尝试次数或超过期限；
+        每次尝试以剩余期限为超时，超时计为一次失败，返回上一次的结果，没有结果时抛出 DeadlineExceededError；
+        熔断中抛出 CircuitOpenError（重试过程中熔断时返回最后一次的结果）
+        """
+        self.count("calls")
+        self.breaker.before_call()
+        start = time.monotonic()
+        attempt = 0
+        result = None
+        while True:
+            remaining = self.deadline - (time.monotonic() - start)
+            try:
+                result = await asyncio.wait_for(self._hedged(fn, is_success, is_retriable), remaining)
+            except asyncio.TimeoutError:
+                self.count("timeouts")
+                self.breaker.record(True)
+                if attempt:
+                    return result
+                raise DeadlineExceededError(self.deadline)
+            attempt += 1
+            if is_success(result) or not is_retriable(result) or attempt >= self.max_attempts:
+                return result
+
+            delay = self.backoff(attempt - 1)
+            if time.monotonic() - start + delay >= self.deadline:
+                return result
+            await asyncio.sleep(delay)
+            try:
+                self.breaker.before_call()
+            except CircuitOpenError:
+                return result
+            self.count("retries")
+
+    def stats(self) -> Dict[str, Any]:
+        p50 = self.latency.percentile(0.5)
+        p95 = self.latency.percentile(0.95)
+        delay = self.hedge_delay()
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "attempts": self.attempts,
+                "retries": self.retries,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "timeouts": self.timeouts,
+                "hedge_enabled": self.hedge,
+                "hedge_delay_ms": round(delay * 1000, 2) if delay is not None else None,
+                "latency_samples": len(self.latency),
+                "p50_ms": round(p50 * 1000, 2) if p50 is not None else None,
+                "p95_ms": round(p95 * 1000, 2) if p95 is not None else None,
+                "breaker": self.breaker.stats(),
+            }
@@ -0,0 +1,212 @@
+"""
+混合检索模块
+并发执行关键词（BM25F）与向量检索，使用倒数排名融合（RRF）或加权分数合并结果
+"""
+import asyncio
+import logging
+import time
+from typing import List, Dict, Any, Optional, Callable, Tuple
+from src.config import SEARCH_CONFIG
+from src.search_index import search_index, IndexedDocument
+from src.vector_index import vector_index
+
+logger = logging.getLogger(__name__)
+
+
+class RetrievalHit:
+    """融合后的检索结果"""
+
+    __slots__ = ("doc", "score", "scores", "ranks")
+
+    def __init__(self, doc: IndexedDocument):
+        self.doc = doc
+        self.score = 0.0
+        # 各检索器的原始分数和排名（调试用）
+        self.scores: Dict[str, float] = {}
+        self.ranks: Dict[str, int] = {}
+
+    @property
+    def item_id(self) -> str:
+        return self.doc.id
+
+
+class HybridResult:
+    """混合检索结果"""
+
+    def __init__(self, hits: List[RetrievalHit], timings_ms: Dict[str, float], skipped: List[str]):
+        self.hits = hits
+        # 各阶段耗时
+        self.timings_ms = timings_ms
+        # 超出延迟预算或不可用而被跳过的检索器
+        self.skipped = skipped
+
+
+def _lexical(query: str, limit: int, require_all: bool, predicate) -> List[Tuple[str, float]]:
+    """关键词检索"""
+    hits = search_index.search(
+        query,
+        limit=limit,
+        require_all=require_all,
+        predicate=(lambda doc: predicate(doc.id)) if predicate else None
+    )
+    return [(doc.id, score) for doc, score in hits]
+
+
+def _semantic(query: str, limit: int, predicate) -> List[Tuple[str, float]]:
+    """向量检索"""
+    return vector_index.search(
+        query,
+        limit=limit,
+        predicate=predicate,
+        min_score=SEARCH_CONFIG["hybrid"]["min_semantic_score"]
+    )
+
+
+def fuse(
+    ranked_lists: Dict[str, List[Tuple[str, float]]],
+    method: str = "rrf",
+    weights: Optional[Dict[str, float]] = None
+) -> List[Tuple[str, float, Dict[str, float], Dict[str, int]]]:
+    """合并多路检索结果，返回 (知识项ID, 融合分数, 各路分数, 各路排名)"""
+    config = SEARCH_CONFIG["hybrid"]
+    weights = weights or config["weights"]
+    rrf_k = config["rrf_k"]
+
+    fused: Dict[str, List[Any]] = {}
+    for name, hits in ranked_lists.items():
+        if not hits:
+            continue
+        weight = weights.get(name, 1.0)
+        top_score = hits[0][1] or 1.0
+        for rank, (item_id, score) in enumerate(hits, 1):
+            entry = fused.setdefault(item_id, [0.0, {}, {}])
+            if method == "weighted":
+                # 各路分数按最高分归一化后加权
+                entry[0] += weight * score / top_score
+            else:
+                entry[0] += weight / (rrf_k + rank)
+            entry[1][name] = score
+            entry[2][name] = rank
+
+    merged = [(item_id, value[0], value[1], value[2]) for item_id, value in fused.items()]
+    merged.sort(key=lambda entry: entry[1], reverse=True)
+    return merged
+
+
+async def hybrid_search(
+    query: str,
+    limit: int = 10,
+    lexical_query: Optional[str] = None,
+    require_all: bool = True,
+    method: Optional[str] = None,
+    weights: Optional[Dict[str, float]] = None,
+    budget_ms: Optional[float] = None,
+    predicate: Optional[Callable[[str], bool]] = None
+) -> HybridResult:
+    """
+    混合检索
+    lexical_query 可为关键词检索单独指定查询（如提取后的关键词），
+    超出延迟预算的检索器会被跳过，只使用已完成的结果
+    """
+    config = SEARCH_CONFIG["hybrid"]
+    method = method or config["method"]
+    budget_ms = budget_ms if budget_ms is not None else config["budget_ms"]
+    candidates = max(limit, config["candidates"])
+    predicate = predicate or search_index.is_item_active
+
+    start_time = time.perf_counter()
+    timings: Dict[str, float] = {}
+
+    async def timed(name: str, func, *args):
+        stage_start = time.perf_counter()
+        result = await asyncio.to_thread(func, *args)
+        timings[name] = round((time.perf_counter() - stage_start) * 1000, 3)
+        return result
+
+    tasks = {}
+    if search_index.ready:
+        tasks["lexical"] = asyncio.create_task(
+            timed("lexical", _lexical, lexical_query or query, candidates, require_all, predicate)
+        )
+    if vector_index.ready:
+        tasks["semantic"] = asyncio.create_task(timed("semantic", _semantic, query, candidates, predicate))
+
+    skipped = [name for name in ("lexical", "semantic") if name not in tasks]
+    ranked_lists: Dict[str, List[Tuple[str, float]]] = {}
+    if tasks:
+        done, pending = await asyncio.wait(tasks.values(), timeout=budget_ms / 1000)
+        for task in pending:
+            task.cancel()
+        for name, task in tasks.items():
+            if task in done and task.exception() is None:
+                ranked_lists[name] = task.result()
+            else:
+                if task in done:
+                    logger.warning(f"{name} 检索失败: {task.exception()}")
+                skipped.append(name)
+
+    hits = _fused_hits(ranked_lists, limit, method, weights, timings)
+    timings["total"] = round((time.perf_counter() - start_time) * 1000, 3)
+
+    return HybridResult(hits, timings, skipped)
+
+
+def hybrid_search_sync(
+    query: str,
+    limit: int = 10,
+    require_all: bool = True,
+    method: Optional[str] = None,
+    weights: Optional[Dict[str, float]] = None,
+    predicate: Optional[Callable[[str], bool]] = None
+) -> HybridResult:
+    """
+    同步混合检索（在当前线程依次执行两路检索，不受延迟预算限制）
+    用于在索引快照内执行的批量检索
+    """
+    config = SEARCH_CONFIG["hybrid"]
+    method = method or config["method"]
+    candidates = max(limit, config["candidates"])
+    predicate = predicate or search_index.is_item_active
+
+    start_time = time.perf_counter()
+    timings: Dict[str, float] = {}
+    ranked_lists: Dict[str, List[Tuple[str, float]]] = {}
+    skipped = []
+    for name, ready, func, args in (
+        ("lexical", search_index.ready, _lexical, (query, candidates, require_all, predicate)),
+        ("semantic", vector_index.ready, _semantic, (query, candidates, predicate)),
+    ):
+        if not ready:
+            skipped.append(name)
+            continue
+        stage_start = time.perf_counter()
+        ranked_lists[name] = func(*args)
+        timings[name] = round((time.perf_counter() - stage_start) * 1000, 3)
+
+    hits = _fused_hits(ranked_lists, limit, method, weights, timings)
+    timings["total"] = round((time.perf_counter() - start_time) * 1000, 3)
+
+    return HybridResult(hits, timings, skipped)
+
+
+def _fused_hits(
+    ranked_lists: Dict[str, List[Tuple[str, float]]],
+    limit: int,
+    method: str,
+    weights: Optional[Dict[str, float]],
+    timings: Dict[str, float]
+) -> List[RetrievalHit]:
+    """融合多路结果并取出对应文档"""
+    fusion_start = time.perf_counter()
+    hits = []
+    for item_id, score, scores, ranks in fuse(ranked_lists, method, weights)[:limit]:
+        doc = search_index.get_document(item_id)
+        if doc is None:
+            continue
+        hit = RetrievalHit(doc)
+        hit.score = score
+        hit.scores = scores
+        hit.ranks = ranks
+        hits.append(hit)
+    timings["fusion"] = round((time.perf_counter() - fusion_start) * 1000, 3)
+    return hits
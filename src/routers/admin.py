@@ -1,16 +1,28 @@
 """
 管理员相关路由
 """
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
+import asyncio
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 from datetime import datetime, timedelta
 from src.database import get_db
-from src.models import User, KnowledgeItem, ChatHistory
+from src.models import User, KnowledgeItem, ChatHistory, SearchLog
 from src.schemas import UserCreate, UserResponse, SystemStats
 from src.auth import get_current_admin_user, get_password_hash
 from src.cache import clear_all_cache
+from src.search_index import search_index
+from src.index_sync import rebuild_search_indexes
+from src.search_log import search_logger
+from src.vector_index import vector_index
+from src.fuzzy import fuzzy_corrector
+from src.segmenter import segmenter
+from src.pagination import paginate_query
+from src.ai_service import ai_service
+from src.answer_cache import answer_cache
+from src.chat_log import chat_logger
+from src.chat_memory import chat_memory
 
 router = APIRouter(prefix="/admin", tags=["管理"])
 
@@ -18,14 +30,22 @@ router = APIRouter(prefix="/admin", tags=["管理"])
 @router.get("/users", response_model=List[UserResponse])
 async def get_users(
     request: Request,
-    skip: int = Query(default=0, ge=0, description="跳过数量"),
+    response: Response,
+    cursor: Optional[str] = Query(None, description="分页游标"),
     limit: int = Query(default=100, ge=1, le=1000, description="返回数量"),
     db: Session = Depends(get_db)
 ):
-    """获取用户列表（管理员）"""
+    """获取用户列表（管理员），翻页游标通过 X-Next-Cursor / X-Prev-Cursor 响应头返回"""
     current_user = get_current_admin_user(request)
-    users = db.query(User).offset(skip).limit(limit).all()
-    return [UserResponse.from_orm(user) for user in users]
+    page = paginate_query(
+        db.query(User),
+        [User.created_at, User.id],
+        lambda user: (user.created_at, user.id),
+        limit,
+        cursor
+    )
+    response.headers.update(page.headers())
+    return [UserResponse.from_orm(user) for user in page.items]
 
 
 @router.post("/users", response_model=UserResponse)
@@ -148,8 +168,8 @@ async def get_system_stats(
     # 总聊天会话数
     total_chat_sessions = db.query(ChatHistory.session_id).distinct().count()
     
-    # 总搜索次数（SearchLog已删除，设为0）
-    total_searches = 0
+    # 总搜索次数（由搜索日志记录器在内存中统计）
+    total_searches = search_logger.total_searches
     
     # 今日活跃用户数
     today = datetime.utcnow().date()
@@ -189,8 +209,10 @@ async def get_daily_stats(
             func.date(ChatHistory.created_at) == date
         ).count()
         
-        # 当日搜索次数（SearchLog已删除，设为0）
-        searches = 0
+        # 当日搜索次数
+        searches = db.query(SearchLog).filter(
+            func.date(SearchLog.created_at) == date
+        ).count()
         
         stats.append({
             "date": date.isoformat(),
@@ -233,30 +255,89 @@ async def clear_cache(
     return {"message": message}
 
 
+@router.get("/search/index")
+async def get_search_index_stats(
+    request: Request
+):
+    """获取搜索索引状态（管理员）"""
+    current_user = get_current_admin_user(request)
+    return {
+        **search_index.stats(),
+        "vector_index": vector_index.stats(),
+        "fuzzy": fuzzy_corrector.stats(),
+        "segmenter": segmenter.stats(),
+        "search_log": search_logger.stats()
+    }
+
+
+@router.post("/search/index/rebuild")
+async def rebuild_search_index(
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    """全量重建搜索索引（管理员）"""
+    current_user = get_current_admin_user(request)
+    try:
+        # 在线程池中重建，不阻塞事件循环
+        result = await asyncio.to_thread(rebuild_search_indexes, db)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"重建搜索索引失败: {str(e)}"
+        )
+    
+    return {"message": "搜索索引已重建", **result}
+
+
+@router.get("/ai/stats")
+async def get_ai_stats(
+    request: Request
+):
+    """获取AI服务状态，包括HTTP连接池、准入排队、重试熔断、问答缓存和会话记忆命中率、聊天记录写入队列（管理员）"""
+    current_user = get_current_admin_user(request)
+    return {
+        "http_pool": ai_service.stats(),
+        "singleflight": ai_service.flights.stats(),
+        "admission": ai_service.admission.stats(),
+        "resilience": ai_service.resilience.stats(),
+        "answer_cache": answer_cache.stats(),
+        "chat_memory": chat_memory.stats(),
+        "chat_log": chat_logger.stats()
+    }
+
+
 @router.get("/logs/chat")
 async def get_chat_logs(
     request: Request,
-    skip: int = Query(default=0, ge=0, description="跳过数量"),
+    cursor: Optional[str] = Query(None, description="分页游标"),
     limit: int = Query(default=100, ge=1, le=1000, description="返回数量"),
     db: Session = Depends(get_db)
 ):
     """获取聊天日志（管理员）"""
     current_user = get_current_admin_user(request)
-    logs = db.query(ChatHistory).join(User).order_by(
-        ChatHistory.created_at.desc()
-    ).offset(skip).limit(limit).all()
+    page = paginate_query(
+        db.query(ChatHistory, User.username).join(User, ChatHistory.user_id == User.id),
+        [ChatHistory.created_at, ChatHistory.id],
+        lambda row: (row[0].created_at, row[0].id),
+        limit,
+        cursor,
+        descending=True
+    )
+    logs = page.items
     
     return {
+        "next_cursor": page.next_cursor,
+        "prev_cursor": page.prev_cursor,
         "logs": [
             {
                 "id": log.id,
-                "user": log.user.username if log.user else None,
+                "user": username,
                 "session_id": log.session_id,
                 "message_type": log.message_type,
                 "content": log.content[:100] + "..." if len(log.content) > 100 else log.content,
                 "response_time_ms": log.response_time_ms,
                 "created_at": log.created_at
             }
-            for log in logs
+            for log, username in logs
         ]
     }
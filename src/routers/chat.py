@@ -1,16 +1,24 @@
 """
 聊天相关路由
 """
+import json
+import math
 import time
 import uuid
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from sqlalchemy.orm import Session
 from src.database import get_db
-from src.models import ChatHistory, User, KnowledgeItem, KnowledgeCategory
+from src.models import ChatHistory
 from src.schemas import ChatMessage, ChatResponse, ChatHistoryResponse
 from src.ai_service import ai_service
-from src.cache import get_cached_chat_session, set_cached_chat_session
+from src.answer_cache import answer_cache
+from src.chat_log import chat_logger
+from src.chat_memory import SessionMemory, chat_memory
+from src.rag import build_context
+from src.pagination import Page, paginate_query
 
 router = APIRouter(prefix="/chat", tags=["聊天"])
 
@@ -31,72 +39,76 @@ async def send_chat_message(
     # 生成或使用会话ID
     session_id = message_data.session_id or str(uuid.uuid4())
     
-    # 获取聊天历史
-    chat_history = get_chat_history_for_session(db, session_id, current_user_id)
+    # 获取会话记忆
+    memory = chat_memory.load(db, session_id, current_user_id)
     
     # 构建知识上下文
-    knowledge_context = build_knowledge_context(db, message_data.message)
+    context = await build_context(db, message_data.message)
+    knowledge_context = context.text
     
-    # 调用AI服务生成回答
-    ai_response = await ai_service.generate_answer(
-        question=message_data.message,
-        knowledge_context=knowledge_context,
-        chat_history=chat_history
-    )
-    
-    if not ai_response.get("success"):
-        raise HTTPException(
-            status_code=500,
-            detail=f"AI服务错误: {ai_response.get('error', '未知错误')}"
-        )
+    # 首轮问题（没有会话历史）可直接使用缓存的回答
+    cache_key = answer_cache.make_key(message_data.message, knowledge_context) if memory.empty else None
+    cached = answer_cache.get(cache_key) if cache_key else None
     
-    # 保存用户消息
-    user_message = ChatHistory(
-        user_id=current_user_id,
-        session_id=session_id,
-        message_type="user",
-        content=message_data.message
-    )
-    db.add(user_message)
+    if cached:
+        ai_response = {
+            "success": True,
+            "response": cached["response"],
+            "response_time_ms": int((time.time() - start_time) * 1000)
+        }
+    else:
+        # 调用AI服务生成回答（受并发和每用户速率限制，繁忙时返回429）
+        async with ai_service.admission.slot(current_user_id):
+            ai_response = await ai_service.generate_answer(
+                question=message_data.message,
+                knowledge_context=knowledge_context,
+                chat_history=memory.history(),
+                summary=memory.summary_text()
+            )
+        
+        if not ai_response.get("success"):
+            # 熔断中快速失败，提示客户端稍后重试
+            if ai_response.get("retry_after"):
+                raise HTTPException(
+                    status_code=503,
+                    detail=f"AI服务错误: {ai_response['error']}",
+                    headers={"Retry-After": str(math.ceil(ai_response["retry_after"]))}
+                )
+            raise HTTPException(
+                status_code=500,
+                detail=f"AI服务错误: {ai_response.get('error', '未知错误')}"
+            )
+        
+        if cache_key:
+            answer_cache.set(cache_key, ai_response["response"], ai_response["response_time_ms"], context.item_ids)
     
-    # 保存AI回复
-    ai_message = ChatHistory(
-        user_id=current_user_id,
-        session_id=session_id,
-        message_type="assistant",
-        content=ai_response["response"],
-        response_time_ms=ai_response["response_time_ms"]
+    save_chat_exchange(
+        db, current_user_id, session_id, memory, message_data.message,
+        ai_response["response"], ai_response["response_time_ms"]
     )
-    db.add(ai_message)
-    
-    db.commit()
     
     # 构建响应
     response = ChatResponse(
         response=ai_response["response"],
         session_id=session_id,
         response_time_ms=ai_response["response_time_ms"],
-        sources=get_knowledge_sources(db, knowledge_context)
+        sources=context.sources,
+        cached=cached is not None
     )
     
-    # 缓存会话
-    set_cached_chat_session(session_id, {
-        "user_id": current_user_id,
-        "last_message": message_data.message,
-        "last_response": ai_response["response"]
-    })
-    
     return response
 
 
 @router.get("/history", response_model=List[ChatHistoryResponse])
 async def get_chat_history(
     request: Request,
+    response: Response,
     session_id: Optional[str] = Query(None, description="会话ID"),
+    cursor: Optional[str] = Query(None, description="分页游标"),
     limit: int = Query(default=50, ge=1, le=200, description="消息数量限制"),
     db: Session = Depends(get_db)
 ):
-    """获取聊天历史"""
+    """获取聊天历史（默认最近的消息，翻页游标通过响应头返回）"""
     # 从中间件获取用户信息
     user_info = request.state.user
     current_user_id = user_info['id']
@@ -106,10 +118,19 @@ async def get_chat_history(
     if session_id:
         query = query.filter(ChatHistory.session_id == session_id)
     
-    messages = query.order_by(ChatHistory.created_at.desc()).limit(limit).all()
+    # 按时间倒序分页：next 游标指向更早的消息
+    page = paginate_query(
+        query,
+        [ChatHistory.created_at, ChatHistory.id],
+        lambda msg: (msg.created_at, msg.id),
+        limit,
+        cursor,
+        descending=True
+    )
     
-    # 按时间正序返回
-    messages.reverse()
+    # 本页按时间正序返回，游标方向随之对调：更早的消息为 X-Prev-Cursor
+    messages = list(reversed(page.items))
+    response.headers.update(Page(messages, page.prev_cursor, page.next_cursor).headers())
     
     return [ChatHistoryResponse.from_orm(msg) for msg in messages]
 
@@ -166,80 +187,33 @@ async def delete_chat_session(
     user_info = request.state.user
     current_user_id = user_info['id']
     
-    # 删除会话中的所有消息
+    # 删除会话中的所有消息（先刷写尚未落库的记录）
+    await chat_logger.flush()
     deleted_count = db.query(ChatHistory).filter(
         ChatHistory.session_id == session_id,
         ChatHistory.user_id == current_user_id
     ).delete()
     
     db.commit()
+    chat_memory.clear(session_id)
     
     return {"message": f"删除了 {deleted_count} 条消息"}
 
 
-def get_chat_history_for_session(db: Session, session_id: str, user_id: str) -> List[dict]:
-    """获取会话的聊天历史"""
-    messages = db.query(ChatHistory).filter(
-        ChatHistory.session_id == session_id,
-        ChatHistory.user_id == user_id
-    ).order_by(ChatHistory.created_at).limit(10).all()  # 限制历史消息数量
-    
-    return [
-        {
-            "role": "user" if msg.message_type == "user" else "assistant",
-            "content": msg.content
-        }
-        for msg in messages
-    ]
-
-
-def build_knowledge_context(db: Session, question: str) -> str:
-    """构建知识上下文"""
-    # 简单的关键词匹配来查找相关知识
-    keywords = ai_service.extract_keywords(question)
-    
-    context_parts = []
-    
-    for keyword in keywords[:3]:  # 限制关键词数量
-        # 搜索知识项
-        items = db.query(KnowledgeItem).join(KnowledgeCategory).filter(
-            KnowledgeItem.title.contains(keyword),
-            KnowledgeCategory.is_active == True
-        ).limit(2).all()
-        
-        for item in items:
-            context_parts.append(f"知识项: {item.title}\n{item.description or ''}")
+def save_chat_exchange(
+    db: Session,
+    user_id: str,
+    session_id: str,
+    memory: SessionMemory,
+    question: str,
+    answer: str,
+    response_time_ms: int
+):
+    """保存一问一答两条聊天记录（批量异步落库）并更新会话记忆"""
+    chat_logger.record_exchange(db, user_id, session_id, question, answer, response_time_ms)
     
-    return "\n\n".join(context_parts) if context_parts else ""
-
-
-def get_knowledge_sources(db: Session, knowledge_context: str) -> List[dict]:
-    """获取知识来源"""
-    sources = []
-    
-    if not knowledge_context:
-        return sources
-    
-    # 从上下文中提取知识项标题
-    lines = knowledge_context.split('\n')
-    for line in lines:
-        if line.startswith("知识项: "):
-            title = line.replace("知识项: ", "").strip()
-            
-            # 查找对应的知识项
-            item = db.query(KnowledgeItem).join(KnowledgeCategory).filter(
-                KnowledgeItem.title == title
-            ).first()
-            
-            if item:
-                sources.append({
-                    "type": "knowledge",
-                    "title": item.title,
-                    "category": item.category.title if item.category else None,
-                    "external_link": item.external_link
-                })
-    
-    return sources
+    # 更新会话记忆
+    chat_memory.append(session_id, memory, question, answer)
 
 
 @router.post("/stream")
@@ -248,7 +222,96 @@ async def stream_chat_message(
     request: Request,
     db: Session = Depends(get_db)
 ):
-    """流式聊天消息（WebSocket实现的基础）"""
-    # 这里可以实现WebSocket流式响应
-    # 目前返回普通响应
-    return await send_chat_message(message_data, request, db)
+    """
+    流式聊天消息（Server-Sent Events）
+    事件依次为 start（会话ID）、若干 delta（增量文本）、done 或 error；
+    回答完整生成后才保存聊天记录，客户端断开时取消上游请求且不保存
+    """
+    # 从中间件获取用户信息
+    user_info = request.state.user
+    current_user_id = user_info['id']
+    
+    # 生成或使用会话ID
+    session_id = message_data.session_id or str(uuid.uuid4())
+    
+    # 获取会话记忆并构建知识上下文（在开始推流前完成，出错时仍返回普通错误响应）
+    start_time = time.time()
+    memory = chat_memory.load(db, session_id, current_user_id)
+    context = await build_context(db, message_data.message)
+    knowledge_context = context.text
+    
+    # 首轮问题可直接使用缓存的回答
+    cache_key = answer_cache.make_key(message_data.message, knowledge_context) if memory.empty else None
+    cached = answer_cache.get(cache_key) if cache_key else None
+    
+    async def cached_stream():
+        response_time_ms = int((time.time() - start_time) * 1000)
+        yield sse_event("start", {"session_id": session_id})
+        yield sse_event("delta", {"text": cached["response"]})
+        save_chat_exchange(
+            db, current_user_id, session_id, memory, message_data.message,
+            cached["response"], response_time_ms
+        )
+        yield sse_event("done", {
+            "session_id": session_id,
+            "response_time_ms": response_time_ms,
+            "first_token_ms": response_time_ms,
+            "cached": True,
+            "sources": context.sources
+        })
+    
+    async def event_stream():
+        stream = ai_service.generate_answer_stream(
+            question=message_data.message,
+            knowledge_context=knowledge_context,
+            chat_history=memory.history(),
+            summary=memory.summary_text()
+        )
+        try:
+            yield sse_event("start", {"session_id": session_id})
+            async for event in stream:
+                if event["type"] == "delta":
+                    yield sse_event("delta", {"text": event["text"]})
+                elif event["type"] == "error":
+                    error = {"detail": f"AI服务错误: {event['error']}"}
+                    if event.get("retry_after"):
+                        error["retry_after"] = math.ceil(event["retry_after"])
+                    yield sse_event("error", error)
+                    return
+                else:
+                    save_chat_exchange(
+                        db, current_user_id, session_id, memory, message_data.message,
+                        event["response"], event["response_time_ms"]
+                    )
+                    if cache_key:
+                        answer_cache.set(cache_key, event["response"], event["response_time_ms"], context.item_ids)
+                    yield sse_event("done", {
+                        "session_id": session_id,
+                        "response_time_ms": event["response_time_ms"],
+                        "first_token_ms": event["first_token_ms"],
+                        "cached": False,
+                        "sources": context.sources
+                    })
+        finally:
+            # 客户端断开时生成器被取消，关闭上游连接并归还名额
+            ticket.release()
+            await stream.aclose()
+    
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    if cached:
+        return StreamingResponse(cached_stream(), media_type="text/event-stream", headers=headers)
+    
+    # 开始推流前获取调用名额，繁忙时直接返回429
+    ticket = await ai_service.admission.acquire(current_user_id)
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers=headers,
+        # 生成器尚未启动客户端就断开时兜底归还名额
+        background=BackgroundTask(ticket.release)
+    )
+
+
+def sse_event(event: str, data: dict) -> str:
+    """编码一个SSE帧"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
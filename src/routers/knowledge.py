@@ -1,10 +1,9 @@
 """
 知识库相关路由
 """
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
 from src.database import get_db
 from src.models import KnowledgeCategory, KnowledgeItem, KnowledgeDetail, User
 from src.schemas import KnowledgeItemCreate, KnowledgeItemUpdate, KnowledgeDetailCreate, KnowledgeDetailUpdate, KnowledgeDetailResponse
@@ -13,6 +12,10 @@ from src.cache import (
     get_cached_knowledge_item, set_cached_knowledge_item,
     clear_knowledge_cache
 )
+from src.config import settings
+from src.fulltext import fulltext_backend
+from src.search_index import search_index, format_facets
+from src.pagination import paginate_sequence
 
 router = APIRouter(prefix="/knowledge", tags=["知识库"])
 
@@ -124,7 +127,7 @@ async def create_knowledge_item(
         db.commit()
         db.refresh(db_item)
         
-        # 清除相关缓存
+        # 清除相关缓存（搜索索引由会话事件增量更新）
         clear_knowledge_cache()
         
         return {
@@ -160,7 +163,7 @@ async def update_knowledge_item(
         db.commit()
         db.refresh(db_item)
         
-        # 清除相关缓存
+        # 清除相关缓存（搜索索引由会话事件增量更新）
         clear_knowledge_cache()
         
         return {"message": "知识项更新成功"}
@@ -188,7 +191,7 @@ async def delete_knowledge_item(
         db.delete(db_item)
         db.commit()
         
-        # 清除相关缓存
+        # 清除相关缓存（搜索索引由会话事件增量更新）
         clear_knowledge_cache()
         
         return {"message": "知识项删除成功"}
@@ -205,49 +208,75 @@ async def search_knowledge(
     q: str = Query(..., description="搜索关键词"),
     category_id: str = Query(None, description="分类ID"),
     status: str = Query(None, description="状态筛选"),
+    cursor: Optional[str] = Query(None, description="分页游标"),
+    limit: int = Query(default=50, ge=1, le=200, description="返回数量"),
     db: Session = Depends(get_db)
 ):
-    """搜索知识项"""
-    try:
-        # 构建查询条件
-        query = db.query(KnowledgeItem)
-        
-        # 关键词搜索
-        if q:
-            query = query.filter(
-                and_(
-                    KnowledgeItem.title.contains(q),
-                    KnowledgeItem.description.contains(q)
-                )
-            )
-        
-        # 分类筛选
-        if category_id:
-            query = query.filter(KnowledgeItem.category_id == category_id)
-        
-        # 状态筛选
-        if status:
-            query = query.filter(KnowledgeItem.status == status)
-        
-        # 执行查询
-        items = query.order_by(KnowledgeItem.sort_order).all()
-        
-        # 构建返回数据
-        result = []
-        for item in items:
-            result.append({
-                "id": item.id,  # 使用UUID格式的id
-                "category_id": item.category_id,
-                "title": item.title,
-                "description": item.description,
-                "status": item.status,
-                "sort_order": item.sort_order
-            })
-        
-        return {"items": result, "total": len(result)}
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"搜索失败: {str(e)}")
+    """搜索知识项（按 (sort_order, id) 游标分页），同时返回分类和状态的分面计数"""
+    filters = {"category_id": category_id, "status": status}
+    
+    # 索引就绪时直接从内存倒排索引检索，过滤和计数均为位图运算
+    if settings.search_engine == "memory" and search_index.ready:
+        matched = search_index.match_bits(q)
+        docs = search_index.documents_from_bits(search_index.filter_bits(matched, filters))
+        facets = format_facets(search_index.facet_counts(matched, filters), search_index.category_title)
+    else:
+        try:
+            # 使用数据库全文索引（不带过滤条件查询一次，过滤和计数在内存中完成）
+            rows = fulltext_backend.search(db, q, active_only=False)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"搜索失败: {str(e)}")
+        
+        category_titles = {item.category_id: title for item, title, _ in rows}
+        all_docs = [item for item, _, _ in rows]
+        docs = [
+            item for item in all_docs
+            if (not category_id or item.category_id == category_id)
+            and (not status or item.status == status)
+        ]
+        facets = format_facets(count_facets(all_docs, filters), category_titles.get)
+    
+    docs.sort(key=page_key)
+    page = paginate_sequence(docs, page_key, limit, cursor)
+    
+    # 构建返回数据
+    result = [
+        {
+            "id": doc.id,  # 使用UUID格式的id
+            "category_id": doc.category_id,
+            "title": doc.title,
+            "description": doc.description,
+            "status": doc.status,
+            "sort_order": doc.sort_order
+        }
+        for doc in page.items
+    ]
+    
+    return {
+        "items": result,
+        "total": len(docs),
+        "facets": facets,
+        "next_cursor": page.next_cursor,
+        "prev_cursor": page.prev_cursor
+    }
+
+
+def count_facets(docs: List[Any], filters: Dict[str, Any]) -> Dict[str, Dict[Any, int]]:
+    """统计知识项列表的分面计数（每个分面应用其余分面的过滤条件）"""
+    counts: Dict[str, Dict[Any, int]] = {}
+    for field in filters:
+        counts[field] = {}
+        for doc in docs:
+            if all(value is None or getattr(doc, name) == value
+                   for name, value in filters.items() if name != field):
+                key = getattr(doc, field)
+                counts[field][key] = counts[field].get(key, 0) + 1
+    return counts
+
+
+def page_key(doc) -> tuple:
+    """知识项分页排序键"""
+    return (doc.sort_order or 0, doc.id)
 
 
 # KnowledgeDetail相关接口
@@ -298,7 +327,7 @@ async def create_knowledge_item_detail(
         db.commit()
         db.refresh(db_detail)
         
-        # 清除相关缓存
+        # 清除相关缓存（搜索索引由会话事件增量更新）
         clear_knowledge_cache()
         
         return db_detail
@@ -331,7 +360,7 @@ async def update_knowledge_item_detail(
         db.commit()
         db.refresh(db_detail)
         
-        # 清除相关缓存
+        # 清除相关缓存（搜索索引由会话事件增量更新）
         clear_knowledge_cache()
         
         return db_detail
@@ -359,7 +388,7 @@ async def delete_knowledge_item_detail(
         db.delete(db_detail)
         db.commit()
         
-        # 清除相关缓存
+        # 清除相关缓存（搜索索引由会话事件增量更新）
         clear_knowledge_cache()
         
         return {"message": "知识项详情删除成功"}
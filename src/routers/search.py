@@ -1,138 +1,422 @@
 """
 搜索相关路由
 """
+import asyncio
 import time
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import List, Dict, Tuple, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.orm import Session
-from sqlalchemy import or_
 from src.database import get_db
 from src.models import KnowledgeItem, KnowledgeCategory, User
-from src.schemas import SearchRequest, SearchResponse, SearchResult
+from src.schemas import SearchRequest, SearchResponse, SearchResult, BatchSearchRequest, BatchSearchResponse
 from src.cache import get_cached_search_result, set_cached_search_result
 from src.ai_service import ai_service
+from src.config import settings, SEARCH_CONFIG
+from src.fulltext import fulltext_backend
+from src.search_index import search_index, format_facets, highlight
+from src.suggest import suggester
+from src.search_log import search_logger
+from src.vector_index import vector_index
+from src.retrieval import hybrid_search, hybrid_search_sync
+from src.fuzzy import fuzzy_corrector
+from src.pagination import paginate_sequence
 
 router = APIRouter(prefix="/search", tags=["搜索"])
 
 
 @router.get("", response_model=SearchResponse)
 async def search(
+    request: Request,
     q: str = Query(..., min_length=1, description="搜索关键词"),
     limit: int = Query(default=10, ge=1, le=100, description="结果数量限制"),
+    mode: str = Query(default="hybrid", pattern="^(hybrid|keyword|semantic)$", description="检索模式"),
+    fuzzy: bool = Query(default=True, description="结果过少时自动纠正拼写错误"),
+    snippet_length: int = Query(
+        default=SEARCH_CONFIG["snippet"]["max_length"], ge=20, le=1000, description="摘要最大长度"
+    ),
+    include_description: bool = Query(default=True, description="是否返回完整描述"),
+    debug: bool = Query(default=False, description="返回各检索器分数和各阶段耗时"),
+    cursor: Optional[str] = Query(None, description="分页游标"),
     db: Session = Depends(get_db)
 ):
     """搜索知识库内容"""
     start_time = time.time()
     
-    # 尝试从缓存获取
-    cache_key = f"{q}_{limit}"
-    cached_result = get_cached_search_result(cache_key)
+    response = await run_search(
+        db, q, limit, mode, debug, cursor, fuzzy,
+        snippet_length=snippet_length,
+        include_description=include_description
+    )
+    
+    # 记录搜索日志（仅写入内存队列）
+    record_search(request, q, response.total, start_time)
+    
+    return response
+
+
+async def run_search(
+    db: Session,
+    q: str,
+    limit: int,
+    mode: str = "hybrid",
+    debug: bool = False,
+    cursor: Optional[str] = None,
+    fuzzy: bool = True,
+    snippet_length: Optional[int] = None,
+    include_description: bool = True
+) -> SearchResponse:
+    """
+    执行搜索（带缓存，debug 请求不读缓存）
+    排好序的结果（最多 max_results 条）整体缓存，翻页按排名在缓存结果上定位，不再重复检索
+    """
+    # 尝试从缓存获取（键中包含索引版本，索引更新后旧结果自动失效）
+    cache_key = f"{q}_{mode}_{int(fuzzy)}_v{search_index.version}"
+    cached_result = None if debug else get_cached_search_result(cache_key)
+    
+    timings = None
+    corrected_query = None
     if cached_result:
-        return SearchResponse(**cached_result)
+        results = [SearchResult(**result) for result in cached_result["results"]]
+        corrected_query = cached_result.get("corrected_query")
+    else:
+        # 搜索知识项（已按相关性排序）
+        results, timings = await retrieve(db, q, mode)
+        
+        # 关键词命中过少时尝试纠正拼写后重新检索（混合模式按融合前的关键词命中数判断，语义结果总能凑满数量）
+        hit_count = lexical_hit_count(q, mode, results)
+        corrected = correct_query(q, hit_count, fuzzy)
+        if corrected:
+            corrected_results, corrected_timings = await retrieve(db, corrected, mode)
+            if lexical_hit_count(corrected, mode, corrected_results) > hit_count:
+                results, timings, corrected_query = corrected_results, corrected_timings, corrected
+        
+        # 缓存结果（不含调试信息）
+        set_cached_search_result(cache_key, {
+            "query": q,
+            "corrected_query": corrected_query,
+            "results": [result.dict(exclude={"scores"}) for result in results]
+        })
     
-    # 搜索知识项
-    results = search_knowledge(db, q, limit)
+    return build_response(
+        q, results, corrected_query, limit,
+        mode=mode,
+        cursor=cursor,
+        debug=debug,
+        timings=timings,
+        snippet_length=snippet_length,
+        include_description=include_description
+    )
+
+
+def correct_query(q: str, hit_count: int, fuzzy: bool) -> Optional[str]:
+    """结果过少且查询含索引未收录的词时，返回纠正后的查询"""
+    if not fuzzy or hit_count >= SEARCH_CONFIG["fuzzy"]["min_hits"] or not fuzzy_corrector.ready:
+        return None
+    return fuzzy_corrector.correct(q, search_index.has_terms)
+
+
+def lexical_bits(q: str) -> int:
+    """关键词检索（融合前）命中的文档位图，只含已启用分类的文档"""
+    return search_index.match_bits(q) & search_index.active_bits()
+
+
+def lexical_hit_count(q: str, mode: str, results: List[SearchResult]) -> int:
+    """判断是否需要纠错的命中数：混合和关键词模式取关键词检索的命中数，语义模式取结果数"""
+    if mode == "semantic" or not search_index.ready:
+        return len(results)
+    return lexical_bits(q).bit_count()
+
+
+def build_response(
+    q: str,
+    results: List[SearchResult],
+    corrected_query: Optional[str],
+    limit: int,
+    mode: str = "hybrid",
+    cursor: Optional[str] = None,
+    debug: bool = False,
+    timings: Optional[Dict[str, float]] = None,
+    snippet_length: Optional[int] = None,
+    include_description: bool = True,
+    filters: Optional[Dict[str, Optional[str]]] = None
+) -> SearchResponse:
+    """
+    对排好序的结果过滤、统计分面、分页并生成摘要
+    结果列表最多 max_results 条，总数和分面计数按索引中的关键词匹配位图（并上结果中的语义命中）统计，不受截断影响
+    """
+    filters = {field: value for field, value in (filters or {}).items() if value is not None}
     
-    # 按相关性排序（简单实现）
-    results = sorted(results, key=lambda x: x.get("relevance", 0), reverse=True)
+    # 全部匹配文档的分类和状态分面计数
+    facets = None
+    total = None
+    if search_index.ready:
+        bits = search_index.item_bits(result.id for result in results if result.id)
+        if mode != "semantic":
+            bits |= lexical_bits(corrected_query or q)
+        facets = format_facets(search_index.facet_counts(bits, filters), search_index.category_title)
+        total = search_index.filter_bits(bits, filters).bit_count()
     
-    # 限制结果数量
-    results = results[:limit]
+    if filters:
+        results = [
+            result for result in results
+            if all(getattr(result, field) == value for field, value in filters.items())
+        ]
     
-    # 缓存结果
-    result_data = {
-        "query": q,
-        "total": len(results),
-        "results": results
-    }
-    set_cached_search_result(cache_key, result_data)
+    # 以排名为键分页
+    page = paginate_sequence(list(enumerate(results)), lambda entry: (entry[0],), limit, cursor)
+    # 复制本页结果后再填充摘要等字段（批量搜索中相同查询共用一份检索结果）
+    page_results = [result.model_copy() for _, result in page.items]
+    
+    # 只为本页结果生成摘要和高亮
+    snippet_length = snippet_length or SEARCH_CONFIG["snippet"]["max_length"]
+    for result in page_results:
+        doc = search_index.get_document(result.id) if search_index.ready and result.id else None
+        if doc is not None:
+            marks = highlight(doc, corrected_query or q, snippet_length)
+            result.snippet = marks["snippet"]
+            result.highlights = marks["highlights"]
+            result.title_highlights = marks["title_highlights"]
+        if not include_description:
+            result.description = None
+        if not debug:
+            result.scores = None
     
     return SearchResponse(
         query=q,
-        total=len(results),
-        results=results
+        corrected_query=corrected_query,
+        total=len(results) if total is None else total,
+        results=page_results,
+        facets=facets,
+        timings_ms=timings if debug else None,
+        next_cursor=page.next_cursor,
+        prev_cursor=page.prev_cursor
+    )
+
+
+async def retrieve(
+    db: Session,
+    q: str,
+    mode: str
+) -> Tuple[List[SearchResult], Optional[Dict[str, float]]]:
+    """按检索模式检索知识项（最多 max_results 条），返回结果和各阶段耗时"""
+    max_results = SEARCH_CONFIG["max_results"]
+    if mode == "hybrid" and search_index.ready:
+        return await search_knowledge_hybrid(q, max_results)
+    if mode == "semantic" and vector_index.ready:
+        return search_knowledge_semantic(q, max_results), None
+    return search_knowledge(db, q, max_results), None
+
+
+def retrieve_snapshot(db: Session, q: str, mode: str) -> List[SearchResult]:
+    """同步检索（批量检索在索引快照内调用）"""
+    max_results = SEARCH_CONFIG["max_results"]
+    if mode == "hybrid" and search_index.ready:
+        return hybrid_to_results(hybrid_search_sync(q, limit=max_results))
+    if mode == "semantic" and vector_index.ready:
+        return search_knowledge_semantic(q, max_results)
+    return search_knowledge(db, q, max_results)
+
+
+def record_search(request: Request, q: str, result_count: int, start_time: float):
+    """记录搜索日志"""
+    user_info = getattr(request.state, "user", None) or {}
+    search_logger.record(
+        q,
+        result_count,
+        user_id=user_info.get("id"),
+        response_time_ms=int((time.time() - start_time) * 1000)
     )
 
 
 def search_knowledge(db: Session, query: str, limit: int) -> List[SearchResult]:
     """搜索知识项"""
-    results = []
+    # 索引就绪时直接从内存倒排索引检索，避免SQL全表扫描
+    if settings.search_engine == "memory" and search_index.ready:
+        return search_knowledge_from_index(query, limit)
     
-    # 构建搜索条件
-    search_conditions = or_(
-        KnowledgeItem.title.contains(query),
-        KnowledgeItem.description.contains(query),
-        KnowledgeItem.content.contains(query)
-    )
+    # 否则使用数据库全文索引
+    rows = fulltext_backend.search(db, query, limit=limit)
     
-    # 执行搜索
-    items = db.query(KnowledgeItem).join(KnowledgeCategory).filter(
-        search_conditions,
-        KnowledgeCategory.is_active == True
-    ).limit(limit).all()
-    
-    for item in items:
-        # 计算相关性分数（简单实现）
-        relevance = calculate_relevance(item, query)
-        
-        results.append(SearchResult(
+    return [
+        SearchResult(
+            id=item.id,
             type="knowledge",
-            category=item.category.title if item.category else None,
+            category_id=item.category_id,
+            category=category_title,
             title=item.title,
             description=item.description,
             status=item.status,
-            external_link=item.external_link,
-            relevance=relevance
+            relevance=round(score, 4) if score is not None else None
+        )
+        for item, category_title, score in rows
+    ]
+
+
+def search_knowledge_from_index(query: str, limit: int) -> List[SearchResult]:
+    """从内存倒排索引搜索知识项（BM25F排序）"""
+    hits = search_index.search(
+        query,
+        limit=limit,
+        predicate=lambda doc: search_index.is_category_active(doc.category_id)
+    )
+    
+    return [
+        SearchResult(
+            id=doc.id,
+            type="knowledge",
+            category_id=doc.category_id,
+            category=search_index.category_title(doc.category_id),
+            title=doc.title,
+            description=doc.description,
+            status=doc.status,
+            external_link=doc.external_link,
+            relevance=round(score, 4)
+        )
+        for doc, score in hits
+    ]
+
+
+async def search_knowledge_hybrid(query: str, limit: int) -> Tuple[List[SearchResult], Dict[str, float]]:
+    """混合检索知识项（关键词 + 语义，排名融合），返回结果和各阶段耗时"""
+    result = await hybrid_search(query, limit=limit)
+    return hybrid_to_results(result), result.timings_ms
+
+
+def hybrid_to_results(result) -> List[SearchResult]:
+    """混合检索结果转为搜索结果"""
+    return [
+        SearchResult(
+            id=hit.doc.id,
+            type="knowledge",
+            category_id=hit.doc.category_id,
+            category=search_index.category_title(hit.doc.category_id),
+            title=hit.doc.title,
+            description=hit.doc.description,
+            status=hit.doc.status,
+            external_link=hit.doc.external_link,
+            relevance=round(hit.score, 6),
+            scores={name: round(score, 4) for name, score in hit.scores.items()}
+        )
+        for hit in result.hits
+    ]
+
+
+def search_knowledge_semantic(query: str, limit: int) -> List[SearchResult]:
+    """向量语义检索知识项"""
+    hits = vector_index.search(
+        query,
+        limit=limit,
+        predicate=search_index.is_item_active
+    )
+    
+    results = []
+    for item_id, score in hits:
+        doc = search_index.get_document(item_id)
+        if doc is None:
+            continue
+        results.append(SearchResult(
+            id=doc.id,
+            type="knowledge",
+            category_id=doc.category_id,
+            category=search_index.category_title(doc.category_id),
+            title=doc.title,
+            description=doc.description,
+            status=doc.status,
+            external_link=doc.external_link,
+            relevance=round(score, 4)
         ))
     
     return results
 
 
-def calculate_relevance(item, query: str) -> float:
-    """计算相关性分数"""
-    # 简单的相关性计算
-    query_lower = query.lower()
-    title_score = 0
-    desc_score = 0
+@router.post("/batch", response_model=BatchSearchResponse)
+async def batch_search(
+    request: Request,
+    batch: BatchSearchRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    批量搜索
+    相同的查询（查询词 + 模式）只检索一次，全部查询在同一个索引快照上执行，共用一个数据库会话
+    """
+    start_time = time.time()
     
-    # 标题匹配权重更高
-    if hasattr(item, 'title') and item.title:
-        if query_lower in item.title.lower():
-            title_score = 1.0
-        elif any(word in item.title.lower() for word in query_lower.split()):
-            title_score = 0.5
+    # 在线程池中执行，检索期间不阻塞事件循环
+    responses, unique = await asyncio.to_thread(run_batch, db, batch)
     
-    # 描述匹配
-    if hasattr(item, 'description') and item.description:
-        if query_lower in item.description.lower():
-            desc_score = 0.8
-        elif any(word in item.description.lower() for word in query_lower.split()):
-            desc_score = 0.3
+    for (q, _, _), (results, _) in unique.items():
+        record_search(request, q, len(results), start_time)
     
-    # 内容匹配
-    content_score = 0
-    if hasattr(item, 'content') and item.content:
-        if query_lower in item.content.lower():
-            content_score = 0.6
-        elif any(word in item.content.lower() for word in query_lower.split()):
-            content_score = 0.2
+    return BatchSearchResponse(
+        results=responses,
+        total_queries=len(batch.queries),
+        unique_queries=len(unique),
+        elapsed_ms=int((time.time() - start_time) * 1000)
+    )
+
+
+def run_batch(
+    db: Session,
+    batch: BatchSearchRequest
+) -> Tuple[List[SearchResponse], Dict[Tuple[str, str, bool], Tuple[List[SearchResult], Optional[str]]]]:
+    """在同一个索引快照上执行批量查询，返回与请求一一对应的响应和去重后的检索结果"""
+    # 去重：过滤条件和数量限制在检索后分别应用
+    unique: Dict[Tuple[str, str, bool], Tuple[List[SearchResult], Optional[str]]] = {}
+    for item in batch.queries:
+        unique.setdefault((item.q, item.mode, item.fuzzy), None)
     
-    return title_score + desc_score + content_score
+    # 固定当前索引版本（不持有锁），期间发布的新版本不影响本批查询
+    with search_index.snapshot():
+        for q, mode, fuzzy in unique:
+            results = retrieve_snapshot(db, q, mode)
+            corrected_query = None
+            hit_count = lexical_hit_count(q, mode, results)
+            corrected = correct_query(q, hit_count, fuzzy)
+            if corrected:
+                corrected_results = retrieve_snapshot(db, corrected, mode)
+                if lexical_hit_count(corrected, mode, corrected_results) > hit_count:
+                    results, corrected_query = corrected_results, corrected
+            unique[(q, mode, fuzzy)] = (results, corrected_query)
+        
+        responses = []
+        for item in batch.queries:
+            results, corrected_query = unique[(item.q, item.mode, item.fuzzy)]
+            responses.append(build_response(
+                item.q,
+                results,
+                corrected_query,
+                item.limit,
+                mode=item.mode,
+                cursor=item.cursor,
+                snippet_length=item.snippet_length,
+                include_description=item.include_description,
+                filters={"category_id": item.category_id, "status": item.status}
+            ))
+    
+    return responses, unique
 
 
 @router.get("/enhanced", response_model=SearchResponse)
 async def enhanced_search(
+    request: Request,
     q: str = Query(..., min_length=1, description="搜索关键词"),
     limit: int = Query(default=10, ge=1, le=100, description="结果数量限制"),
     db: Session = Depends(get_db)
 ):
     """AI增强搜索"""
-    # 先执行基础搜索
-    basic_results = await search(q, limit, db)
+    start_time = time.time()
+    
+    # 先执行基础搜索（混合检索）
+    basic_results = await run_search(db, q, limit)
+    record_search(request, q, basic_results.total, start_time)
     
-    # 使用AI增强搜索结果
+    # 使用AI增强搜索结果（与聊天共用准入控制，繁忙时返回429）
     if basic_results.results:
-        enhanced_response = await ai_service.search_enhancement(q, basic_results.results)
+        user_info = getattr(request.state, "user", None) or {}
+        async with ai_service.admission.slot(user_info.get("id")):
+            enhanced_response = await ai_service.search_enhancement(
+                q, [result.dict() for result in basic_results.results]
+            )
         
         if enhanced_response.get("success"):
             # 添加AI增强的解释
@@ -145,32 +429,35 @@ async def enhanced_search(
 @router.get("/suggestions")
 async def get_search_suggestions(
     q: str = Query(..., min_length=1, description="搜索关键词"),
+    limit: int = Query(default=10, ge=1, le=20, description="建议数量限制"),
     db: Session = Depends(get_db)
 ):
     """获取搜索建议"""
+    # 建议索引就绪时直接从内存前缀索引获取（按权重和热度排序）
+    if suggester.ready:
+        return {"suggestions": suggester.suggest(q, limit)}
+    
     suggestions = []
     
     # 从知识项标题中获取建议
     knowledge_suggestions = db.query(KnowledgeItem.title).filter(
         KnowledgeItem.title.contains(q)
-    ).limit(10).all()
+    ).order_by(KnowledgeItem.sort_order).limit(limit).all()
     
     for suggestion in knowledge_suggestions:
         suggestions.append(suggestion[0])
     
-    # 去重并限制数量
-    suggestions = list(set(suggestions))[:10]
+    # 去重并保持顺序
+    suggestions = list(dict.fromkeys(suggestions))[:limit]
     
     return {"suggestions": suggestions}
 
 
 @router.get("/popular")
 async def get_popular_searches(
-    limit: int = Query(default=10, ge=1, le=50, description="结果数量限制"),
-    db: Session = Depends(get_db)
+    limit: int = Query(default=10, ge=1, le=50, description="结果数量限制")
 ):
     """获取热门搜索"""
-    # 由于删除了SearchLog，返回空结果
     return {
-        "popular_searches": []
-    }
\ No newline at end of file
+        "popular_searches": search_logger.popular(limit)
+    }
@@ -162,12 +162,32 @@ class ChatMessage(BaseModel):
     context: Optional[str] = None
 
 
+class SourceDetail(BaseModel):
+    """引用来源中的详情链接"""
+    id: Optional[str] = None
+    title: Optional[str] = None
+    external_link: str
+
+
+class KnowledgeSource(BaseModel):
+    """回答引用的知识来源"""
+    type: str = "knowledge"
+    id: str
+    title: str
+    category_id: Optional[str] = None
+    category: Optional[str] = None
+    score: Optional[float] = None
+    external_link: Optional[str] = None
+    details: List[SourceDetail] = []
+
+
 class ChatResponse(BaseModel):
     """聊天响应模型"""
     response: str
     session_id: str
     response_time_ms: int
-    sources: Optional[List[Dict[str, Any]]] = None
+    sources: Optional[List[KnowledgeSource]] = None
+    cached: bool = False  # 是否来自问答缓存
 
 
 class ChatHistoryResponse(BaseModel):
@@ -194,19 +214,63 @@ class SearchRequest(BaseModel):
 
 class SearchResult(BaseModel):
     """搜索结果模型"""
+    id: Optional[str] = None
     type: str
+    category_id: Optional[str] = None
     category: Optional[str] = None
     title: str
     description: Optional[str] = None
     status: Optional[str] = None
     external_link: Optional[str] = None
+    relevance: Optional[float] = None
+    # 各检索器的原始分数（混合检索调试用）
+    scores: Optional[Dict[str, float]] = None
+    # 最佳匹配片段及高亮区间 [起始, 结束)，偏移相对摘要文本
+    snippet: Optional[str] = None
+    highlights: Optional[List[List[int]]] = None
+    title_highlights: Optional[List[List[int]]] = None
 
 
 class SearchResponse(BaseModel):
     """搜索响应模型"""
     query: str
+    # 拼写纠正后实际使用的查询
+    corrected_query: Optional[str] = None
     total: int
     results: List[SearchResult]
+    # 分类和状态的分面计数
+    facets: Optional[Dict[str, List[Dict[str, Any]]]] = None
+    # 各阶段耗时（毫秒，debug 时返回）
+    timings_ms: Optional[Dict[str, float]] = None
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
+    ai_enhancement: Optional[str] = None
+
+
+class BatchSearchQuery(BaseModel):
+    """批量搜索中的单个查询"""
+    q: str = Field(..., min_length=1, max_length=200)
+    limit: int = Field(default=10, ge=1, le=100)
+    mode: str = Field(default="hybrid", pattern="^(hybrid|keyword|semantic)$")
+    category_id: Optional[str] = None
+    status: Optional[str] = None
+    fuzzy: bool = True
+    snippet_length: Optional[int] = Field(default=None, ge=20, le=1000)
+    include_description: bool = True
+    cursor: Optional[str] = None
+
+
+class BatchSearchRequest(BaseModel):
+    """批量搜索请求模型"""
+    queries: List[BatchSearchQuery] = Field(..., min_length=1, max_length=50)
+
+
+class BatchSearchResponse(BaseModel):
+    """批量搜索响应模型（结果与请求中的查询一一对应）"""
+    results: List[SearchResponse]
+    total_queries: int
+    unique_queries: int
+    elapsed_ms: int
 
 
 # 管理相关模型
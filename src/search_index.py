@@ -0,0 +1,831 @@
+"""
+搜索索引模块 - 进程内倒排索引
+中文按字符 n-gram（单字 + 二元组）切分，拉丁文本按单词切分
+"""
+import heapq
+import math
+from array import array
+import re
+import threading
+import time
+import unicodedata
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Dict, Any, Optional, Iterator, Tuple, Callable, ContextManager, Set
+from sqlalchemy.orm import Session
+from src.config import SEARCH_CONFIG
+from src.models import KnowledgeCategory, KnowledgeItem, KnowledgeDetail
+
+
+# 索引字段
+FIELDS = ("title", "description", "content", "detail")
+
+# 分面字段（每个取值维护一个文档编号位图）
+FACET_FIELDS = ("category_id", "status")
+
+# 倒排表中每个字段的词频占16位，打包成一个64位整数
+TF_BITS = 16
+TF_MAX = (1 << TF_BITS) - 1
+
+# 中日韩字符范围
+CJK_CHARS = r"\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"
+
+# 拉丁单词或连续的中日韩字符
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+|[" + CJK_CHARS + "]+")
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """规范化文本（全角转半角、转小写），逐字符处理以保持偏移量不变"""
+    if not text:
+        return ""
+    chars = []
+    for ch in text:
+        normalized = unicodedata.normalize("NFKC", ch).lower()
+        chars.append(normalized if len(normalized) == 1 else ch.lower())
+    return "".join(chars)
+
+
+def _is_cjk(token: str) -> bool:
+    """判断词元是否为中日韩字符"""
+    return not token[0].isascii()
+
+
+def iter_tokens(text: Optional[str], unigrams: bool = True) -> Iterator[Tuple[str, int, int]]:
+    """切分文本，返回 (词元, 起始偏移, 结束偏移)"""
+    normalized = normalize_text(text)
+    for match in TOKEN_PATTERN.finditer(normalized):
+        token = match.group()
+        start = match.start()
+        if not _is_cjk(token):
+            yield token, start, match.end()
+            continue
+
+        # 中文：单字 + 相邻二元组
+        if len(token) == 1:
+            yield token, start, start + 1
+            continue
+        for i in range(len(token)):
+            if unigrams:
+                yield token[i], start + i, start + i + 1
+            if i + 1 < len(token):
+                yield token[i:i + 2], start + i, start + i + 2
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """切分文档文本"""
+    return [token for token, _, _ in iter_tokens(text)]
+
+
+def tokenize_query(query: Optional[str]) -> List[str]:
+    """切分查询文本（中文只取二元组，单字查询保留单字），去重并保持顺序"""
+    seen = set()
+    terms = []
+    for token, _, _ in iter_tokens(query, unigrams=False):
+        if token not in seen:
+            seen.add(token)
+            terms.append(token)
+    return terms
+
+
+def bits_from_docnos(docnos) -> int:
+    """文档编号集合转为位图（Python整数）"""
+    docnos = list(docnos)
+    if not docnos:
+        return 0
+    buffer = bytearray(max(docnos) // 8 + 1)
+    for docno in docnos:
+        buffer[docno >> 3] |= 1 << (docno & 7)
+    return int.from_bytes(buffer, "little")
+
+
+def iter_bits(bits: int) -> Iterator[int]:
+    """遍历位图中置位的文档编号"""
+    data = bits.to_bytes((bits.bit_length() + 7) // 8, "little")
+    for i, byte in enumerate(data):
+        while byte:
+            low = byte & -byte
+            yield (i << 3) + low.bit_length() - 1
+            byte ^= low
+
+
+def format_facets(
+    counts: Dict[str, Dict[Any, int]],
+    category_title: Callable[[str], Optional[str]]
+) -> Dict[str, List[Dict[str, Any]]]:
+    """分面计数转为接口返回格式，按数量降序"""
+    ordered = lambda values: sorted(values.items(), key=lambda entry: (-entry[1], str(entry[0])))
+    return {
+        "category": [
+            {"id": value, "title": category_title(value), "count": count}
+            for value, count in ordered(counts.get("category_id", {}))
+        ],
+        "status": [
+            {"status": value, "count": count}
+            for value, count in ordered(counts.get("status", {}))
+        ],
+    }
+
+
+def pack_tf(field_tf: List[int]) -> int:
+    """各字段词频（按 FIELDS 顺序）打包成一个整数"""
+    packed = 0
+    for position, tf in enumerate(field_tf):
+        packed |= min(tf, TF_MAX) << (position * TF_BITS)
+    return packed
+
+
+class PostingList:
+    """词元的倒排表：文档编号数组 + 平行的打包词频数组"""
+
+    __slots__ = ("docnos", "tfs")
+
+    def __init__(self):
+        self.docnos = array("I")
+        self.tfs = array("Q")
+
+    def __len__(self) -> int:
+        return len(self.docnos)
+
+    def copy(self) -> "PostingList":
+        postings = PostingList()
+        postings.docnos = array("I", self.docnos)
+        postings.tfs = array("Q", self.tfs)
+        return postings
+
+    def add(self, docno: int, packed_tf: int):
+        self.docnos.append(docno)
+        self.tfs.append(packed_tf)
+
+    def remove(self, docno: int):
+        """移除文档（与末尾元素交换后弹出，顺序无关）"""
+        try:
+            position = self.docnos.index(docno)
+        except ValueError:
+            return
+        last = len(self.docnos) - 1
+        self.docnos[position] = self.docnos[last]
+        self.tfs[position] = self.tfs[last]
+        del self.docnos[last]
+        del self.tfs[last]
+
+
+class IndexedDocument:
+    """索引中的知识项文档"""
+
+    __slots__ = (
+        "docno", "id", "category_id", "title", "description", "content",
+        "status", "sort_order", "detail_text", "external_link", "field_lengths", "token_offsets"
+    )
+
+    def __init__(self, docno: int, item: Dict[str, Any], details: List[Dict[str, Any]]):
+        self.docno = docno
+        self.id = item["id"]
+        self.category_id = item["category_id"]
+        self.title = item.get("title") or ""
+        self.description = item.get("description")
+        self.content = item.get("content")
+        self.status = item.get("status")
+        self.sort_order = item.get("sort_order") or 0
+
+        ordered = sorted(details, key=lambda d: d.get("sort_order") or 0)
+        self.detail_text = "\n".join(
+            f"{d.get('title') or ''} {d.get('description') or ''}".strip() for d in ordered
+        )
+        self.external_link = next(
+            (d["external_link"] for d in ordered if d.get("external_link")), None
+        )
+        # 各字段词元数（按 FIELDS 顺序）
+        self.field_lengths: Tuple[int, ...] = ()
+        # 字段 -> {词元: 起始偏移数组}，用于生成摘要和高亮、移除文档时定位倒排表
+        self.token_offsets: Dict[str, Dict[str, array]] = {}
+
+    def to_item(self) -> Dict[str, Any]:
+        """还原知识项字段"""
+        return {
+            "id": self.id,
+            "category_id": self.category_id,
+            "title": self.title,
+            "description": self.description,
+            "content": self.content,
+            "status": self.status,
+            "sort_order": self.sort_order,
+        }
+
+    def field_text(self, field: str) -> str:
+        """获取字段文本"""
+        if field == "detail":
+            return self.detail_text
+        return getattr(self, field) or ""
+
+
+def _merge_spans(spans: List[Tuple[int, int]]) -> List[List[int]]:
+    """合并重叠或相邻的高亮区间（中文二元组彼此重叠）"""
+    merged: List[List[int]] = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def match_spans(doc: IndexedDocument, field: str, terms: List[str]) -> List[Tuple[int, int, str]]:
+    """从索引中保存的偏移量取出查询词元在字段中的位置 (起始, 结束, 词元)"""
+    offsets = doc.token_offsets.get(field, {})
+    return sorted(
+        (start, start + len(term), term)
+        for term in terms
+        for start in offsets.get(term, ())
+    )
+
+
+def highlight(doc: IndexedDocument, query: str, max_length: int) -> Dict[str, Any]:
+    """
+    生成标题高亮和最佳匹配片段的摘要
+    摘要取命中不同词元最多（其次命中次数最多）的不超过 max_length 的窗口，高亮偏移相对摘要文本
+    """
+    terms = tokenize_query(query)
+    result: Dict[str, Any] = {
+        "title_highlights": _merge_spans([(start, end) for start, end, _ in match_spans(doc, "title", terms)]),
+        "snippet": None,
+        "highlights": [],
+    }
+
+    best = None
+    field_spans = {}
+    for field in SEARCH_CONFIG["snippet"]["fields"]:
+        spans = field_spans[field] = match_spans(doc, field, terms)
+        counts: Dict[str, int] = {}
+        left = 0
+        # 双指针滑动窗口
+        for right, (_, end, term) in enumerate(spans):
+            counts[term] = counts.get(term, 0) + 1
+            while end - spans[left][0] > max_length:
+                left_term = spans[left][2]
+                counts[left_term] -= 1
+                if not counts[left_term]:
+                    del counts[left_term]
+                left += 1
+            score = (len(counts), right - left + 1)
+            if best is None or score > best[0]:
+                best = (score, field, spans[left:right + 1])
+
+    if best is None:
+        # 正文无命中时退化为描述开头
+        text = doc.description or ""
+        if text:
+            result["snippet"] = text[:max_length] + ("…" if len(text) > max_length else "")
+        return result
+
+    _, field, spans = best
+    text = doc.field_text(field)
+    match_start = spans[0][0]
+    match_end = max(end for _, end, _ in spans)
+    # 命中区域居中，两侧补充上下文
+    begin = max(0, match_start - (max_length - (match_end - match_start)) // 2)
+    stop = min(len(text), begin + max_length)
+    begin = max(0, stop - max_length)
+
+    prefix = "…" if begin > 0 else ""
+    suffix = "…" if stop < len(text) else ""
+    shift = len(prefix) - begin
+    result["snippet"] = prefix + text[begin:stop] + suffix
+    result["highlights"] = _merge_spans([
+        (start + shift, end + shift)
+        for start, end, _ in field_spans[field]
+        if start >= begin and end <= stop
+    ])
+    return result
+
+
+class IndexVersion:
+    """
+    索引的一个版本
+    全量构建和增量更新都在新版本上进行，发布后不再修改，读操作取得版本引用后无需加锁
+    """
+
+    def __init__(self):
+        self.version = 0
+        # 词元 -> 倒排表
+        self.postings: Dict[str, PostingList] = {}
+        self.documents: Dict[int, IndexedDocument] = {}
+        self.doc_ids: Dict[str, int] = {}
+        self.categories: Dict[str, Dict[str, Any]] = {}
+        self.details: Dict[str, Dict[str, Any]] = {}
+        # 各字段总长度，用于计算平均长度
+        self.field_length_totals: Dict[str, int] = {field: 0 for field in FIELDS}
+        self._details_by_item: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        # 分面位图: 字段 -> {取值: 文档编号位图}
+        self.facet_bits: Dict[str, Dict[Any, int]] = {field: {} for field in FACET_FIELDS}
+        self._next_docno = 0
+        # 已释放的文档编号（最小堆），增量更新时优先复用，保持位图紧凑
+        self._free_docnos: List[int] = []
+        # 发布前在本版本中新建或复制过的倒排表，再次修改时无需复制
+        self._owned: Set[str] = set()
+
+    def copy(self) -> "IndexVersion":
+        """
+        复制出下一个版本（写时复制）：只复制各映射本身，倒排表和详情分组在修改时才复制，
+        文档对象和分类、详情记录整体替换而不原地修改，可与上一版本共享
+        """
+        draft = IndexVersion.__new__(IndexVersion)
+        draft.version = self.version + 1
+        draft.postings = dict(self.postings)
+        draft.documents = dict(self.documents)
+        draft.doc_ids = dict(self.doc_ids)
+        draft.categories = dict(self.categories)
+        draft.details = dict(self.details)
+        draft.field_length_totals = dict(self.field_length_totals)
+        draft._details_by_item = dict(self._details_by_item)
+        draft.facet_bits = {field: dict(values) for field, values in self.facet_bits.items()}
+        draft._next_docno = self._next_docno
+        draft._free_docnos = list(self._free_docnos)
+        draft._owned = set()
+        return draft
+
+    # ---- 写入（只在未发布的版本上调用） ----
+
+    def apply_changes(self, changes) -> Tuple[Set[str], Set[str]]:
+        """应用知识库变更，只更新受影响文档的倒排表，返回 (更新的知识项ID, 删除的知识项ID)"""
+        for category_id in changes.deleted_categories:
+            self.categories.pop(category_id, None)
+        for category_id, category in changes.categories.items():
+            self.categories[category_id] = {"id": category_id, **self.categories.get(category_id, {}), **category}
+
+        # 详情变更会影响所属知识项的detail字段
+        affected = set()
+        for detail_id, item_id in changes.deleted_details.items():
+            self._drop_detail(detail_id)
+            affected.add(item_id)
+        for detail_id, detail in changes.details.items():
+            previous = self.details.get(detail_id)
+            if previous:
+                self._drop_detail(detail_id)
+                affected.add(previous["knowledge_id"])
+                detail = {**previous, **detail}
+            self._put_detail(detail)
+            affected.add(detail["knowledge_id"])
+
+        removed = set()
+        for item_id in changes.deleted_items:
+            self._remove_document(item_id)
+            self._details_by_item.pop(item_id, None)
+            removed.add(item_id)
+        affected -= removed
+
+        upserted = set()
+        for item_id in affected | set(changes.items):
+            docno = self.doc_ids.get(item_id)
+            item = self.documents[docno].to_item() if docno is not None else {}
+            item.update(changes.items.get(item_id, {}))
+            if "category_id" not in item:
+                # 只有详情变更、但知识项不在索引中
+                continue
+            self._remove_document(item_id)
+            self._add_document(item)
+            upserted.add(item_id)
+        return upserted, removed
+
+    def _put_detail(self, detail: Dict[str, Any]):
+        """登记知识项详情"""
+        self.details[detail["id"]] = detail
+        group = dict(self._details_by_item.get(detail["knowledge_id"], {}))
+        group[detail["id"]] = detail
+        self._details_by_item[detail["knowledge_id"]] = group
+
+    def _drop_detail(self, detail_id: str):
+        """移除知识项详情"""
+        detail = self.details.pop(detail_id, None)
+        if detail and detail["knowledge_id"] in self._details_by_item:
+            group = dict(self._details_by_item[detail["knowledge_id"]])
+            group.pop(detail_id, None)
+            self._details_by_item[detail["knowledge_id"]] = group
+
+    def _item_details(self, item_id: str) -> List[Dict[str, Any]]:
+        """获取知识项的详情"""
+        return list(self._details_by_item.get(item_id, {}).values())
+
+    def _writable_postings(self, token: str) -> PostingList:
+        """取得可修改的倒排表（与已发布版本共享的先复制）"""
+        postings = self.postings.get(token)
+        if postings is not None and token in self._owned:
+            return postings
+        postings = postings.copy() if postings is not None else PostingList()
+        self.postings[token] = postings
+        self._owned.add(token)
+        return postings
+
+    def _add_document(self, item: Dict[str, Any]):
+        """添加文档到索引"""
+        if self._free_docnos:
+            docno = heapq.heappop(self._free_docnos)
+        else:
+            docno = self._next_docno
+            self._next_docno += 1
+
+        doc = IndexedDocument(docno, item, self._item_details(item["id"]))
+        term_tf: Dict[str, List[int]] = {}
+        lengths = []
+        for position, field in enumerate(FIELDS):
+            # 规范化不改变长度，词元的结束偏移为起始偏移加词元长度，只保存起始偏移
+            offsets: Dict[str, array] = {}
+            length = 0
+            for token, start, _ in iter_tokens(doc.field_text(field)):
+                starts = offsets.get(token)
+                if starts is None:
+                    starts = offsets[token] = array("I")
+                starts.append(start)
+                term_tf.setdefault(token, [0] * len(FIELDS))[position] += 1
+                length += 1
+            if offsets:
+                doc.token_offsets[field] = offsets
+            lengths.append(length)
+            self.field_length_totals[field] += length
+        doc.field_lengths = tuple(lengths)
+        for token, field_tf in term_tf.items():
+            self._writable_postings(token).add(docno, pack_tf(field_tf))
+
+        self.documents[docno] = doc
+        self.doc_ids[doc.id] = docno
+        for field in FACET_FIELDS:
+            bits = self.facet_bits[field]
+            value = getattr(doc, field)
+            bits[value] = bits.get(value, 0) | (1 << docno)
+
+    def _remove_document(self, item_id: str):
+        """从索引中移除文档（按文档保存的词元找到其所在的倒排表）"""
+        docno = self.doc_ids.pop(item_id, None)
+        if docno is None:
+            return
+        doc = self.documents.pop(docno)
+        for field in FACET_FIELDS:
+            bits = self.facet_bits[field]
+            value = getattr(doc, field)
+            remaining = bits.get(value, 0) & ~(1 << docno)
+            if remaining:
+                bits[value] = remaining
+            else:
+                bits.pop(value, None)
+        for position, field in enumerate(FIELDS):
+            self.field_length_totals[field] -= doc.field_lengths[position]
+        for token in set().union(*doc.token_offsets.values()):
+            if token not in self.postings:
+                continue
+            postings = self._writable_postings(token)
+            postings.remove(docno)
+            if not postings:
+                del self.postings[token]
+        heapq.heappush(self._free_docnos, docno)
+
+    # ---- 读取 ----
+
+    def get_document(self, item_id: str) -> Optional[IndexedDocument]:
+        """根据知识项ID获取文档"""
+        docno = self.doc_ids.get(item_id)
+        return self.documents.get(docno) if docno is not None else None
+
+    def item_ids(self) -> List[str]:
+        """所有已索引的知识项ID"""
+        return list(self.doc_ids)
+
+    def item_details(self, item_id: str) -> List[Dict[str, Any]]:
+        """获取知识项的详情记录"""
+        return self._item_details(item_id)
+
+    def is_category_active(self, category_id: str) -> bool:
+        """分类是否启用"""
+        category = self.categories.get(category_id)
+        return bool(category and category.get("is_active"))
+
+    def is_item_active(self, item_id: str) -> bool:
+        """知识项存在且所属分类已启用"""
+        doc = self.get_document(item_id)
+        return doc is not None and self.is_category_active(doc.category_id)
+
+    def category_title(self, category_id: str) -> Optional[str]:
+        """获取分类标题"""
+        category = self.categories.get(category_id)
+        return category["title"] if category else None
+
+    def has_terms(self, text: str) -> bool:
+        """文本切分出的词元是否全部被索引收录"""
+        terms = tokenize_query(text)
+        return bool(terms) and all(term in self.postings for term in terms)
+
+    def match(self, query: str) -> List[IndexedDocument]:
+        """返回包含全部查询词元的文档"""
+        terms = tokenize_query(query)
+        if not terms:
+            return []
+
+        posting_lists = []
+        for term in terms:
+            postings = self.postings.get(term)
+            if not postings:
+                return []
+            posting_lists.append(postings)
+
+        # 从最短的倒排表开始求交集
+        posting_lists.sort(key=len)
+        candidates = set(posting_lists[0].docnos)
+        for postings in posting_lists[1:]:
+            candidates.intersection_update(postings.docnos)
+            if not candidates:
+                return []
+
+        return [self.documents[docno] for docno in candidates]
+
+    def match_bits(self, query: str) -> int:
+        """返回包含全部查询词元的文档位图"""
+        return bits_from_docnos(doc.docno for doc in self.match(query))
+
+    def item_bits(self, item_ids) -> int:
+        """知识项ID集合转为文档位图"""
+        return bits_from_docnos(
+            self.doc_ids[item_id] for item_id in item_ids if item_id in self.doc_ids
+        )
+
+    def active_bits(self) -> int:
+        """所属分类已启用的文档位图"""
+        bits = 0
+        for category_id, value_bits in self.facet_bits["category_id"].items():
+            if self.is_category_active(category_id):
+                bits |= value_bits
+        return bits
+
+    def filter_bits(self, bits: int, filters: Dict[str, Any]) -> int:
+        """按分面取值过滤位图（取值为None的字段不过滤）"""
+        for field, value in filters.items():
+            if value is not None:
+                bits &= self.facet_bits[field].get(value, 0)
+        return bits
+
+    def facet_counts(self, bits: int, filters: Optional[Dict[str, Any]] = None) -> Dict[str, Dict[Any, int]]:
+        """
+        统计位图中各分面取值的文档数
+        每个分面的计数应用其余分面的过滤条件，便于前端展示可切换的选项
+        """
+        filters = filters or {}
+        counts = {}
+        for field in FACET_FIELDS:
+            others = {name: value for name, value in filters.items() if name != field}
+            base = self.filter_bits(bits, others)
+            counts[field] = {}
+            for value, value_bits in self.facet_bits[field].items():
+                count = (base & value_bits).bit_count()
+                if count:
+                    counts[field][value] = count
+        return counts
+
+    def documents_from_bits(self, bits: int) -> List[IndexedDocument]:
+        """位图转为文档列表"""
+        return [self.documents[docno] for docno in iter_bits(bits) if docno in self.documents]
+
+    def search(
+        self,
+        query: str,
+        limit: Optional[int] = None,
+        require_all: bool = True,
+        predicate: Optional[Callable[[IndexedDocument], bool]] = None
+    ) -> List[Tuple[IndexedDocument, float]]:
+        """BM25F排序检索，返回按分数降序的 (文档, 分数)"""
+        terms = tokenize_query(query)
+        if not terms:
+            return []
+
+        k1 = SEARCH_CONFIG["bm25_k1"]
+        weights = SEARCH_CONFIG["field_weights"]
+        field_b = SEARCH_CONFIG["field_b"]
+
+        total_docs = len(self.documents)
+        if not total_docs:
+            return []
+        avg_lengths = {
+            field: (self.field_length_totals[field] / total_docs) or 1.0
+            for field in FIELDS
+        }
+
+        posting_lists = []
+        for term in terms:
+            postings = self.postings.get(term)
+            if not postings:
+                if require_all:
+                    return []
+                continue
+            posting_lists.append(postings)
+        if not posting_lists:
+            return []
+
+        candidates = None
+        if require_all:
+            posting_lists.sort(key=len)
+            candidates = set(posting_lists[0].docnos)
+            for postings in posting_lists[1:]:
+                candidates.intersection_update(postings.docnos)
+            if not candidates:
+                return []
+
+        # 只遍历倒排表，累加各词元的BM25F分数
+        fields = [
+            (position * TF_BITS, weights[field], field_b[field], avg_lengths[field])
+            for position, field in enumerate(FIELDS)
+        ]
+        scores: Dict[int, float] = {}
+        for postings in posting_lists:
+            df = len(postings)
+            idf = math.log(1 + (total_docs - df + 0.5) / (df + 0.5))
+            for docno, packed in zip(postings.docnos, postings.tfs):
+                if candidates is not None and docno not in candidates:
+                    continue
+                lengths = self.documents[docno].field_lengths
+                tf = 0.0
+                for position, (shift, weight, b, avg_length) in enumerate(fields):
+                    count = (packed >> shift) & TF_MAX
+                    if count:
+                        norm = 1 - b + b * lengths[position] / avg_length
+                        tf += weight * count / norm
+                scores[docno] = scores.get(docno, 0.0) + idf * tf * (k1 + 1) / (k1 + tf)
+
+        hits = [
+            (self.documents[docno], score) for docno, score in scores.items()
+            if predicate is None or predicate(self.documents[docno])
+        ]
+
+        # 先完整排序再截断
+        key = lambda hit: (hit[1], -hit[0].sort_order)
+        if limit is None:
+            return sorted(hits, key=key, reverse=True)
+        return heapq.nlargest(limit, hits, key=key)
+
+
+# 当前上下文固定的索引版本 ((索引, 版本), ...)；contextvars 在协程和线程池任务间各自独立
+_pinned_versions: ContextVar[Tuple[Tuple["SearchIndex", IndexVersion], ...]] = ContextVar(
+    "search_index_pinned_versions", default=()
+)
+
+
+class SearchIndex:
+    """
+    知识库倒排索引
+    读操作转发到当前版本（上下文内固定的版本，否则为最新发布的版本），不加锁；
+    写入在锁内复制出新版本、修改后整体发布
+    """
+
+    def __init__(self):
+        # 只串行化写入，读操作不加锁
+        self._lock = threading.RLock()
+        # 全量构建依次进行
+        self._build_lock = threading.Lock()
+        # 全量构建期间到达的变更，发布新版本前在其上重放（未在构建时为None）
+        self._pending_changes: Optional[List[Any]] = None
+        self._state = IndexVersion()
+        self._listeners = []
+        self.ready = False
+        self.build_time_ms = 0
+
+    def __getattr__(self, name: str):
+        # 实例和类上都没有的属性（索引数据和读方法）转发到当前版本
+        if name.startswith("__") or name == "_state":
+            raise AttributeError(name)
+        return getattr(self.current(), name)
+
+    def current(self) -> IndexVersion:
+        """当前版本"""
+        pinned = _pinned_versions.get()
+        if not pinned:
+            return self._state
+        for index, state in reversed(pinned):
+            if index is self:
+                return state
+        return self._state
+
+    @contextmanager
+    def _pin(self, state: IndexVersion) -> Iterator[IndexVersion]:
+        """在当前上下文中固定版本"""
+        token = _pinned_versions.set(_pinned_versions.get() + ((self, state),))
+        try:
+            yield state
+        finally:
+            _pinned_versions.reset(token)
+
+    def snapshot(self) -> ContextManager[IndexVersion]:
+        """
+        在同一索引版本上执行一组读操作：固定当前版本，期间本上下文（含其中启动的线程池任务）的读操作都使用该版本
+        不持有锁，增量更新和全量构建照常发布新版本
+        """
+        return self._pin(self.current())
+
+    @property
+    def building(self) -> bool:
+        """是否正在全量构建"""
+        return self._pending_changes is not None
+
+    def _publish(self, state: IndexVersion):
+        """发布新版本（持有写锁时调用）"""
+        state._owned = set()
+        self._state = state
+
+    def _notify(self, state: IndexVersion, event: str, *args):
+        """在发布的版本上通知监听器"""
+        with self._pin(state):
+            for listener in self._listeners:
+                getattr(listener, event)(self, *args)
+
+    def build(self, db: Session):
+        """
+        从数据库全量构建索引：在锁外构建新版本，完成后原子替换
+        从读取数据库之前开始记录到达的增量变更，替换前在新版本上重放，构建期间提交的修改不会丢失
+        """
+        with self._build_lock:
+            with self._lock:
+                self._pending_changes = []
+            try:
+                self._build(db)
+            finally:
+                with self._lock:
+                    self._pending_changes = None
+
+    def _build(self, db: Session):
+        start_time = time.time()
+
+        categories = [
+            {"id": c.id, "title": c.title, "is_active": c.is_active}
+            for c in db.query(KnowledgeCategory).all()
+        ]
+        details = [
+            {
+                "id": d.id,
+                "knowledge_id": d.knowledge_id,
+                "title": d.title,
+                "description": d.description,
+                "external_link": d.external_link,
+                "sort_order": d.sort_order,
+            }
+            for d in db.query(KnowledgeDetail).all()
+        ]
+        items = [
+            {
+                "id": i.id,
+                "category_id": i.category_id,
+                "title": i.title,
+                "description": i.description,
+                "content": i.content,
+                "status": i.status,
+                "sort_order": i.sort_order,
+            }
+            for i in db.query(KnowledgeItem).all()
+        ]
+
+        # 在锁外构建新版本，构建期间查询和增量更新照常使用旧版本
+        staged = IndexVersion()
+        for category in categories:
+            staged.categories[category["id"]] = category
+        for detail in details:
+            staged._put_detail(detail)
+        for item in items:
+            staged._add_document(item)
+
+        # 持锁重放构建期间的变更并替换版本（读取数据库前已提交的变更重放一次结果不变）
+        with self._lock:
+            for changes in self._pending_changes:
+                staged.apply_changes(changes)
+            self._pending_changes = []
+            staged.version = self._state.version + 1
+            self._publish(staged)
+            self.ready = True
+            self.build_time_ms = int((time.time() - start_time) * 1000)
+
+        self._notify(staged, "on_rebuild")
+
+    def add_listener(self, listener):
+        """注册索引变更监听器（需实现 on_rebuild 和 on_change）"""
+        self._listeners.append(listener)
+
+    def apply_changes(self, changes):
+        """
+        增量应用知识库变更：复制出新版本，只更新受影响文档的倒排表
+        全量构建期间同时记下变更，供构建完成时在新版本上重放
+        """
+        with self._lock:
+            if self._pending_changes is not None:
+                self._pending_changes.append(changes)
+            draft = self._state.copy()
+            upserted, removed = draft.apply_changes(changes)
+            self._publish(draft)
+
+        self._notify(draft, "on_change", upserted, removed)
+
+    def stats(self) -> Dict[str, Any]:
+        """索引统计信息"""
+        state = self._state
+        return {
+            "ready": self.ready,
+            "version": state.version,
+            "documents": len(state.documents),
+            "terms": len(state.postings),
+            "build_time_ms": self.build_time_ms,
+        }
+
+
+# 全局搜索索引实例
+search_index = SearchIndex()
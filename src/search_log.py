@@ -0,0 +1,225 @@
+"""
+搜索日志与热门搜索统计
+搜索记录先进入内存队列批量落库，热门搜索由有界内存的 Space-Saving 算法按时间窗口统计
+"""
+import logging
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from src.config import settings
+from src.models import SearchLog
+from src.search_index import normalize_text
+from src.write_behind import WriteBehindQueue
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    """规范化查询（全角转半角、小写、合并空白）"""
+    return re.sub(r"\s+", " ", normalize_text(query)).strip()
+
+
+def _timestamp(value: datetime) -> float:
+    """数据库时间转为时间戳（SQLite返回不带时区的UTC时间）"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class SpaceSaving:
+    """Space-Saving 高频项统计（最多保留 capacity 个计数器）"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counts: Dict[str, int] = {}
+        # 被替换计数器继承的误差上界
+        self.errors: Dict[str, int] = {}
+
+    def offer(self, item: str, count: int = 1):
+        """记录一次出现"""
+        if item in self.counts:
+            self.counts[item] += count
+            return
+        if len(self.counts) < self.capacity:
+            self.counts[item] = count
+            self.errors[item] = 0
+            return
+
+        # 替换计数最小的项，新项继承其计数作为误差
+        victim = min(self.counts, key=self.counts.get)
+        floor = self.counts.pop(victim)
+        self.errors.pop(victim, None)
+        self.counts[item] = floor + count
+        self.errors[item] = floor
+
+    def top(self, limit: int) -> List[Tuple[str, int]]:
+        """计数最高的若干项"""
+        return sorted(self.counts.items(), key=lambda entry: entry[1], reverse=True)[:limit]
+
+
+class TrendingQueries:
+    """按时间窗口滚动的热门查询统计"""
+
+    def __init__(self, window_seconds: int, window_count: int, capacity: int):
+        self.window_seconds = window_seconds
+        self.window_count = window_count
+        self.capacity = capacity
+        # (窗口编号, 统计器)，按时间先后排列
+        self._windows: List[Tuple[int, SpaceSaving]] = []
+        self._lock = threading.Lock()
+
+    def _current(self, now: float) -> SpaceSaving:
+        """获取当前窗口，淘汰过期窗口"""
+        window_id = int(now // self.window_seconds)
+        if not self._windows or self._windows[-1][0] != window_id:
+            self._windows.append((window_id, SpaceSaving(self.capacity)))
+        oldest = window_id - self.window_count + 1
+        while self._windows[0][0] < oldest:
+            self._windows.pop(0)
+        return self._windows[-1][1]
+
+    def record(self, query: str, count: int = 1, now: Optional[float] = None):
+        """记录查询"""
+        with self._lock:
+            self._current(now if now is not None else time.time()).offer(query, count)
+
+    def restore(self, entries: Iterable[Tuple[str, float]], now: Optional[float] = None):
+        """
+        用带时间戳的历史记录 (查询, 时间戳) 按时间重建各窗口，与已有窗口合并
+        每个窗口内按次数从高到低放入统计器，保证高频项不被低频项挤出
+        """
+        now = now if now is not None else time.time()
+        current_id = int(now // self.window_seconds)
+        oldest = current_id - self.window_count + 1
+        buckets: Dict[int, Dict[str, int]] = {}
+        for query, timestamp in entries:
+            # 时钟偏差导致的未来时间计入当前窗口
+            window_id = min(int(timestamp // self.window_seconds), current_id)
+            if window_id < oldest:
+                continue
+            counts = buckets.setdefault(window_id, {})
+            counts[query] = counts.get(query, 0) + 1
+
+        with self._lock:
+            for window_id, window in self._windows:
+                counts = buckets.setdefault(window_id, {})
+                for query, count in window.counts.items():
+                    counts[query] = counts.get(query, 0) + count
+            windows = []
+            for window_id in sorted(buckets):
+                if window_id < oldest:
+                    continue
+                sketch = SpaceSaving(self.capacity)
+                for query, count in sorted(buckets[window_id].items(), key=lambda entry: entry[1], reverse=True):
+                    sketch.offer(query, count)
+                windows.append((window_id, sketch))
+            self._windows = windows
+
+    def top(self, limit: int, now: Optional[float] = None) -> List[Tuple[str, int]]:
+        """合并所有有效窗口，返回热门查询"""
+        with self._lock:
+            self._current(now if now is not None else time.time())
+            merged: Dict[str, int] = {}
+            for _, window in self._windows:
+                for query, count in window.counts.items():
+                    merged[query] = merged.get(query, 0) + count
+        return sorted(merged.items(), key=lambda entry: entry[1], reverse=True)[:limit]
+
+
+class SearchLogger:
+    """搜索日志记录器"""
+
+    def __init__(self):
+        self.queue = WriteBehindQueue(
+            "search_log",
+            SearchLog,
+            batch_size=settings.search_log_batch_size,
+            flush_interval=settings.search_log_flush_interval,
+            max_size=settings.search_log_max_buffer
+        )
+        self.trending = TrendingQueries(
+            window_seconds=settings.search_trending_window_seconds,
+            window_count=settings.search_trending_windows,
+            capacity=settings.search_trending_capacity
+        )
+        self._lock = threading.Lock()
+        # 启动前已落库的搜索次数 + 启动后记录的次数
+        self._base_total = 0
+        self._recorded = 0
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """注册查询记录回调，callback(规范化查询)"""
+        self._listeners.append(callback)
+
+    def load(self, db: Session):
+        """启动时加载历史总数，并按记录时间把最近各窗口内的日志放回对应窗口"""
+        self._base_total = db.query(func.count(SearchLog.id)).scalar() or 0
+
+        horizon = self.trending.window_seconds * self.trending.window_count
+        since = datetime.now(timezone.utc) - timedelta(seconds=horizon)
+        # 与 record 一致，无结果的查询不计入热门搜索
+        rows = db.query(SearchLog.normalized_query, SearchLog.created_at).filter(
+            SearchLog.created_at >= since,
+            SearchLog.result_count > 0
+        ).yield_per(1000)
+        self.trending.restore(
+            (query, _timestamp(created_at)) for query, created_at in rows if created_at is not None
+        )
+
+    def record(
+        self,
+        query: str,
+        result_count: int,
+        user_id: Optional[str] = None,
+        response_time_ms: Optional[int] = None
+    ):
+        """记录一次搜索（不访问数据库）"""
+        normalized = normalize_query(query)
+        if not normalized:
+            return
+
+        self.queue.put({
+            "user_id": user_id,
+            "query": query[:200],
+            "normalized_query": normalized[:200],
+            "result_count": result_count,
+            "response_time_ms": response_time_ms,
+            "created_at": datetime.now(timezone.utc),
+        })
+        # 无结果的查询不计入热门搜索
+        if result_count > 0:
+            self.trending.record(normalized)
+            for callback in self._listeners:
+                callback(normalized)
+        with self._lock:
+            self._recorded += 1
+
+    def popular(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """热门搜索"""
+        return [{"query": query, "count": count} for query, count in self.trending.top(limit)]
+
+    @property
+    def total_searches(self) -> int:
+        """总搜索次数"""
+        return self._base_total + self._recorded
+
+    async def start(self):
+        """启动批量落库任务"""
+        await self.queue.start()
+
+    async def stop(self):
+        """停止任务并刷写剩余日志"""
+        await self.queue.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        """统计信息"""
+        return {"total_searches": self.total_searches, "queue": self.queue.stats()}
+
+
+# 全局搜索日志实例
+search_logger = SearchLogger()
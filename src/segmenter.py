@@ -0,0 +1,223 @@
+"""
+中文分词模块 - 基于词典的有向无环图（DAG）分词
+词典由领域术语、常用词以及知识项/分类/详情标题自动构建，编译为紧凑的字典树；
+对每个位置枚举词典中的所有成词终点构成DAG，再用动态规划求最大概率切分
+"""
+import math
+import re
+import threading
+from typing import List, Dict, Set, Iterator, Optional, Iterable
+from src.search_index import SearchIndex, TOKEN_PATTERN, CJK_CHARS, normalize_text
+
+# 领域术语
+DOMAIN_TERMS = [
+    "图像信号处理", "去马赛克", "白平衡", "自动白平衡", "自动曝光", "自动对焦", "曝光", "对焦",
+    "降噪", "时域降噪", "空域降噪", "多帧降噪", "噪声", "噪点", "锐化", "边缘增强",
+    "伽马", "伽马校正", "色彩校正", "颜色校正", "颜色校正矩阵", "色彩还原", "镜头阴影校正",
+    "暗角", "黑电平", "黑电平校正", "坏点", "坏点校正", "宽动态", "高动态范围", "色调映射",
+    "色温", "色偏", "偏色", "增益", "数字增益", "模拟增益", "传感器", "图像传感器", "拜耳",
+    "插值", "饱和度", "对比度", "亮度", "色度", "直方图", "去雾", "畸变", "畸变校正",
+    "图像质量", "分辨率", "帧率", "镜头", "光源", "像素", "滤波", "滤波器", "卷积",
+    "紫边", "摩尔纹", "伪彩", "色域", "色彩空间", "曝光时间", "感光度", "信噪比", "动态范围",
+    "光圈", "快门", "防抖", "电子防抖", "标定", "调试", "调优", "图像", "算法",
+    "拖影", "鬼影", "闪烁", "过曝", "欠曝", "眩光", "条纹",
+]
+
+# 常用词（帮助切开问句中的非领域部分）
+COMMON_WORDS = [
+    "如何", "怎么", "怎样", "什么", "为什么", "哪些", "哪个", "可以", "需要", "应该", "问题",
+    "原因", "方法", "影响", "区别", "作用", "原理", "调整", "设置", "参数", "效果", "出现",
+    "导致", "解决", "优化", "提高", "降低", "图片", "模块", "流程", "一下", "这个", "那个",
+    "我们", "你们", "请问", "是否", "有没有", "时候", "如果", "因为", "所以", "但是", "还是",
+    "或者", "以及", "之间", "进行", "一个", "没有", "不是", "太大", "太小", "偏高", "偏低",
+]
+
+# 关键词提取时忽略的词
+STOP_WORDS = {
+    "的", "是", "在", "有", "和", "与", "或", "但", "而", "了", "吗", "呢", "吧", "啊", "把",
+    "被", "对", "让", "给", "也", "都", "就", "还", "这", "那", "我", "你", "他", "它",
+    "如果", "因为", "所以", "如何", "怎么", "怎样", "什么", "为什么", "哪些", "哪个", "请问",
+    "是否", "有没有", "一下", "这个", "那个", "我们", "你们", "可以", "需要", "应该", "时候",
+    "但是", "还是", "或者", "以及", "之间", "进行", "一个", "没有", "不是", "问题",
+    "出现", "导致", "原因", "方法", "效果",
+}
+
+# 词频权重：领域术语 > 标题片段 > 常用词
+TERM_WEIGHTS = {
+    "domain": 200,
+    "title": 100,
+    "common": 50,
+}
+
+CJK_RUN = re.compile(r"[" + CJK_CHARS + "]+")
+
+# 字典树边的键：父节点编号 * CHAR_SPACE + 字符码位
+CHAR_SPACE = 0x110000
+
+
+class Trie:
+    """紧凑字典树：所有边存放在一个以整数为键的字典中"""
+
+    def __init__(self):
+        self._edges: Dict[int, int] = {}
+        # 终止节点 -> 词频
+        self._freq: Dict[int, int] = {}
+        self._nodes = 1
+        self.total = 0
+
+    def add(self, word: str, freq: int):
+        """插入词（已存在时累加词频）"""
+        node = 0
+        for ch in word:
+            key = node * CHAR_SPACE + ord(ch)
+            child = self._edges.get(key)
+            if child is None:
+                child = self._nodes
+                self._nodes += 1
+                self._edges[key] = child
+            node = child
+        self._freq[node] = self._freq.get(node, 0) + freq
+        self.total += freq
+
+    def ends(self, text: str, start: int) -> Iterator[tuple]:
+        """从 start 开始在词典中成词的所有 (终点, 词频)"""
+        node = 0
+        edges = self._edges
+        for end in range(start, len(text)):
+            node = edges.get(node * CHAR_SPACE + ord(text[end]))
+            if node is None:
+                return
+            freq = self._freq.get(node)
+            if freq:
+                yield end + 1, freq
+
+    def __contains__(self, word: str) -> bool:
+        node = 0
+        for ch in word:
+            node = self._edges.get(node * CHAR_SPACE + ord(ch))
+            if node is None:
+                return False
+        return node in self._freq
+
+    def __len__(self) -> int:
+        return len(self._freq)
+
+
+def title_terms(title: Optional[str]) -> List[str]:
+    """标题中的中文片段（至少2个字）"""
+    return [run for run in CJK_RUN.findall(normalize_text(title)) if len(run) >= 2]
+
+
+class Segmenter:
+    """词典分词器"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.trie = self._base_trie()
+        self._log_total = math.log(self.trie.total)
+        self._titles: Set[str] = set()
+
+    @staticmethod
+    def _base_trie() -> Trie:
+        """只包含内置词表的字典树"""
+        trie = Trie()
+        for word in DOMAIN_TERMS:
+            trie.add(word, TERM_WEIGHTS["domain"])
+        for word in COMMON_WORDS:
+            trie.add(word, TERM_WEIGHTS["common"])
+        return trie
+
+    def _add_titles(self, trie: Trie, titles: Iterable[Optional[str]]):
+        """把标题片段加入词典"""
+        for title in titles:
+            for term in title_terms(title):
+                if term not in self._titles:
+                    self._titles.add(term)
+                    trie.add(term, TERM_WEIGHTS["title"])
+
+    def _index_titles(self, index: SearchIndex, item_ids: Iterable[str]) -> List[Optional[str]]:
+        """收集知识项及其详情的标题"""
+        titles = []
+        for item_id in item_ids:
+            doc = index.get_document(item_id)
+            if doc is None:
+                continue
+            titles.append(doc.title)
+            titles.extend(detail.get("title") for detail in index.item_details(item_id))
+        return titles
+
+    def on_rebuild(self, index: SearchIndex):
+        """索引全量构建后重新编译词典"""
+        titles = [category.get("title") for category in index.categories.values()]
+        titles.extend(self._index_titles(index, index.item_ids()))
+
+        with self._lock:
+            self._titles = set()
+            trie = self._base_trie()
+            self._add_titles(trie, titles)
+            self.trie = trie
+            self._log_total = math.log(trie.total)
+
+    def on_change(self, index: SearchIndex, upserted: Set[str], removed: Set[str]):
+        """增量加入新标题（删除的词留到下次全量构建时清理，不影响分词正确性）"""
+        titles = [category.get("title") for category in index.categories.values()]
+        titles.extend(self._index_titles(index, upserted))
+        with self._lock:
+            self._add_titles(self.trie, titles)
+            self._log_total = math.log(self.trie.total)
+
+    def _cut_cjk(self, text: str) -> List[str]:
+        """对连续中文做DAG最大概率切分"""
+        trie = self.trie
+        log_total = self._log_total
+        size = len(text)
+        # route[i] = (从i到结尾的最大对数概率, 本段终点)
+        route = [(0.0, size)] * (size + 1)
+        for i in range(size - 1, -1, -1):
+            # 未登录的单字按词频1计
+            best = (-log_total + route[i + 1][0], i + 1)
+            for end, freq in trie.ends(text, i):
+                score = math.log(freq) - log_total + route[end][0]
+                if score > best[0]:
+                    best = (score, end)
+            route[i] = best
+
+        words = []
+        i = 0
+        while i < size:
+            end = route[i][1]
+            words.append(text[i:end])
+            i = end
+        return words
+
+    def cut(self, text: Optional[str]) -> List[str]:
+        """分词：中文按词典切分，拉丁单词和数字保持完整，忽略标点"""
+        words = []
+        for match in TOKEN_PATTERN.finditer(normalize_text(text)):
+            token = match.group()
+            if token.isascii():
+                words.append(token)
+            else:
+                words.extend(self._cut_cjk(token))
+        return words
+
+    def extract_keywords(self, text: Optional[str], limit: int = 10) -> List[str]:
+        """提取关键词：去掉停用词和未登录的单字，按出现顺序去重"""
+        keywords = []
+        seen = set()
+        for word in self.cut(text):
+            if word in STOP_WORDS or word in seen:
+                continue
+            if len(word) == 1 and word not in self.trie:
+                continue
+            seen.add(word)
+            keywords.append(word)
+        return keywords[:limit]
+
+    def stats(self) -> Dict[str, int]:
+        """分词词典统计信息"""
+        return {"words": len(self.trie), "title_terms": len(self._titles)}
+
+
+# 全局分词器实例
+segmenter = Segmenter()
@@ -0,0 +1,243 @@
+"""
+请求合并（single-flight）模块
+相同指纹的并发请求只向上游发起一次调用，其余请求等待并共享结果（流式请求共享事件流）
+配置Redis时通过短期锁和结果键在多个工作进程之间协调：
+抢到锁的进程调用上游并写入结果，其余进程轮询结果键，锁释放仍无结果时自行调用
+"""
+import asyncio
+import logging
+import threading
+import uuid
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+from src.cache import cache_manager
+from src.config import CACHE_KEYS
+
+logger = logging.getLogger(__name__)
+
+
+class _StreamFlight:
+    """一次共享的流式调用：缓存已产出的事件，订阅者各自从头读取"""
+
+    def __init__(self):
+        self.events: List[Any] = []
+        self.done = False
+        self.subscribers = 0
+        self.condition = asyncio.Condition()
+        self.task: Optional[asyncio.Task] = None
+
+    async def append(self, event: Any):
+        async with self.condition:
+            self.events.append(event)
+            self.condition.notify_all()
+
+    async def finish(self):
+        async with self.condition:
+            self.done = True
+            self.condition.notify_all()
+
+
+class SingleFlight:
+    """请求合并器"""
+
+    def __init__(self, name: str, lock_ttl: int = 60, result_ttl: int = 15, poll_interval: float = 0.1):
+        self.name = name
+        self.lock_ttl = lock_ttl
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self._calls: Dict[str, asyncio.Task] = {}
+        self._streams: Dict[str, _StreamFlight] = {}
+        self._stats_lock = threading.Lock()
+        # 实际调用上游的次数 / 本进程内合并的请求数 / 跨进程共享结果的请求数
+        self.leaders = 0
+        self.followers = 0
+        self.remote_followers = 0
+
+    def _count(self, field: str):
+        with self._stats_lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    # ---- 跨进程协调（Redis） ----
+
+    def _keys(self, key: str):
+        lock_key = cache_manager._generate_key(CACHE_KEYS["flight_lock"], name=self.name, key_hash=key)
+        result_key = cache_manager._generate_key(CACHE_KEYS["flight_result"], name=self.name, key_hash=key)
+        return lock_key, result_key
+
+    def _acquire(self, key: str) -> Optional[str]:
+        """尝试获取跨进程锁，成功返回锁令牌；未配置Redis时视为获取成功"""
+        client = cache_manager.redis_client
+        if client is None:
+            return ""
+        token = uuid.uuid4().hex
+        try:
+            if client.set(self._keys(key)[0], token, nx=True, ex=self.lock_ttl):
+                return token
+        except Exception as e:
+            logger.warning(f"请求合并锁获取失败: {e}")
+            return ""
+        return None
+
+    def _release(self, key: str, token: str):
+        """释放自己持有的锁"""
+        client = cache_manager.redis_client
+        if client is None or not token:
+            return
+        lock_key = self._keys(key)[0]
+        try:
+            current = client.get(lock_key)
+            if current is not None and current.decode("utf-8") == token:
+                client.delete(lock_key)
+        except Exception as e:
+            logger.warning(f"请求合并锁释放失败: {e}")
+
+    def _publish(self, key: str, result: Any):
+        """写入结果键供其他进程读取"""
+        cache_manager.set(self._keys(key)[1], result, self.result_ttl)
+
+    async def _wait_remote(self, key: str) -> Optional[Any]:
+        """等待持锁进程写入结果；锁释放或过期仍无结果时返回None"""
+        lock_key, result_key = self._keys(key)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.lock_ttl
+        while loop.time() < deadline:
+            result = cache_manager.get(result_key)
+            if result is not None:
+                return result
+            if not cache_manager.exists(lock_key):
+                # 锁释放与结果写入之间可能有先后，再读一次
+                return cache_manager.get(result_key)
+            await asyncio.sleep(self.poll_interval)
+        return None
+
+    # ---- 普通调用 ----
+
+    async def do(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[Any]],
+        publish: Callable[[Any], bool] = lambda result: True
+    ) -> Any:
+        """
+        合并执行 fn：同一进程内相同 key 的并发调用共享一次执行；
+        publish(结果) 为真时把结果写入Redis供其他进程共享（结果需可JSON序列化）
+        """
+        task = self._calls.get(key)
+        if task is not None:
+            self._count("followers")
+        else:
+            task = asyncio.ensure_future(self._lead(key, fn, publish))
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        # 单个调用方取消不影响其他等待者
+        return await asyncio.shield(task)
+
+    async def _lead(self, key: str, fn: Callable[[], Awaitable[Any]], publish: Callable[[Any], bool]) -> Any:
+        token = self._acquire(key)
+        if token is None:
+            result = await self._wait_remote(key)
+            if result is not None:
+                self._count("remote_followers")
+                return result
+            token = self._acquire(key) or ""
+
+        self._count("leaders")
+        try:
+            result = await fn()
+            if token and publish(result):
+                self._publish(key, result)
+            return result
+        finally:
+            self._release(key, token)
+
+    # ---- 流式调用 ----
+
+    async def stream(
+        self,
+        key: str,
+        fn: Callable[[], AsyncIterator[Any]],
+        publish: Callable[[Any], Optional[Any]] = lambda event: None,
+        replay: Callable[[Any], List[Any]] = lambda result: []
+    ) -> AsyncIterator[Any]:
+        """
+        合并流式调用：同一进程内相同 key 的订阅者共享同一个上游事件流，后加入者先补发已有事件；
+        所有订阅者都离开时取消上游。publish(事件) 返回非None时写入Redis，
+        其他进程的请求读取该结果并通过 replay(结果) 还原为事件序列
+        """
+        flight = self._streams.get(key)
+        if flight is not None:
+            self._count("followers")
+        else:
+            flight = _StreamFlight()
+            self._streams[key] = flight
+            flight.task = asyncio.ensure_future(self._pump(key, flight, fn, publish, replay))
+
+        flight.subscribers += 1
+        position = 0
+        try:
+            while True:
+                async with flight.condition:
+                    await flight.condition.wait_for(lambda: len(flight.events) > position or flight.done)
+                    batch = flight.events[position:]
+                    finished = flight.done
+                for event in batch:
+                    yield event
+                position += len(batch)
+                if finished and position >= len(flight.events):
+                    return
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                # 没有订阅者了，取消上游请求
+                flight.task.cancel()
+                if self._streams.get(key) is flight:
+                    del self._streams[key]
+
+    async def _pump(
+        self,
+        key: str,
+        flight: _StreamFlight,
+        fn: Callable[[], AsyncIterator[Any]],
+        publish: Callable[[Any], Optional[Any]],
+        replay: Callable[[Any], List[Any]]
+    ):
+        """驱动上游事件流并广播给订阅者"""
+        token = ""
+        try:
+            token = self._acquire(key)
+            if token is None:
+                result = await self._wait_remote(key)
+                if result is not None:
+                    self._count("remote_followers")
+                    for event in replay(result):
+                        await flight.append(event)
+                    return
+                token = self._acquire(key) or ""
+
+            self._count("leaders")
+            source = fn()
+            try:
+                async for event in source:
+                    result = publish(event)
+                    if token and result is not None:
+                        self._publish(key, result)
+                    await flight.append(event)
+            finally:
+                await source.aclose()
+        finally:
+            self._release(key, token)
+            if self._streams.get(key) is flight:
+                del self._streams[key]
+            await flight.finish()
+
+    def stats(self) -> Dict[str, Any]:
+        """合并统计信息"""
+        with self._stats_lock:
+            merged = self.followers + self.remote_followers
+            total = self.leaders + merged
+            return {
+                "leaders": self.leaders,
+                "followers": self.followers,
+                "remote_followers": self.remote_followers,
+                "coalesced_rate": round(merged / total, 4) if total else 0.0,
+                "in_flight": len(self._calls) + len(self._streams),
+            }
@@ -0,0 +1,300 @@
+"""
+搜索建议模块 - 基于有序数组 + 二分查找的前缀补全
+索引知识项标题、分类标题、详情标题的各个词起始位置及拼音首字母，按热度加权排序；
+短前缀命中的范围最大，预先计算其top-k建议，热度变化时增量调整，短语增删时失效重算
+"""
+import bisect
+import heapq
+import threading
+from typing import List, Dict, Optional, Set, Tuple
+from src.search_index import SearchIndex, normalize_text, iter_tokens
+
+
+# 不同来源的基础权重
+SOURCE_WEIGHTS = {
+    "category": 3.0,
+    "item": 2.0,
+    "detail": 1.0,
+}
+
+# 从整个短语开头匹配时的加分
+PREFIX_BONUS = 10.0
+
+# 预先计算top-k建议的前缀最大长度和保留条数（不小于接口的数量上限）
+CACHED_PREFIX_LENGTH = 3
+CACHED_TOP_K = 20
+
+# GB2312一级汉字按拼音排序，各声母首字对应的编码下界
+_GB2312_INITIALS = [
+    (-20319, "a"), (-20283, "b"), (-19775, "c"), (-19218, "d"), (-18710, "e"),
+    (-18526, "f"), (-18239, "g"), (-17922, "h"), (-17417, "j"), (-16474, "k"),
+    (-16212, "l"), (-15640, "m"), (-15165, "n"), (-14922, "o"), (-14914, "p"),
+    (-14630, "q"), (-14149, "r"), (-14090, "s"), (-13318, "t"), (-12838, "w"),
+    (-12556, "x"), (-11847, "y"), (-11055, "z"),
+]
+_GB2312_CODES = [code for code, _ in _GB2312_INITIALS]
+_GB2312_LEVEL1_END = -10247
+
+
+def pinyin_initial(ch: str) -> Optional[str]:
+    """获取汉字的拼音首字母（仅支持GB2312一级汉字）"""
+    try:
+        encoded = ch.encode("gb2312")
+    except UnicodeEncodeError:
+        return None
+    if len(encoded) != 2:
+        return None
+
+    code = encoded[0] * 256 + encoded[1] - 65536
+    if code < _GB2312_CODES[0] or code > _GB2312_LEVEL1_END:
+        return None
+    return _GB2312_INITIALS[bisect.bisect_right(_GB2312_CODES, code) - 1][1]
+
+
+def pinyin_initials(text: str) -> str:
+    """生成文本的拼音首字母串，拉丁单词保持原样"""
+    parts = []
+    for token, _, _ in iter_tokens(text, unigrams=True):
+        if len(token) == 1 and not token.isascii():
+            initial = pinyin_initial(token)
+            if initial:
+                parts.append(initial)
+        elif token.isascii():
+            parts.append(token)
+    return "".join(parts)
+
+
+def suggestion_keys(phrase: str) -> List[Tuple[str, bool]]:
+    """生成短语的检索键：每个词起始位置的后缀及拼音首字母，返回 (键, 是否从开头匹配)"""
+    normalized = normalize_text(phrase)
+    starts = sorted({0} | {start for _, start, _ in iter_tokens(phrase)})
+
+    keys = []
+    seen = set()
+    for start in starts:
+        key = normalized[start:].strip()
+        if key and key not in seen:
+            seen.add(key)
+            keys.append((key, start == 0))
+
+    initials = pinyin_initials(phrase)
+    if initials and initials not in seen and initials != normalized:
+        keys.append((initials, True))
+    return keys
+
+
+class Suggester:
+    """搜索建议索引"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # 有序检索键: (键, 短语, 是否从开头匹配)
+        self._keys: List[Tuple[str, str, bool]] = []
+        # 短语 -> 来源集合
+        self._phrase_owners: Dict[str, Set[str]] = {}
+        # 来源 -> (短语, 基础权重)
+        self._owners: Dict[str, Tuple[str, float]] = {}
+        # 知识项ID -> 详情来源集合
+        self._item_details: Dict[str, Set[str]] = {}
+        # 短语热度
+        self._popularity: Dict[str, float] = {}
+        # 短前缀 -> 排好序的top-k (短语, 分数)
+        self._top: Dict[str, List[Tuple[str, float]]] = {}
+        # 全量构建时先追加再统一排序
+        self._bulk_loading = False
+        self.ready = False
+
+    def _weight(self, phrase: str) -> float:
+        """短语权重 = 最高来源权重 + 热度"""
+        owners = self._phrase_owners.get(phrase, ())
+        base = max((self._owners[owner][1] for owner in owners), default=0.0)
+        return base + self._popularity.get(phrase, 0.0)
+
+    @staticmethod
+    def _phrase_prefixes(phrase: str) -> Dict[str, bool]:
+        """短语各检索键的短前缀，返回 {前缀: 是否从开头匹配}"""
+        prefixes: Dict[str, bool] = {}
+        for key, is_start in suggestion_keys(phrase):
+            for n in range(1, min(len(key), CACHED_PREFIX_LENGTH) + 1):
+                prefixes[key[:n]] = prefixes.get(key[:n], False) or is_start
+        return prefixes
+
+    @staticmethod
+    def _rank(best: Dict[str, float], limit: int) -> List[Tuple[str, float]]:
+        """按分数降序、短语长度升序取前 limit 条"""
+        return heapq.nlargest(limit, best.items(), key=lambda entry: (entry[1], -len(entry[0])))
+
+    def _scan(self, key: str) -> Dict[str, float]:
+        """遍历前缀匹配的检索键，返回各短语的最高分"""
+        lo = bisect.bisect_left(self._keys, (key,))
+        hi = bisect.bisect_left(self._keys, (key + "\uffff",))
+        best: Dict[str, float] = {}
+        for _, phrase, is_start in self._keys[lo:hi]:
+            score = self._weight(phrase) + (PREFIX_BONUS if is_start else 0.0)
+            if score > best.get(phrase, -1.0):
+                best[phrase] = score
+        return best
+
+    def _precompute(self):
+        """一次遍历全部检索键，计算每个短前缀的top-k建议"""
+        candidates: Dict[str, Dict[str, float]] = {}
+        weights: Dict[str, float] = {}
+        for key, phrase, is_start in self._keys:
+            weight = weights.get(phrase)
+            if weight is None:
+                weight = weights[phrase] = self._weight(phrase)
+            score = weight + (PREFIX_BONUS if is_start else 0.0)
+            for n in range(1, min(len(key), CACHED_PREFIX_LENGTH) + 1):
+                best = candidates.setdefault(key[:n], {})
+                if score > best.get(phrase, -1.0):
+                    best[phrase] = score
+        self._top = {prefix: self._rank(best, CACHED_TOP_K) for prefix, best in candidates.items()}
+
+    def _invalidate(self, phrase: str):
+        """短语增删或来源权重变化后，丢弃受影响前缀的预计算结果"""
+        if self._bulk_loading:
+            return
+        for prefix in self._phrase_prefixes(phrase):
+            self._top.pop(prefix, None)
+
+    def _add(self, owner: str, phrase: str, weight: float):
+        """添加来源短语"""
+        phrase = (phrase or "").strip()
+        if not phrase:
+            return
+        self._owners[owner] = (phrase, weight)
+        owners = self._phrase_owners.setdefault(phrase, set())
+        owners.add(owner)
+        self._invalidate(phrase)
+        if len(owners) == 1:
+            for key, is_start in suggestion_keys(phrase):
+                if self._bulk_loading:
+                    self._keys.append((key, phrase, is_start))
+                else:
+                    bisect.insort(self._keys, (key, phrase, is_start))
+
+    def _discard(self, owner: str):
+        """移除来源短语"""
+        entry = self._owners.pop(owner, None)
+        if entry is None:
+            return
+        phrase = entry[0]
+        owners = self._phrase_owners.get(phrase)
+        owners.discard(owner)
+        self._invalidate(phrase)
+        if owners:
+            return
+        del self._phrase_owners[phrase]
+        for key, is_start in suggestion_keys(phrase):
+            i = bisect.bisect_left(self._keys, (key, phrase, is_start))
+            if i < len(self._keys) and self._keys[i] == (key, phrase, is_start):
+                del self._keys[i]
+
+    def _sync_item(self, index: SearchIndex, item_id: str):
+        """同步知识项及其详情"""
+        self._discard(f"item:{item_id}")
+        for owner in self._item_details.pop(item_id, set()):
+            self._discard(owner)
+
+        doc = index.get_document(item_id)
+        if doc is None:
+            return
+        self._add(f"item:{item_id}", doc.title, SOURCE_WEIGHTS["item"])
+        owners = set()
+        for detail in index.item_details(item_id):
+            owner = f"detail:{detail['id']}"
+            self._add(owner, detail.get("title"), SOURCE_WEIGHTS["detail"])
+            owners.add(owner)
+        self._item_details[item_id] = owners
+
+    def _sync_categories(self, index: SearchIndex):
+        """同步分类标题"""
+        current = {f"category:{cid}": c for cid, c in index.categories.items()}
+        for owner in [o for o in self._owners if o.startswith("category:") and o not in current]:
+            self._discard(owner)
+        for owner, category in current.items():
+            if self._owners.get(owner, (None,))[0] != category.get("title"):
+                self._discard(owner)
+                self._add(owner, category.get("title"), SOURCE_WEIGHTS["category"])
+
+    def on_rebuild(self, index: SearchIndex):
+        """索引全量构建后重建建议"""
+        with self._lock:
+            self._keys = []
+            self._phrase_owners = {}
+            self._owners = {}
+            self._item_details = {}
+            self._bulk_loading = True
+            try:
+                self._sync_categories(index)
+                for item_id in index.item_ids():
+                    self._sync_item(index, item_id)
+            finally:
+                self._bulk_loading = False
+                self._keys.sort()
+            self._precompute()
+            self.ready = True
+
+    def on_change(self, index: SearchIndex, upserted: Set[str], removed: Set[str]):
+        """索引增量更新后同步建议"""
+        with self._lock:
+            self._sync_categories(index)
+            for item_id in upserted | removed:
+                self._sync_item(index, item_id)
+
+    def bump(self, phrase: str, amount: float = 1.0):
+        """增加与短语完整匹配（忽略大小写和全半角）的建议的热度"""
+        key = normalize_text(phrase).strip()
+        if not key:
+            return
+        with self._lock:
+            i = bisect.bisect_left(self._keys, (key,))
+            while i < len(self._keys) and self._keys[i][0] == key:
+                _, matched, is_start = self._keys[i]
+                if is_start:
+                    self._popularity[matched] = self._popularity.get(matched, 0.0) + amount
+                    self._raise_cached(matched)
+                i += 1
+
+    def _raise_cached(self, phrase: str):
+        """短语热度增加后调整各短前缀的预计算结果（分数只增不减，未入选的短语只需与末位比较）"""
+        weight = self._weight(phrase)
+        for prefix, is_start in self._phrase_prefixes(phrase).items():
+            top = self._top.get(prefix)
+            if top is None:
+                continue
+            score = weight + (PREFIX_BONUS if is_start else 0.0)
+            best = dict(top)
+            if phrase not in best and len(top) >= CACHED_TOP_K \
+                    and (score, -len(phrase)) <= (top[-1][1], -len(top[-1][0])):
+                continue
+            best[phrase] = score
+            self._top[prefix] = self._rank(best, CACHED_TOP_K)
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[str]:
+        """返回前缀匹配的top-k建议（短前缀直接取预计算结果）"""
+        key = normalize_text(prefix).strip()
+        if not key:
+            return []
+
+        with self._lock:
+            if len(key) <= CACHED_PREFIX_LENGTH and limit <= CACHED_TOP_K:
+                top = self._top.get(key)
+                if top is None:
+                    top = self._rank(self._scan(key), CACHED_TOP_K)
+                    # 只缓存有结果的前缀，任意输入不会让缓存无限增长
+                    if top:
+                        self._top[key] = top
+                return [phrase for phrase, _ in top[:limit]]
+            best = self._scan(key)
+
+        return [phrase for phrase, _ in self._rank(best, limit)]
+
+    def stats(self) -> Dict[str, int]:
+        """建议索引统计信息"""
+        with self._lock:
+            return {"phrases": len(self._phrase_owners), "keys": len(self._keys), "cached_prefixes": len(self._top)}
+
+
+# 全局搜索建议实例
+suggester = Suggester()
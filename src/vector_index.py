@@ -0,0 +1,423 @@
+"""
+向量检索模块 - 基于NumPy的本地语义检索
+知识项向量保存在连续的float32矩阵中（可内存映射到磁盘），top-k余弦检索为一次矩阵-向量乘法；
+磁盘上的矩阵附带元数据（向量化配置、行号对应的知识项和文本哈希、IDF），
+启动时文档与元数据一致则直接加载，不再重新向量化
+"""
+import copy
+import json
+import logging
+import math
+import os
+import threading
+import uuid
+import zlib
+from typing import List, Dict, Optional, Set, Tuple, Callable
+import numpy as np
+from src.config import settings
+from src.search_index import SearchIndex, IndexedDocument, normalize_text, TOKEN_PATTERN
+
+logger = logging.getLogger(__name__)
+
+
+class HashingEmbedder:
+    """哈希字符n-gram TF-IDF向量化（本地计算，无需网络）"""
+
+    name = "hashing"
+
+    def __init__(self, dim: int = 512, max_n: int = 3):
+        self.dim = dim
+        self.max_n = max_n
+        self.idf = np.ones(dim, dtype=np.float32)
+
+    def _features(self, text: str) -> Dict[int, int]:
+        """提取哈希后的n-gram特征及其词频"""
+        counts: Dict[int, int] = {}
+        for match in TOKEN_PATTERN.finditer(normalize_text(text)):
+            token = match.group()
+            if token.isascii():
+                # 拉丁单词：整词 + 带边界的字符三元组
+                grams = [token]
+                padded = f"<{token}>"
+                grams.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+            else:
+                # 中文：字符1~max_n元组
+                grams = [
+                    token[i:i + n]
+                    for n in range(1, self.max_n + 1)
+                    for i in range(len(token) - n + 1)
+                ]
+            for gram in grams:
+                bucket = zlib.crc32(gram.encode("utf-8")) % self.dim
+                counts[bucket] = counts.get(bucket, 0) + 1
+        return counts
+
+    def fit(self, texts: List[str]):
+        """根据语料统计IDF"""
+        df = np.zeros(self.dim, dtype=np.float32)
+        for text in texts:
+            for bucket in self._features(text):
+                df[bucket] += 1
+        total = max(len(texts), 1)
+        self.idf = (np.log((1 + total) / (1 + df)) + 1).astype(np.float32)
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """向量化文本，返回L2归一化的float32矩阵"""
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for bucket, count in self._features(text).items():
+                vectors[row, bucket] = 1 + math.log(count)
+        vectors *= self.idf
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+# 可用的向量化实现
+EMBEDDERS = {
+    "hashing": HashingEmbedder,
+}
+
+
+def register_embedder(name: str, embedder_class):
+    """注册向量化实现（需实现 fit 和 embed；fit 应替换统计量而非原地修改，全量构建时在副本上拟合）"""
+    EMBEDDERS[name] = embedder_class
+
+
+def create_embedder(name: str, dim: int):
+    """创建向量化实例"""
+    if name not in EMBEDDERS:
+        raise ValueError(f"未知的向量化实现: {name}")
+    return EMBEDDERS[name](dim=dim)
+
+
+def document_text(doc: IndexedDocument) -> str:
+    """拼接用于向量化的文档文本（标题重复一次以提高权重）"""
+    return "\n".join(
+        part for part in (doc.title, doc.title, doc.description, doc.detail_text, doc.content) if part
+    )
+
+
+def text_hash(text: str) -> int:
+    """文档文本哈希，用于判断磁盘上的向量是否过期"""
+    return zlib.crc32(text.encode("utf-8"))
+
+
+class VectorIndex:
+    """知识项向量索引"""
+
+    def __init__(self, embedder, path: Optional[str] = None):
+        self.embedder = embedder
+        self.path = path
+        self._lock = threading.RLock()
+        self.matrix = np.zeros((0, embedder.dim), dtype=np.float32)
+        # 行号 -> 知识项ID（空行为None）及其文本哈希
+        self.row_ids: List[Optional[str]] = []
+        self.row_hashes: List[Optional[int]] = []
+        self.rows: Dict[str, int] = {}
+        self._free_rows: List[int] = []
+        self.ready = False
+        # 最近一次全量构建是否直接加载了磁盘上的向量
+        self.loaded_from_disk = False
+        # 元数据代号及其后追加的增量记录条数，日志中代号不符的记录属于旧元数据
+        self._generation: Optional[str] = None
+        self._journal_entries = 0
+
+    @property
+    def meta_path(self) -> str:
+        return f"{self.path}.meta.json"
+
+    @property
+    def journal_path(self) -> str:
+        return f"{self.path}.meta.log"
+
+    def _config(self) -> Dict[str, object]:
+        """向量化配置，变化后磁盘上的向量不可复用"""
+        return {
+            "embedder": self.embedder.name,
+            "dim": self.embedder.dim,
+            "max_n": getattr(self.embedder, "max_n", None),
+        }
+
+    def _release(self):
+        """释放当前的内存映射（Windows下被映射的文件无法替换）"""
+        if isinstance(self.matrix, np.memmap):
+            self.matrix.flush()
+        self.matrix = np.zeros((0, self.embedder.dim), dtype=np.float32)
+
+    def _persist(self, matrix: np.ndarray) -> np.ndarray:
+        """
+        配置了路径时把矩阵写入临时文件后原子替换并重新内存映射，否则直接使用内存矩阵
+        替换前先释放旧映射
+        """
+        if not self.path:
+            return matrix
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, matrix)
+        self._release()
+        os.replace(tmp_path, self.path)
+        return np.load(self.path, mmap_mode="r+")
+
+    def _save_meta(self):
+        """写入完整元数据（同样先写临时文件再替换）并清空增量日志"""
+        if not self.path:
+            return
+        if isinstance(self.matrix, np.memmap):
+            self.matrix.flush()
+        self._generation = uuid.uuid4().hex
+        meta = {
+            "config": self._config(),
+            "generation": self._generation,
+            "rows": self.row_ids,
+            "hashes": self.row_hashes,
+        }
+        idf = getattr(self.embedder, "idf", None)
+        if idf is not None:
+            meta["idf"] = [float(value) for value in idf]
+        tmp_path = f"{self.meta_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self.meta_path)
+        # 替换后即使来不及清空，日志中的旧代号记录也不会再被回放
+        open(self.journal_path, "w").close()
+        self._journal_entries = 0
+
+    def _append_meta(self, rows: Set[int]):
+        """
+        增量更新只向日志追加变更行的元数据，不重写全部行
+        日志条数超过总行数时合并为完整元数据
+        """
+        if not self.path or not rows:
+            return
+        if self._generation is None or self._journal_entries + len(rows) > max(len(self.row_ids), 64):
+            self._save_meta()
+            return
+        # 先落盘向量，元数据记录的行一定已有对应向量
+        if isinstance(self.matrix, np.memmap):
+            self.matrix.flush()
+        lines = [
+            json.dumps({"gen": self._generation, "row": row, "id": self.row_ids[row], "hash": self.row_hashes[row]})
+            for row in sorted(rows)
+        ]
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        self._journal_entries += len(lines)
+
+    def _drop_meta(self):
+        """删除元数据和增量日志，矩阵文件被替换期间中断时不会误用旧元数据"""
+        for path in (self.meta_path, self.journal_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _replay_journal(self, generation: Optional[str], row_ids: List[Optional[str]],
+                        row_hashes: List[Optional[int]]) -> int:
+        """回放与元数据代号一致的增量记录，遇到写入不完整的行即停止，返回回放条数"""
+        if not os.path.exists(self.journal_path):
+            return 0
+        replayed = 0
+        with open(self.journal_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                if entry.get("gen") != generation:
+                    continue
+                row = entry["row"]
+                while len(row_ids) <= row:
+                    row_ids.append(None)
+                    row_hashes.append(None)
+                row_ids[row] = entry["id"]
+                row_hashes[row] = entry["hash"]
+                replayed += 1
+        return replayed
+
+    def _load(self, expected: Dict[str, int]) -> bool:
+        """磁盘上的向量与当前文档一致（配置相同、知识项及其文本哈希相同）时直接加载"""
+        if not self.path or not os.path.exists(self.path) or not os.path.exists(self.meta_path):
+            return False
+        try:
+            with open(self.meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta["config"] != self._config():
+                return False
+            row_ids, row_hashes = meta["rows"], meta["hashes"]
+            replayed = self._replay_journal(meta.get("generation"), row_ids, row_hashes)
+            stored = {item_id: row_hashes[row] for row, item_id in enumerate(row_ids) if item_id is not None}
+            if stored != expected:
+                return False
+            matrix = np.load(self.path, mmap_mode="r+")
+            if matrix.dtype != np.float32 or matrix.ndim != 2 or matrix.shape[1] != self.embedder.dim \
+                    or matrix.shape[0] < len(row_ids):
+                return False
+        except (OSError, ValueError, KeyError, IndexError) as e:
+            logger.warning(f"向量索引文件无法加载，将重新向量化: {e}")
+            return False
+
+        if "idf" in meta and hasattr(self.embedder, "idf"):
+            # 替换为新实例，不修改检索中可能正在使用的旧实例
+            embedder = copy.copy(self.embedder)
+            embedder.idf = np.asarray(meta["idf"], dtype=np.float32)
+            self.embedder = embedder
+        self._release()
+        self.matrix = matrix
+        self.row_ids = row_ids
+        self.row_hashes = row_hashes
+        self.rows = {item_id: row for row, item_id in enumerate(row_ids) if item_id is not None}
+        self._free_rows = [row for row, item_id in enumerate(row_ids) if item_id is None]
+        self._generation = meta.get("generation")
+        self._journal_entries = replayed
+        if replayed:
+            # 加载时顺带合并日志
+            self._save_meta()
+        return True
+
+    def _grow(self, needed: int):
+        """扩容（容量翻倍）"""
+        capacity = self.matrix.shape[0]
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2, 64)
+        matrix = np.zeros((new_capacity, self.embedder.dim), dtype=np.float32)
+        matrix[:len(self.row_ids)] = self.matrix[:len(self.row_ids)]
+        self.matrix = self._persist(matrix)
+
+    def on_rebuild(self, index: SearchIndex):
+        """索引全量构建后重新向量化全部文档（磁盘上的向量仍有效时直接加载）"""
+        docs = [index.get_document(item_id) for item_id in index.item_ids()]
+        docs = [doc for doc in docs if doc is not None]
+        texts = [document_text(doc) for doc in docs]
+        hashes = [text_hash(text) for text in texts]
+
+        with self._lock:
+            if self._load({doc.id: value for doc, value in zip(docs, hashes)}):
+                self.loaded_from_disk = True
+                self.ready = True
+                return
+
+        # 在新的向量化实例上拟合IDF，与矩阵一起在锁内替换，检索不会混用新IDF和旧矩阵
+        embedder = copy.copy(self.embedder)
+        embedder.fit(texts)
+        vectors = embedder.embed(texts) if texts else np.zeros((0, embedder.dim), dtype=np.float32)
+
+        with self._lock:
+            self.embedder = embedder
+            matrix = np.zeros((max(len(docs), 64), self.embedder.dim), dtype=np.float32)
+            matrix[:len(docs)] = vectors
+            if self.path:
+                self._drop_meta()
+            self.matrix = self._persist(matrix)
+            self.row_ids = [doc.id for doc in docs]
+            self.row_hashes = hashes
+            self.rows = {doc.id: row for row, doc in enumerate(docs)}
+            self._free_rows = []
+            self._save_meta()
+            self.loaded_from_disk = False
+            self.ready = True
+
+    def on_change(self, index: SearchIndex, upserted: Set[str], removed: Set[str]):
+        """增量更新变更的文档向量（IDF保持上次全量构建时的统计）"""
+        docs = [index.get_document(item_id) for item_id in upserted]
+        docs = [doc for doc in docs if doc is not None]
+        texts = [document_text(doc) for doc in docs]
+        embedder = self.embedder
+        vectors = embedder.embed(texts) if docs else None
+
+        with self._lock:
+            if docs and self.embedder is not embedder:
+                # 期间全量构建替换了向量化实例
+                vectors = self.embedder.embed(texts)
+            touched: Set[int] = set()
+            for item_id in removed:
+                row = self.rows.pop(item_id, None)
+                if row is not None:
+                    touched.add(row)
+                    self.matrix[row] = 0
+                    self.row_ids[row] = None
+                    self.row_hashes[row] = None
+                    self._free_rows.append(row)
+
+            for doc, text, vector in zip(docs, texts, vectors if vectors is not None else []):
+                row = self.rows.get(doc.id)
+                if row is None:
+                    if self._free_rows:
+                        row = self._free_rows.pop()
+                    else:
+                        row = len(self.row_ids)
+                        self._grow(row + 1)
+                        self.row_ids.append(None)
+                        self.row_hashes.append(None)
+                    self.rows[doc.id] = row
+                    self.row_ids[row] = doc.id
+                self.row_hashes[row] = text_hash(text)
+                self.matrix[row] = vector
+                touched.add(row)
+            self._append_meta(touched)
+
+    def search(
+        self,
+        query: str,
+        limit: int = 10,
+        predicate: Optional[Callable[[str], bool]] = None,
+        min_score: float = 0.0
+    ) -> List[Tuple[str, float]]:
+        """余弦相似度top-k检索，返回 (知识项ID, 分数)"""
+        embedder = self.embedder
+        query_vector = embedder.embed([query])[0]
+
+        # 持锁只取出分数和行号对应的知识项；过滤条件在释放锁后执行（其中可能访问搜索索引）
+        with self._lock:
+            if self.embedder is not embedder:
+                # 期间全量构建替换了向量化实例和矩阵，按新的IDF重新向量化
+                query_vector = self.embedder.embed([query])[0]
+            size = len(self.row_ids)
+            if not size or not query_vector.any():
+                return []
+            # 向量均已归一化，一次矩阵-向量乘法即得到全部余弦相似度
+            scores = self.matrix[:size] @ query_vector
+            row_ids = self.row_ids[:size]
+
+        # 预留余量，过滤后不足limit个时再扩大到全部候选
+        k = min(size, limit * 4 if predicate else limit)
+        while True:
+            candidates = np.argpartition(-scores, k - 1)[:k]
+            candidates = candidates[np.argsort(-scores[candidates])]
+
+            hits = []
+            for row in candidates:
+                item_id = row_ids[row]
+                score = float(scores[row])
+                if item_id is None or score <= min_score:
+                    continue
+                if predicate and not predicate(item_id):
+                    continue
+                hits.append((item_id, score))
+                if len(hits) >= limit:
+                    break
+
+            if len(hits) >= limit or k >= size:
+                break
+            k = size
+        return hits
+
+    def stats(self) -> Dict[str, object]:
+        """向量索引统计信息"""
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "embedder": self.embedder.name,
+                "dim": self.embedder.dim,
+                "vectors": len(self.rows),
+                "capacity": int(self.matrix.shape[0]),
+                "memory_mapped": bool(self.path),
+                "loaded_from_disk": self.loaded_from_disk,
+            }
+
+
+# 全局向量索引实例
+vector_index = VectorIndex(
+    create_embedder(settings.vector_embedder, settings.vector_dim),
+    path=settings.vector_index_path or None
+)
@@ -0,0 +1,236 @@
+"""
+异步批量写入队列（write-behind）
+请求路径只把记录放入内存队列，由后台任务批量插入数据库；
+不允许丢记录的队列（drop_oldest=False）写入失败时把批次放回队首按指数退避重试，
+连续失败达到重试上限后逐条写入，只丢弃本身无法写入的记录
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+from sqlalchemy import insert
+from src.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindQueue:
+    """有界内存队列 + 后台批量刷写"""
+
+    def __init__(
+        self,
+        name: str,
+        model,
+        batch_size: int = 200,
+        flush_interval: float = 5.0,
+        max_size: int = 10000,
+        drop_oldest: bool = True,
+        max_retries: int = 3,
+        max_backoff: float = 60.0
+    ):
+        self.name = name
+        self.model = model
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        # 队列已满时丢弃最旧的记录；为False时拒绝新记录，由调用方自行处理
+        self.drop_oldest = drop_oldest
+        # 批量写入连续失败的重试上限和最长退避时间（仅 drop_oldest=False 时重试）
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+        self._failures = 0
+
+        self._queue: deque = deque()
+        # 已取出、正在写入的批次
+        self._inflight: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        # 统计指标
+        self.enqueued = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.failed = 0
+        self.retried = 0
+        self.flush_count = 0
+        self.last_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    def put(self, record: Dict[str, Any]) -> bool:
+        """放入一条记录，队列已满时丢弃最旧的记录（或拒绝并返回False）"""
+        return self.put_many([record])
+
+    def put_many(self, records: List[Dict[str, Any]]) -> bool:
+        """放入一组记录（整组放入或整组拒绝）"""
+        with self._lock:
+            overflow = len(self._queue) + len(records) - self.max_size
+            if overflow > 0:
+                if not self.drop_oldest:
+                    self.rejected += len(records)
+                    return False
+                for _ in range(min(overflow, len(self._queue))):
+                    self._queue.popleft()
+                    self.dropped += 1
+            self._queue.extend(records)
+            self.enqueued += len(records)
+            depth = len(self._queue)
+
+        # 积累到一个批次时提前唤醒刷写任务
+        if depth >= self.batch_size and self._wakeup is not None and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        return True
+
+    def pending(self, predicate: Callable[[Dict[str, Any]], bool]) -> List[Dict[str, Any]]:
+        """
+        尚未提交的记录（包括正在写入的批次），按入队顺序返回。
+        先读pending再查数据库，两者合并按主键去重即可看到全部记录
+        """
+        with self._lock:
+            return [record for record in (*self._inflight, *self._queue) if predicate(record)]
+
+    def _drain(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """取出一批记录，提交前仍可通过 pending 查到"""
+        with self._lock:
+            count = len(self._queue) if limit is None else min(limit, len(self._queue))
+            self._inflight = [self._queue.popleft() for _ in range(count)]
+            return self._inflight
+
+    def _write(self, batch: List[Dict[str, Any]]):
+        """在一个事务中多行插入"""
+        db = SessionLocal()
+        try:
+            db.execute(insert(self.model), batch)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _write_rows(self, batch: List[Dict[str, Any]]) -> int:
+        """逐条插入，丢弃无法写入的记录，返回写入条数"""
+        written = 0
+        for record in batch:
+            try:
+                self._write([record])
+                written += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"{self.name} 逐条写入失败，丢弃记录 {record.get('id')}: {e}")
+        return written
+
+    def flush(self) -> int:
+        """同步刷写队列中的全部记录，返回写入条数；批次写入失败并放回队首时停止本轮刷写"""
+        written = 0
+        with self._flush_lock:
+            while True:
+                batch = self._drain(self.batch_size)
+                if not batch:
+                    break
+
+                start_time = time.time()
+                requeue = False
+                try:
+                    if self.drop_oldest or self._failures < self.max_retries:
+                        # 多行插入
+                        self._write(batch)
+                        count = len(batch)
+                    else:
+                        # 多次重试仍失败，逐条写入隔离有问题的记录
+                        count = self._write_rows(batch)
+                    self._failures = 0
+                    written += count
+                    self.flushed += count
+                except Exception as e:
+                    if self.drop_oldest:
+                        self.failed += len(batch)
+                        logger.error(f"{self.name} 批量写入失败，丢弃 {len(batch)} 条记录: {e}")
+                    else:
+                        requeue = True
+                        self._failures += 1
+                        self.retried += len(batch)
+                        logger.warning(
+                            f"{self.name} 批量写入失败（连续第{self._failures}次），{len(batch)} 条记录放回队首: {e}"
+                        )
+                finally:
+                    # 提交之后再移出，读取方不会漏看；放回队首与移出在同一把锁内完成，读取方不会重复或漏看
+                    with self._lock:
+                        if requeue:
+                            self._queue.extendleft(reversed(batch))
+                        self._inflight = []
+
+                elapsed_ms = (time.time() - start_time) * 1000
+                self.flush_count += 1
+                self.last_flush_ms = elapsed_ms
+                self.total_flush_ms += elapsed_ms
+                if requeue:
+                    break
+        return written
+
+    def retry_delay(self) -> float:
+        """写入失败后下次刷写前的等待时间（指数退避）"""
+        return min(self.flush_interval * (2 ** self._failures), self.max_backoff)
+
+    async def _run(self):
+        """后台刷写循环"""
+        while True:
+            if self._failures:
+                # 写入失败后退避，不被新入队的记录提前唤醒
+                await asyncio.sleep(self.retry_delay())
+            else:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._wakeup.clear()
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                logger.error(f"{self.name} 刷写任务异常: {e}")
+
+    async def start(self):
+        """启动后台刷写任务"""
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台任务并刷写剩余记录（批量写入失败时最后逐条写入一次）"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.to_thread(self.flush)
+        if self._failures:
+            self._failures = self.max_retries
+            await asyncio.to_thread(self.flush)
+
+    def stats(self) -> Dict[str, Any]:
+        """队列统计信息"""
+        with self._lock:
+            depth = len(self._queue)
+        return {
+            "depth": depth,
+            "max_size": self.max_size,
+            "enqueued": self.enqueued,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "retried": self.retried,
+            "consecutive_failures": self._failures,
+            "flush_count": self.flush_count,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "avg_flush_ms": round(self.total_flush_ms / self.flush_count, 2) if self.flush_count else 0.0,
+        }
@@ -0,0 +1,95 @@
+"""
+大模型调用准入控制测试
+"""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from src.admission import AdmissionController
+
+
+def controller(**overrides):
+    config = dict(max_concurrent=1, max_queue=2, queue_timeout=1.0, user_rate=0, user_burst=1)
+    config.update(overrides)
+    return AdmissionController(**config)
+
+
+def test_user_token_bucket_returns_retry_after():
+    """测试超过每用户速率时返回429和Retry-After，其他用户不受影响"""
+    governor = controller(max_concurrent=10, user_rate=0.5, user_burst=2)
+
+    async def run():
+        for _ in range(2):
+            (await governor.acquire("u1")).release()
+        with pytest.raises(HTTPException) as exc:
+            await governor.acquire("u1")
+        (await governor.acquire("u2")).release()
+        return exc.value
+
+    error = asyncio.run(run())
+    assert error.status_code == 429
+    assert error.headers["Retry-After"] == "2"
+    assert governor.stats()["rate_limited"] == 1
+
+
+def test_queue_hands_slot_over_in_order():
+    """测试并发已满时排队，名额按先后顺序转交"""
+    governor = controller()
+    order = []
+
+    async def call(name, hold):
+        async with governor.slot():
+            order.append(name)
+            await asyncio.sleep(hold)
+
+    async def run():
+        first = asyncio.ensure_future(call("a", 0.02))
+        await asyncio.sleep(0)
+        await asyncio.gather(first, call("b", 0), call("c", 0))
+
+    asyncio.run(run())
+    assert order == ["a", "b", "c"]
+    stats = governor.stats()
+    assert stats["active"] == 0 and stats["queue_depth"] == 0
+    assert stats["queued"] == 2
+
+
+def test_full_queue_rejects_immediately():
+    """测试队列已满时立即拒绝"""
+    governor = controller(max_queue=1)
+
+    async def run():
+        ticket = await governor.acquire()
+        waiter = asyncio.ensure_future(governor.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as exc:
+            await governor.acquire()
+        ticket.release()
+        (await waiter).release()
+        return exc.value
+
+    assert asyncio.run(run()).status_code == 429
+    assert governor.stats()["rejected_full"] == 1
+    assert governor.stats()["active"] == 0
+
+
+def test_sheds_when_estimated_wait_exceeds_deadline():
+    """测试按服务耗时估算的等待超过期限时直接拒绝，排队超时的请求也被拒绝"""
+    governor = controller(max_queue=10, queue_timeout=0.05)
+
+    async def run():
+        ticket = await governor.acquire()
+        with pytest.raises(HTTPException):
+            await governor.acquire()
+        governor._service_samples.append(0.2)
+        with pytest.raises(HTTPException):
+            await governor.acquire()
+        ticket.release()
+
+    governor._service_samples.append(0.01)
+    asyncio.run(run())
+    stats = governor.stats()
+    assert stats["timed_out"] == 1
+    assert stats["shed"] == 1
+    assert stats["active"] == 0 and stats["queue_depth"] == 0
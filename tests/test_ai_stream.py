@@ -0,0 +1,102 @@
+"""
+AI流式输出测试
+"""
+import asyncio
+import json
+
+import httpx
+
+from src.ai_service import QWENService, parse_stream_line, stream_chunk_text
+
+
+def sse_body(texts):
+    """构造DashScope增量输出格式的SSE响应体"""
+    frames = []
+    for i, text in enumerate(texts):
+        chunk = {"output": {"text": text, "finish_reason": "stop" if i == len(texts) - 1 else "null"}}
+        if i == len(texts) - 1:
+            chunk["usage"] = {"output_tokens": len(texts)}
+        frames.append(f"id:{i}\nevent:result\ndata:{json.dumps(chunk, ensure_ascii=False)}\n\n")
+    return "".join(frames).encode("utf-8")
+
+
+def mock_service(handler) -> QWENService:
+    """创建使用模拟传输层的服务"""
+    service = QWENService()
+    service._client = httpx.AsyncClient(base_url=service.base_url, transport=httpx.MockTransport(handler))
+    return service
+
+
+def collect(stream):
+    """收集异步生成器的全部事件"""
+    async def run():
+        return [event async for event in stream]
+    return asyncio.run(run())
+
+
+def test_parse_stream_line():
+    """测试SSE数据行解析"""
+    assert parse_stream_line("event:result") is None
+    assert parse_stream_line("data: [DONE]") is None
+    chunk = parse_stream_line('data:{"output":{"text":"白平衡"}}')
+    assert stream_chunk_text(chunk) == "白平衡"
+    choices = {"output": {"choices": [{"message": {"content": "增益"}}]}}
+    assert stream_chunk_text(choices) == "增益"
+
+
+def test_stream_yields_deltas_then_done():
+    """测试增量文本依次产出，结束时返回完整回答"""
+    def handler(request):
+        assert request.headers["X-DashScope-SSE"] == "enable"
+        assert json.loads(request.content)["incremental_output"] is True
+        return httpx.Response(200, content=sse_body(["自动", "白平衡", "用于校正色温"]))
+
+    service = mock_service(handler)
+    events = collect(service.generate_answer_stream("什么是AWB"))
+
+    assert [event["text"] for event in events if event["type"] == "delta"] == ["自动", "白平衡", "用于校正色温"]
+    assert events[-1]["type"] == "done"
+    assert events[-1]["response"] == "自动白平衡用于校正色温"
+    assert events[-1]["usage"] == {"output_tokens": 3}
+    assert events[-1]["first_token_ms"] is not None
+
+
+def test_stream_reports_upstream_error():
+    """测试上游返回不可重试的错误状态码时产出error事件"""
+    service = mock_service(lambda request: httpx.Response(400, content=b"bad request"))
+    events = collect(service.generate_answer_stream("什么是AWB"))
+    assert [event["type"] for event in events] == ["error"]
+    assert "400" in events[0]["error"]
+    assert service.stats()["errors"] == 1
+
+
+def test_stream_retries_before_first_token():
+    """测试尚未产出文本时遇到可重试的错误会重试"""
+    responses = [httpx.Response(503), httpx.Response(200, content=sse_body(["去马赛克"]))]
+    service = mock_service(lambda request: responses.pop(0))
+    service.resilience.base_delay = 0.001
+    events = collect(service.generate_answer_stream("什么是去马赛克"))
+    assert [event["type"] for event in events] == ["delta", "done"]
+    assert service.resilience.stats()["retries"] == 1
+
+
+def test_shared_client_reuses_connection():
+    """测试多次请求复用同一个客户端，并统计请求数"""
+    def handler(request):
+        assert request.url.path.endswith("/services/aigc/text-generation/generation")
+        return httpx.Response(200, json={"output": {"text": "ok"}})
+
+    service = mock_service(handler)
+    client = service.client
+
+    async def run():
+        for _ in range(3):
+            assert (await service.generate_answer("AWB"))["response"] == "ok"
+        await service.close()
+
+    asyncio.run(run())
+    assert client.is_closed
+    stats = service.stats()
+    assert stats["requests"] == 3
+    assert stats["in_flight"] == 0
+    assert stats["client_started"] is False
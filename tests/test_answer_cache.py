@@ -0,0 +1,142 @@
+"""
+问答缓存测试
+"""
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src import index_sync
+from src.answer_cache import AnswerCache, normalize_question
+from src.cache import cache_manager
+from src.database import Base
+from src.index_sync import ChangeSet, register_index_sync
+from src.models import KnowledgeCategory, KnowledgeDetail, KnowledgeItem
+from src.search_index import search_index
+
+
+class FakeRedis:
+    """测试用的内存Redis（只实现缓存相关模块用到的命令）"""
+
+    def __init__(self):
+        self.values = {}
+        self.sets = {}
+
+    def get(self, key):
+        value = self.values.get(key)
+        return value.encode("utf-8") if value is not None else None
+
+    def setex(self, key, ttl, value):
+        self.values[key] = value
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        return True
+
+    def exists(self, key):
+        return int(key in self.values)
+
+    def delete(self, *keys):
+        for key in keys:
+            key = key.decode("utf-8") if isinstance(key, bytes) else key
+            self.values.pop(key, None)
+            self.sets.pop(key, None)
+
+    def sadd(self, key, member):
+        self.sets.setdefault(key, set()).add(member.encode("utf-8"))
+
+    def smembers(self, key):
+        return set(self.sets.get(key, set()))
+
+    def expire(self, key, ttl):
+        pass
+
+    def pipeline(self):
+        return self
+
+    def execute(self):
+        pass
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    monkeypatch.setattr(cache_manager, "redis_client", FakeRedis())
+    return AnswerCache()
+
+
+def test_normalize_question_ignores_case_and_punctuation():
+    """测试问题规范化"""
+    assert normalize_question("什么是 AWB？") == normalize_question("什么是awb")
+    assert normalize_question("ＡＷＢ  原理!") == "awb 原理"
+
+
+def test_key_depends_on_context(cache):
+    """测试知识上下文不同时缓存键不同"""
+    assert cache.make_key("什么是AWB？", "ctx") == cache.make_key("什么是 awb", "ctx")
+    assert cache.make_key("什么是AWB", "ctx") != cache.make_key("什么是AWB", "ctx2")
+
+
+def test_hit_rate_and_saved_latency(cache):
+    """测试命中率和节省耗时统计"""
+    key = cache.make_key("什么是去马赛克", "ctx")
+    assert cache.get(key) is None
+    cache.set(key, "插值还原RGB", 1500, ["i1"])
+    assert cache.get(key)["response"] == "插值还原RGB"
+
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+    assert stats["hit_rate"] == 0.5
+    assert stats["saved_ms"] == 1500
+
+
+def test_item_change_invalidates_cited_answers(cache):
+    """测试被引用的知识项变更后删除相关回答"""
+    cited = cache.make_key("AWB原理", "ctx")
+    other = cache.make_key("去马赛克", "ctx")
+    cache.set(cited, "灰度世界", 1000, ["i1", "i2"])
+    cache.set(other, "插值", 1000, ["i3"])
+
+    changes = ChangeSet()
+    changes.items["i2"] = {"id": "i2", "title": "白平衡"}
+    cache.on_commit(changes)
+
+    assert cache.get(cited) is None
+    assert cache.get(other) is not None
+    assert cache.stats()["invalidated"] == 1
+
+
+def test_commit_invalidates_without_memory_index(cache, monkeypatch):
+    """测试不使用内存索引时，详情变更的事务提交同样删除引用其知识项的回答"""
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    db.add_all([
+        KnowledgeCategory(id="c1", title="ISP"),
+        KnowledgeItem(id="i1", category_id="c1", title="自动白平衡"),
+        KnowledgeDetail(id="d1", knowledge_id="i1", title="白平衡增益"),
+    ])
+    db.commit()
+
+    monkeypatch.setattr(index_sync, "_commit_listeners", [cache.on_commit])
+    monkeypatch.setattr(search_index, "ready", False)
+    register_index_sync()
+    key = cache.make_key("AWB原理", "ctx")
+    cache.set(key, "灰度世界", 1000, ["i1"])
+
+    db.delete(db.get(KnowledgeDetail, "d1"))
+    db.commit()
+    db.close()
+    assert cache.get(key) is None
+    assert cache.stats()["invalidated"] == 1
+
+
+def test_disabled_without_redis(monkeypatch):
+    """测试未配置Redis时不缓存也不计数"""
+    monkeypatch.setattr(cache_manager, "redis_client", None)
+    cache = AnswerCache()
+    key = cache.make_key("AWB", "")
+    cache.set(key, "答案", 100, ["i1"])
+    assert cache.get(key) is None
+    assert cache.stats()["enabled"] is False
+    assert cache.stats()["misses"] == 0
@@ -0,0 +1,164 @@
+"""
+流式聊天接口测试
+"""
+import asyncio
+import gc
+import json
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from src import chat_memory as memory_module
+from src.cache import cache_manager
+from src.chat_log import ChatLogger
+from src.database import Base, get_db
+from src.rag import RAGContext
+from src.routers import chat
+from tests.test_ai_stream import mock_service, sse_body
+
+
+SOURCES = [{"id": "awb", "title": "自动白平衡"}]
+
+
+def parse_events(body: str):
+    """解析SSE响应体为 (事件, 数据) 列表"""
+    events = []
+    for frame in body.strip().split("\n\n"):
+        event, data = frame.split("\n")
+        events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+
+@pytest.fixture
+def app(monkeypatch):
+    """挂载聊天路由的应用，知识上下文固定，聊天记录只入队不落库"""
+    async def build_context(db, question):
+        return RAGContext("自动白平衡：校正色温", ["awb"], SOURCES, [], 10, 1)
+
+    logger = ChatLogger()
+    monkeypatch.setattr(chat, "build_context", build_context)
+    monkeypatch.setattr(chat, "chat_logger", logger)
+    monkeypatch.setattr(memory_module, "chat_logger", logger)
+    monkeypatch.setattr(cache_manager, "redis_client", None)
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+
+    def override_get_db():
+        db = factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app = FastAPI()
+    app.include_router(chat.router)
+    app.dependency_overrides[get_db] = override_get_db
+
+    @app.middleware("http")
+    async def login(request, call_next):
+        request.state.user = {"id": "u1"}
+        return await call_next(request)
+
+    app.state.chat_logger = logger
+    # 先在主线程回收前面测试遗留的SQLite连接，避免在客户端的事件循环线程中被回收
+    gc.collect()
+    return app
+
+
+def use_upstream(monkeypatch, handler):
+    """让聊天路由使用模拟上游的AI服务"""
+    service = mock_service(handler)
+    monkeypatch.setattr(chat, "ai_service", service)
+    return service
+
+
+def test_stream_frames_and_sources(app, monkeypatch):
+    """测试依次返回 start、delta、done 事件，done 中带引用来源，回答完整后才保存记录"""
+    service = use_upstream(monkeypatch, lambda request: httpx.Response(200, content=sse_body(["自动", "白平衡"])))
+    response = TestClient(app).post("/chat/stream", json={"message": "什么是AWB", "session_id": "s1"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = parse_events(response.text)
+    assert [event for event, _ in events] == ["start", "delta", "delta", "done"]
+    assert events[0][1] == {"session_id": "s1"}
+    assert [data["text"] for event, data in events if event == "delta"] == ["自动", "白平衡"]
+    done = events[-1][1]
+    assert done["session_id"] == "s1" and done["cached"] is False
+    assert done["sources"] == SOURCES
+    assert done["first_token_ms"] is not None
+
+    pending = app.state.chat_logger.pending("s1", "u1")
+    assert [record["content"] for record in pending] == ["什么是AWB", "自动白平衡"]
+    assert service.admission.active == 0
+
+
+def test_stream_error_frame(app, monkeypatch):
+    """测试上游出错时返回 error 事件且不保存记录"""
+    service = use_upstream(monkeypatch, lambda request: httpx.Response(400, content=b"bad request"))
+    response = TestClient(app).post("/chat/stream", json={"message": "什么是AWB", "session_id": "s1"})
+
+    events = parse_events(response.text)
+    assert [event for event, _ in events] == ["start", "error"]
+    assert events[1][1]["detail"].startswith("AI服务错误")
+    assert "400" in events[1][1]["detail"]
+    assert app.state.chat_logger.pending("s1", "u1") == []
+    assert service.admission.active == 0
+
+
+def test_client_disconnect_releases_ticket(app, monkeypatch):
+    """测试客户端中途断开时归还准入名额、关闭上游流且不保存记录"""
+    service = use_upstream(monkeypatch, lambda request: httpx.Response(500))
+    closed = []
+
+    async def upstream(**kwargs):
+        try:
+            yield {"type": "delta", "text": "自动"}
+            # 上游迟迟不返回后续内容
+            await asyncio.sleep(60)
+            yield {"type": "delta", "text": "白平衡"}
+        finally:
+            closed.append(True)
+
+    monkeypatch.setattr(service, "generate_answer_stream", upstream)
+    body = json.dumps({"message": "什么是AWB", "session_id": "s1"}).encode("utf-8")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": "/chat/stream", "raw_path": b"/chat/stream",
+        "root_path": "", "query_string": b"", "server": ("testserver", 80), "client": ("testclient", 50000),
+        "headers": [(b"host", b"testserver"), (b"content-type", b"application/json")],
+    }
+
+    async def run():
+        requests = [{"type": "http.request", "body": body, "more_body": False}]
+        first_delta = asyncio.Event()
+        chunks = []
+
+        async def receive():
+            if requests:
+                return requests.pop(0)
+            # 收到第一段增量文本后断开
+            await first_delta.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            chunks.append(message.get("body", b""))
+            if b"event: delta" in message.get("body", b""):
+                first_delta.set()
+                assert service.admission.active == 1
+
+        await asyncio.wait_for(app(scope, receive, send), timeout=5)
+        return b"".join(chunks).decode("utf-8")
+
+    events = parse_events(asyncio.run(run()))
+    assert [event for event, _ in events] == ["start", "delta"]
+    assert service.admission.active == 0
+    assert closed == [True]
+    assert app.state.chat_logger.pending("s1", "u1") == []
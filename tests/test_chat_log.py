@@ -0,0 +1,92 @@
+"""
+聊天记录批量写入测试
+"""
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from src import write_behind
+from src.cache import cache_manager
+from src.chat_log import ChatLogger
+from src.chat_memory import ChatMemory
+from src.database import Base
+from src.models import ChatHistory, User
+
+
+@pytest.fixture
+def session_factory(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine, tables=[User.__table__, ChatHistory.__table__])
+    factory = sessionmaker(bind=engine)
+    monkeypatch.setattr(write_behind, "SessionLocal", factory)
+    return factory
+
+
+def test_exchange_flushed_in_one_batch(session_factory):
+    """测试一问一答入队后批量写入，问题排在回答之前"""
+    logger = ChatLogger()
+    db = session_factory()
+    logger.record_exchange(db, "u1", "s1", "什么是AWB", "自动白平衡", 1200)
+    assert db.query(ChatHistory).count() == 0
+    assert [record["message_type"] for record in logger.pending("s1", "u1")] == ["user", "assistant"]
+
+    assert logger.queue.flush() == 2
+    rows = db.query(ChatHistory).order_by(ChatHistory.created_at).all()
+    assert [row.message_type for row in rows] == ["user", "assistant"]
+    assert rows[1].response_time_ms == 1200
+    assert logger.pending("s1", "u1") == []
+    assert logger.stats()["flush_count"] == 1
+
+
+def test_full_queue_writes_directly(session_factory):
+    """测试队列已满时整组拒绝并直接写入数据库"""
+    logger = ChatLogger()
+    logger.queue.max_size = 3
+    db = session_factory()
+    logger.record_exchange(db, "u1", "s1", "问题1", "回答1", 10)
+    logger.record_exchange(db, "u1", "s1", "问题2", "回答2", 10)
+
+    assert logger.stats()["depth"] == 2
+    assert logger.stats()["rejected"] == 2
+    assert [row.content for row in db.query(ChatHistory).all()] == ["问题2", "回答2"]
+
+
+def test_memory_rebuild_sees_unflushed_records(monkeypatch, session_factory):
+    """测试会话记忆从数据库重建时包含尚未落库的记录"""
+    from src import chat_memory as memory_module
+
+    monkeypatch.setattr(cache_manager, "redis_client", None)
+    logger = ChatLogger()
+    monkeypatch.setattr(memory_module, "chat_logger", logger)
+    db = session_factory()
+    logger.record_exchange(db, "u1", "s1", "问题1", "回答1", 10)
+    logger.queue.flush()
+    logger.record_exchange(db, "u1", "s1", "问题2", "回答2", 10)
+
+    history = ChatMemory().load(db, "s1", "u1").history()
+    assert [message["content"] for message in history] == ["问题1", "回答1", "问题2", "回答2"]
+
+
+def test_failed_batch_requeued_then_written_row_by_row(session_factory):
+    """测试批量写入失败时记录放回队首重试，达到重试上限后逐条写入，只丢弃无法写入的记录"""
+    logger = ChatLogger()
+    logger.queue.max_retries = 1
+    db = session_factory()
+    records = logger.record_exchange(db, "u1", "s1", "问题1", "回答1", 10)
+    # 与第一条记录主键冲突，整批插入失败
+    db.add(ChatHistory(id=records[0]["id"], user_id="u1", session_id="s0", message_type="user", content="旧记录"))
+    db.commit()
+    logger.record_exchange(db, "u1", "s1", "问题2", "回答2", 10)
+
+    assert logger.queue.flush() == 0
+    assert [record["content"] for record in logger.pending("s1", "u1")] == ["问题1", "回答1", "问题2", "回答2"]
+    stats = logger.stats()
+    assert stats["failed"] == 0 and stats["retried"] == 4 and stats["consecutive_failures"] == 1
+    assert logger.queue.retry_delay() == 2 * logger.queue.flush_interval
+
+    assert logger.queue.flush() == 3
+    assert logger.pending("s1", "u1") == []
+    assert sorted(row.content for row in db.query(ChatHistory).filter(ChatHistory.session_id == "s1")) == ["回答1", "回答2", "问题2"]
+    stats = logger.stats()
+    assert stats["failed"] == 1 and stats["consecutive_failures"] == 0
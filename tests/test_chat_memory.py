@@ -0,0 +1,78 @@
+"""
+会话记忆测试
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src import chat_memory as memory_module
+from src.cache import cache_manager
+from src.chat_memory import ChatMemory, SessionMemory
+from src.database import Base
+from src.models import ChatHistory, User
+from tests.test_answer_cache import FakeRedis
+
+
+@pytest.fixture
+def config(monkeypatch):
+    config = dict(memory_module.CHAT_MEMORY_CONFIG, max_messages=4, token_budget=100, summary_tokens=30, summary_line_chars=20)
+    monkeypatch.setattr(memory_module, "CHAT_MEMORY_CONFIG", config)
+    return config
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine, tables=[User.__table__, ChatHistory.__table__])
+    return sessionmaker(bind=engine)()
+
+
+def test_trim_folds_oldest_turns_into_summary(config):
+    """测试超出窗口的最早一轮被压缩成摘要"""
+    memory = SessionMemory("u1")
+    for i in range(3):
+        memory.add("user", f"问题{i}")
+        memory.add("assistant", f"回答{i}第一句。补充说明")
+    memory.trim()
+
+    assert [message["content"] for message in memory.messages] == ["问题1", "回答1第一句。补充说明", "问题2", "回答2第一句。补充说明"]
+    assert memory.summary == ["问：问题0", "答：回答0第一句。"]
+
+
+def test_trim_respects_token_budget(config):
+    """测试窗口和摘要都不超过token预算，窗口从用户消息开始"""
+    memory = SessionMemory("u1")
+    memory.add("user", "什么是AWB")
+    memory.add("assistant", "白平衡" * 30)
+    memory.add("user", "怎么标定")
+    memory.add("assistant", "用色卡")
+    memory.trim()
+
+    assert memory.tokens() <= config["token_budget"]
+    assert memory.messages[0] == {"role": "user", "content": "怎么标定"}
+    assert memory.summary[0] == "问：什么是AWB"
+    assert memory.summary_text().startswith("问：什么是AWB\n答：白平衡")
+
+
+def test_load_rebuilds_recent_messages_on_miss(monkeypatch, config, db):
+    """测试缓存未命中时从数据库读取最近的消息，之后命中缓存不再查库"""
+    monkeypatch.setattr(cache_manager, "redis_client", FakeRedis())
+    start = datetime(2024, 1, 1)
+    for i in range(4):
+        created = start + timedelta(minutes=i)
+        db.add(ChatHistory(user_id="u1", session_id="s1", message_type="user", content=f"问题{i}", created_at=created))
+        db.add(ChatHistory(user_id="u1", session_id="s1", message_type="assistant", content=f"回答{i}", created_at=created))
+    db.commit()
+
+    chat_memory = ChatMemory()
+    memory = chat_memory.load(db, "s1", "u1")
+    assert [message["content"] for message in memory.history()] == ["问题2", "回答2", "问题3", "回答3"]
+    assert memory.summary[-2:] == ["问：问题1", "答：回答1"]
+
+    chat_memory.append("s1", memory, "问题4", "回答4")
+    assert chat_memory.load(None, "s1", "u1").history()[-1] == {"role": "assistant", "content": "回答4"}
+    assert chat_memory.load(db, "s1", "other").empty
+    assert chat_memory.stats()["hits"] == 1
+    assert chat_memory.stats()["misses"] == 2
@@ -0,0 +1,120 @@
+"""
+数据库全文检索后端测试
+"""
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from src.database import Base
+from src.models import KnowledgeCategory, KnowledgeItem, KnowledgeDetail
+from src.fulltext import SQLiteFTSBackend, LikeBackend, create_fulltext_backend
+
+
+engine = create_engine(
+    "sqlite://",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture
+def db():
+    """测试数据库会话（已创建FTS5表）"""
+    Base.metadata.create_all(bind=engine)
+    session = TestingSessionLocal()
+    session.add_all([
+        KnowledgeCategory(id="cat-isp", title="ISP算法", is_active=True),
+        KnowledgeCategory(id="cat-old", title="已下线", is_active=False),
+        KnowledgeItem(
+            id="item-demosaic", category_id="cat-isp", title="去马赛克",
+            description="Bayer域插值", content="Demosaic algorithm", sort_order=2
+        ),
+        KnowledgeItem(
+            id="item-hidden", category_id="cat-old", title="旧版去马赛克", sort_order=1
+        ),
+    ])
+    session.commit()
+    yield session
+    session.close()
+    with engine.begin() as conn:
+        conn.exec_driver_sql("DROP TABLE IF EXISTS knowledge_fts")
+        conn.exec_driver_sql("DROP TABLE IF EXISTS knowledge_fts_rows")
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def backend(db):
+    """SQLite FTS5后端"""
+    fts = SQLiteFTSBackend()
+    assert fts.setup(engine)
+    return fts
+
+
+def test_backend_selection():
+    """测试根据数据库地址选择后端"""
+    assert create_fulltext_backend("sqlite:///./a.db").name == "sqlite_fts5"
+    assert create_fulltext_backend("postgresql://u:p@h/db").name == "postgres_tsvector"
+    assert create_fulltext_backend("mysql://u:p@h/db").name == "like"
+
+
+def test_existing_rows_are_indexed(db, backend):
+    """测试初始化时填充已有数据并过滤停用分类"""
+    rows = backend.search(db, "马赛克")
+    assert [item.id for item, _, _ in rows] == ["item-demosaic"]
+    rows = backend.search(db, "马赛克", active_only=False)
+    assert [item.id for item, _, _ in rows] == ["item-hidden", "item-demosaic"]
+
+
+def test_triggers_follow_writes(db, backend):
+    """测试触发器同步知识项和详情的变更"""
+    db.add(KnowledgeDetail(id="detail-1", knowledge_id="item-demosaic", title="梯度自适应插值"))
+    db.commit()
+    assert [item.id for item, _, _ in backend.search(db, "梯度自适应")] == ["item-demosaic"]
+
+    item = db.query(KnowledgeItem).filter(KnowledgeItem.id == "item-demosaic").first()
+    item.content = "color filter array"
+    db.commit()
+    assert backend.search(db, "demosaic") == []
+    assert [row[0].id for row in backend.search(db, "filter array")] == ["item-demosaic"]
+
+    db.delete(item)
+    db.commit()
+    assert backend.search(db, "filter") == []
+
+
+def test_results_keyed_on_item_id(db, backend):
+    """测试FTS行与知识项按ID关联：知识项的隐式rowid变化（如VACUUM）后结果不错位，setup 修复旧版本按rowid建立的映射"""
+    db.add(KnowledgeItem(id="item-awb", category_id="cat-isp", title="自动白平衡", sort_order=3))
+    db.commit()
+    with engine.begin() as conn:
+        # 模拟VACUUM重新编号隐式rowid（不触发同步触发器），setup 重建触发器
+        conn.exec_driver_sql("DROP TRIGGER knowledge_fts_item_update")
+        conn.exec_driver_sql("UPDATE knowledge_items SET rowid = rowid + 100")
+    assert backend.setup(engine)
+    assert [row[0].id for row in backend.search(db, "马赛克")] == ["item-demosaic"]
+    assert [row[0].id for row in backend.search(db, "白平衡")] == ["item-awb"]
+
+    item = db.query(KnowledgeItem).filter(KnowledgeItem.id == "item-awb").first()
+    item.title = "自动曝光"
+    db.commit()
+    assert backend.search(db, "白平衡") == []
+    assert [row[0].id for row in backend.search(db, "自动曝光")] == ["item-awb"]
+
+    with engine.begin() as conn:
+        # 旧版本：FTS行号取自知识项rowid，映射表为空
+        conn.exec_driver_sql("DELETE FROM knowledge_fts_rows")
+    assert SQLiteFTSBackend().setup(engine)
+    assert [row[0].id for row in backend.search(db, "自动曝光")] == ["item-awb"]
+    db.delete(item)
+    db.commit()
+    assert backend.search(db, "自动曝光") == []
+
+
+def test_short_terms_and_like_fallback(db, backend):
+    """测试短查询词与LIKE回退结果一致"""
+    rows = backend.search(db, "马赛")
+    assert [item.id for item, _, score in rows] == ["item-demosaic"]
+    assert rows[0][2] is None
+    assert [row[0].id for row in LikeBackend().search(db, "马赛")] == ["item-demosaic"]
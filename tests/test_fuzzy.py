@@ -0,0 +1,55 @@
+"""
+模糊搜索测试
+"""
+from src.fuzzy import FuzzyCorrector, edit_distance
+from src.index_sync import ChangeSet
+from src.search_index import SearchIndex
+
+
+def build_index(items):
+    """构建带模糊匹配监听器的索引"""
+    index = SearchIndex()
+    corrector = FuzzyCorrector()
+    index.add_listener(corrector)
+    with index._lock:
+        index.categories["c1"] = {"id": "c1", "title": "ISP", "is_active": True}
+        for item in items:
+            index._add_document({"category_id": "c1", "status": "completed", **item})
+    for listener in index._listeners:
+        listener.on_rebuild(index)
+    return index, corrector
+
+
+ITEMS = [
+    {"id": "demosaic", "title": "去马赛克 Demosaic", "content": "Bayer pattern interpolation"},
+    {"id": "awb", "title": "自动白平衡", "content": "gray world"},
+]
+
+
+def test_edit_distance_counts_transpositions():
+    """测试相邻交换计为一次编辑，超出上限提前返回"""
+    assert edit_distance("demosiac", "demosaic", 2) == 1
+    assert edit_distance("patern", "pattern", 2) == 1
+    assert edit_distance("abcdef", "uvwxyz", 2) == 3
+
+
+def test_correct_typos_and_full_width():
+    """测试拉丁拼写错误、全角字符和中文错字纠正"""
+    index, corrector = build_index(ITEMS)
+    assert corrector.correct("demosiac", index.has_terms) == "demosaic"
+    assert corrector.correct("ｂａｙｅｒ patern", index.has_terms) == "bayer pattern"
+    assert corrector.correct("白平横", index.has_terms) == "白平衡"
+    # 已收录的查询无需纠正
+    assert corrector.correct("bayer 白平衡", index.has_terms) is None
+
+
+def test_vocabulary_follows_incremental_changes():
+    """测试增量更新后词表同步"""
+    index, corrector = build_index(ITEMS)
+    changes = ChangeSet()
+    changes.deleted_items.add("demosaic")
+    changes.items["sharpen"] = {"id": "sharpen", "category_id": "c1", "title": "锐化 Sharpening"}
+    index.apply_changes(changes)
+
+    assert "demosaic" not in corrector.vocabulary
+    assert corrector.correct("sharpning", index.has_terms) == "sharpening"
@@ -0,0 +1,66 @@
+"""
+游标分页测试
+"""
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from src.database import Base
+from src.models import User
+from src.pagination import paginate_query, paginate_sequence, encode_cursor
+
+
+def walk(fetch):
+    """沿 next 游标遍历全部页"""
+    seen, cursor = [], None
+    while True:
+        page = fetch(cursor)
+        seen.extend(page.items)
+        cursor = page.next_cursor
+        if not cursor:
+            return seen, page
+
+
+def test_sequence_pages_forward_and_back():
+    """测试内存列表分页前后翻页"""
+    items = [(i // 3, f"id{i:02d}") for i in range(10)]
+    seen, last = walk(lambda cursor: paginate_sequence(items, lambda item: item, 4, cursor))
+    assert seen == items
+
+    previous = paginate_sequence(items, lambda item: item, 4, last.prev_cursor)
+    assert previous.items == items[4:8]
+    assert previous.next_cursor and previous.prev_cursor
+
+
+def test_invalid_cursor_rejected():
+    """测试非法游标返回400"""
+    with pytest.raises(HTTPException) as exc:
+        paginate_sequence([(1,)], lambda item: item, 1, "not-a-cursor")
+    assert exc.value.status_code == 400
+    with pytest.raises(HTTPException):
+        paginate_sequence([(1,)], lambda item: item, 1, encode_cursor([1, 2]))
+
+
+def test_query_pages_with_server_default_timestamps():
+    """测试SQLite中同一秒写入（server_default）的行按 (created_at, id) 分页不重复不遗漏"""
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine, tables=[User.__table__])
+    db = sessionmaker(bind=engine)()
+    db.add_all([User(id=f"U{i}", username=f"user{i}", password_hash="x") for i in range(7)])
+    db.commit()
+    # 与 CURRENT_TIMESTAMP 写入的格式一致（无小数秒）
+    assert "." not in db.execute(text("SELECT created_at FROM users")).scalar()
+
+    def fetch(cursor, descending=False):
+        return paginate_query(
+            db.query(User), [User.created_at, User.id],
+            lambda user: (user.created_at, user.id), 3, cursor, descending
+        )
+
+    seen, last = walk(fetch)
+    assert [user.id for user in seen] == [f"U{i}" for i in range(7)]
+    assert [user.id for user in fetch(last.prev_cursor).items] == ["U3", "U4", "U5"]
+
+    seen, _ = walk(lambda cursor: fetch(cursor, descending=True))
+    assert [user.id for user in seen] == [f"U{i}" for i in reversed(range(7))]
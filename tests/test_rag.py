@@ -0,0 +1,101 @@
+"""
+RAG上下文构建测试
+"""
+import asyncio
+
+from src import rag, retrieval
+from src.rag import Candidate, build_context, estimate_tokens, pack_context, split_passages
+from tests.test_vector_index import build_index, ITEMS
+
+
+def candidate(item_id, title, rank, description=None, content=None, details=()):
+    return Candidate(
+        {"id": item_id, "title": title, "description": description, "content": content},
+        list(details),
+        rank
+    )
+
+
+def test_estimate_tokens():
+    """测试token估算"""
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("自动白平衡") == 5
+    assert estimate_tokens("AWB") == 1
+    assert estimate_tokens("demosaicing") == 3
+
+
+def test_split_passages_respects_max_chars():
+    """测试超长段落按句子切分"""
+    text = "第一句话比较长。第二句话也比较长。第三句。\n\n短段落"
+    passages = split_passages(text, max_chars=10)
+    assert passages[-1] == "短段落"
+    assert all(len(passage) <= 10 for passage in passages)
+    assert "".join(passages[:-1]) == text.split("\n")[0]
+
+
+def test_pack_context_stays_within_budget():
+    """测试装填不超过token预算，优先选择排名靠前且覆盖关键词的段落"""
+    candidates = [
+        candidate("awb", "自动白平衡", 0, description="估计光源色温", content="灰度世界假设。\n白点检测方法"),
+        candidate("nr", "降噪", 1, content="时域降噪与空域降噪"),
+    ]
+    context = pack_context(candidates, ["白平衡", "色温"], token_budget=20)
+    assert context.tokens <= 20
+    assert context.item_ids[0] == "awb"
+    assert context.text.startswith("知识项: 自动白平衡\n估计光源色温")
+    assert "降噪" not in context.text
+
+
+def test_pack_context_dedupes_passages():
+    """测试重复段落只选入一次，详情参与装填"""
+    candidates = [
+        candidate("a", "去马赛克", 0, description="Bayer插值", content="Bayer 插值"),
+        candidate("b", "拜耳阵列", 1, details=[{"title": "插值方法", "description": "双线性插值"}]),
+    ]
+    context = pack_context(candidates, ["插值"], token_budget=200)
+    assert "Bayer 插值" not in context.text
+    assert [p.source for p in context.passages] == ["description", "detail"]
+
+
+def test_pack_context_sources_follow_cited_items():
+    """测试来源记录只包含被引用的知识项，并携带分类、分数和详情链接"""
+    candidates = [
+        Candidate(
+            {"id": "awb", "category_id": "c1", "title": "自动白平衡", "description": "估计光源色温"},
+            [
+                {"id": "d1", "title": "灰度世界", "description": "假设", "external_link": "https://example.com/gw"},
+                {"id": "d2", "title": "白点检测", "description": "检测白点", "external_link": None},
+            ],
+            0,
+            category_title="3A算法",
+            score=0.83217
+        ),
+        candidate("nr", "降噪", 1, content="时域降噪与空域降噪"),
+    ]
+    context = pack_context(candidates, ["白平衡"], token_budget=20)
+    assert context.item_ids == ["awb"]
+    assert context.sources == [{
+        "type": "knowledge",
+        "id": "awb",
+        "title": "自动白平衡",
+        "category_id": "c1",
+        "category": "3A算法",
+        "score": 0.8322,
+        "external_link": "https://example.com/gw",
+        "details": [{"id": "d1", "title": "灰度世界", "external_link": "https://example.com/gw"}],
+    }]
+
+
+def test_build_context_uses_index(monkeypatch):
+    """测试索引就绪时通过混合检索构建上下文"""
+    index, vectors = build_index(ITEMS)
+    index.ready = True
+    monkeypatch.setattr(retrieval, "search_index", index)
+    monkeypatch.setattr(retrieval, "vector_index", vectors)
+    monkeypatch.setattr(rag, "search_index", index)
+
+    context = asyncio.run(build_context(None, "自动白平衡怎么校正颜色偏差"))
+    assert context.item_ids[0] == "awb"
+    assert "估计光源色温并校正颜色偏差" in context.text
+    assert [source["id"] for source in context.sources] == context.item_ids
+    assert context.sources[0]["score"] > 0
@@ -0,0 +1,145 @@
+"""
+上游弹性（重试、对冲、熔断）测试
+"""
+import asyncio
+
+import pytest
+
+from src.resilience import CircuitBreaker, CircuitOpenError, DeadlineExceededError, ResilientCaller
+
+
+def caller(**overrides):
+    breaker = overrides.pop("breaker", None) or CircuitBreaker(window=10, min_requests=4, error_rate=0.5, open_seconds=60)
+    config = dict(max_attempts=3, base_delay=0.001, max_delay=0.01, deadline=5)
+    config.update(overrides)
+    return ResilientCaller(breaker, **config)
+
+
+def call(resilient, fn):
+    return asyncio.run(resilient.call(fn, lambda r: r["success"], lambda r: r.get("retriable", False)))
+
+
+def test_retries_retriable_failures():
+    """测试可重试的失败按退避重试，不可重试的失败立即返回"""
+    results = [{"success": False, "retriable": True}, {"success": True}]
+
+    async def flaky():
+        return results.pop(0)
+
+    resilient = caller()
+    assert call(resilient, flaky)["success"] is True
+    assert resilient.stats()["retries"] == 1
+
+    attempts = []
+
+    async def rejected():
+        attempts.append(1)
+        return {"success": False, "retriable": False}
+
+    assert call(resilient, rejected)["success"] is False
+    assert len(attempts) == 1
+
+
+def test_backoff_is_capped_and_jittered():
+    """测试退避时间带抖动且不超过上限"""
+    resilient = caller(base_delay=0.1, max_delay=0.5)
+    delays = [resilient.backoff(6) for _ in range(50)]
+    assert all(0 <= delay <= 0.5 for delay in delays)
+    assert len(set(delays)) > 1
+
+
+def test_hedge_after_latency_quantile():
+    """测试主请求超过分位数延迟时发起对冲请求并采用先成功的结果"""
+    resilient = caller(hedge=True, hedge_min_samples=5, hedge_min_delay=0.01)
+    for _ in range(5):
+        resilient.latency.record(0.01)
+    calls = []
+
+    async def upstream():
+        calls.append(1)
+        # 第一个请求很慢，对冲请求很快
+        await asyncio.sleep(1 if len(calls) == 1 else 0)
+        return {"success": True, "attempt": len(calls)}
+
+    result = call(resilient, upstream)
+    assert result["attempt"] == 2
+    stats = resilient.stats()
+    assert stats["hedges"] == 1 and stats["hedge_wins"] == 1
+    assert stats["hedge_delay_ms"] >= 10
+
+
+def test_breaker_opens_and_recovers():
+    """测试失败率过高时熔断快速失败，冷却后探测成功即恢复"""
+    breaker = CircuitBreaker(window=10, min_requests=4, error_rate=0.5, open_seconds=60)
+    resilient = caller(breaker=breaker, max_attempts=1)
+
+    async def failing():
+        return {"success": False, "retriable": True}
+
+    async def healthy():
+        return {"success": True}
+
+    for _ in range(4):
+        call(resilient, failing)
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        call(resilient, healthy)
+
+    breaker.opened_at -= 60
+    assert call(resilient, healthy)["success"] is True
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.stats()["opens"] == 1 and breaker.stats()["rejected"] == 1
+
+
+def test_deadline_bounds_each_attempt():
+    """测试进行中的尝试也受总期限约束：首次尝试超时抛出异常，重试超时返回上一次的结果"""
+    resilient = caller(deadline=0.05)
+
+    async def hanging():
+        await asyncio.sleep(1)
+        return {"success": True}
+
+    with pytest.raises(DeadlineExceededError):
+        call(resilient, hanging)
+
+    results = [{"success": False, "retriable": True, "attempt": 1}]
+
+    async def flaky_then_hanging():
+        if results:
+            return results.pop(0)
+        return await hanging()
+
+    assert call(resilient, flaky_then_hanging)["attempt"] == 1
+    stats = resilient.stats()
+    assert stats["timeouts"] == 2
+    assert stats["breaker"]["window_failures"] == 3
+
+
+def test_no_hedge_while_half_open():
+    """测试半开状态只放行一个探测请求，不发起对冲；对冲请求的失败不计入熔断"""
+    breaker = CircuitBreaker(window=10, min_requests=4, error_rate=0.5, open_seconds=60)
+    resilient = caller(breaker=breaker, max_attempts=1, hedge=True, hedge_min_samples=1, hedge_min_delay=0.01)
+    resilient.latency.record(0.01)
+    breaker._open()
+    breaker.opened_at -= 60
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"success": True}
+
+    assert call(resilient, slow)["success"] is True
+    assert len(calls) == 1 and resilient.stats()["hedges"] == 0
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    async def slow_primary_failing_hedge():
+        calls.append(1)
+        if len(calls) == 2:
+            await asyncio.sleep(0.2)
+            return {"success": True}
+        return {"success": False, "retriable": True}
+
+    assert call(resilient, slow_primary_failing_hedge)["success"] is True
+    assert resilient.stats()["hedges"] == 1
+    assert breaker.stats()["window_failures"] == 0
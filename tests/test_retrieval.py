@@ -0,0 +1,68 @@
+"""
+混合检索测试
+"""
+import asyncio
+
+from src import retrieval
+from src.retrieval import fuse, hybrid_search
+from tests.test_vector_index import build_index, ITEMS
+
+
+def test_rrf_fusion_rewards_agreement():
+    """测试两路都靠前的结果排在首位，并保留各路分数"""
+    merged = fuse({
+        "lexical": [("a", 9.0), ("b", 5.0)],
+        "semantic": [("b", 0.8), ("c", 0.7)],
+    })
+    assert [entry[0] for entry in merged] == ["b", "a", "c"]
+    assert merged[0][2] == {"lexical": 5.0, "semantic": 0.8}
+    assert merged[0][3] == {"lexical": 2, "semantic": 1}
+
+
+def test_weighted_fusion_respects_weights():
+    """测试加权融合"""
+    ranked = {"lexical": [("a", 2.0)], "semantic": [("b", 0.5)]}
+    merged = fuse(ranked, method="weighted", weights={"lexical": 0.2, "semantic": 1.0})
+    assert merged[0][0] == "b"
+
+
+def test_hybrid_search_combines_retrievers(monkeypatch):
+    """测试混合检索同时命中精确词项和语义相关结果"""
+    index, vectors = build_index(ITEMS)
+    index.ready = True
+    monkeypatch.setattr(retrieval, "search_index", index)
+    monkeypatch.setattr(retrieval, "vector_index", vectors)
+
+    result = asyncio.run(hybrid_search("Bayer 颜色偏差", limit=3, require_all=False))
+    ids = [hit.item_id for hit in result.hits]
+    assert set(ids[:2]) == {"demosaic", "awb"}
+    assert "lexical" in result.hits[0].scores
+    assert {"lexical", "semantic", "fusion", "total"} <= set(result.timings_ms)
+    assert result.skipped == []
+
+
+def test_hybrid_search_skips_unavailable_retriever(monkeypatch):
+    """测试向量索引未就绪时退化为关键词检索"""
+    index, vectors = build_index(ITEMS)
+    index.ready = True
+    vectors.ready = False
+    monkeypatch.setattr(retrieval, "search_index", index)
+    monkeypatch.setattr(retrieval, "vector_index", vectors)
+
+    result = asyncio.run(hybrid_search("白平衡"))
+    assert [hit.item_id for hit in result.hits] == ["awb"]
+    assert result.skipped == ["semantic"]
+
+
+def test_sync_hybrid_matches_async(monkeypatch):
+    """测试同步混合检索（批量搜索使用）与异步版本结果一致"""
+    index, vectors = build_index(ITEMS)
+    index.ready = True
+    monkeypatch.setattr(retrieval, "search_index", index)
+    monkeypatch.setattr(retrieval, "vector_index", vectors)
+
+    expected = asyncio.run(hybrid_search("Bayer 颜色偏差", require_all=False))
+    with index.snapshot():
+        result = retrieval.hybrid_search_sync("Bayer 颜色偏差", require_all=False)
+    assert [hit.item_id for hit in result.hits] == [hit.item_id for hit in expected.hits]
+    assert {"lexical", "semantic", "fusion", "total"} <= set(result.timings_ms)
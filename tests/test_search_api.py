@@ -0,0 +1,141 @@
+"""
+搜索接口测试
+"""
+import gc
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from src import retrieval
+from src.admission import AdmissionController
+from src.cache import cache_manager
+from src.config import SEARCH_CONFIG
+from src.database import Base, get_db
+from src.fuzzy import FuzzyCorrector
+from src.routers import search
+from src.search_index import SearchIndex
+from src.vector_index import HashingEmbedder, VectorIndex
+
+
+ITEMS = [
+    {"id": "demosaic", "title": "去马赛克 Demosaic", "content": "Bayer pattern interpolation", "status": "completed"},
+    {"id": "awb", "title": "自动白平衡", "content": "gray world 白平衡增益", "status": "pending"},
+    {"id": "wb-lab", "title": "白平衡标定", "content": "色温标定流程", "status": "completed"},
+    {"id": "wb-night", "title": "夜景白平衡", "content": "低照度白平衡", "status": "completed"},
+]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """挂载搜索路由的测试客户端，索引只含 ITEMS"""
+    index = SearchIndex()
+    vectors = VectorIndex(HashingEmbedder(dim=256))
+    corrector = FuzzyCorrector()
+    index.add_listener(vectors)
+    index.add_listener(corrector)
+    with index._lock:
+        index.categories["c1"] = {"id": "c1", "title": "ISP", "is_active": True}
+        for item in ITEMS:
+            index._add_document({"category_id": "c1", **item})
+    for listener in index._listeners:
+        listener.on_rebuild(index)
+    index.ready = True
+
+    for module in (search, retrieval):
+        monkeypatch.setattr(module, "search_index", index)
+        monkeypatch.setattr(module, "vector_index", vectors)
+    monkeypatch.setattr(search, "fuzzy_corrector", corrector)
+    monkeypatch.setattr(cache_manager, "redis_client", None)
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+
+    def override_get_db():
+        db = factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app = FastAPI()
+    app.include_router(search.router)
+    app.dependency_overrides[get_db] = override_get_db
+    # 先在主线程回收前面测试遗留的SQLite连接，避免在客户端的事件循环线程中被回收
+    gc.collect()
+    return TestClient(app)
+
+
+def test_total_and_facets_not_capped_by_max_results(client, monkeypatch):
+    """测试结果被 max_results 截断时，总数和分面仍按全部匹配文档统计"""
+    monkeypatch.setitem(SEARCH_CONFIG, "max_results", 2)
+    data = client.get("/search", params={"q": "白平衡"}).json()
+    assert len(data["results"]) == 2
+    assert data["total"] == 3
+    assert data["facets"]["status"] == [{"status": "completed", "count": 2}, {"status": "pending", "count": 1}]
+
+
+def test_typo_corrected_in_default_hybrid_mode(client, monkeypatch):
+    """测试默认混合模式下，语义结果凑满数量也不影响按关键词命中数纠正拼写"""
+    # 语义检索对拼错的词也能返回结果，融合后的数量达到纠错阈值
+    monkeypatch.setitem(SEARCH_CONFIG["fuzzy"], "min_hits", 1)
+    data = client.get("/search", params={"q": "demosiac"}).json()
+    assert data["corrected_query"] == "demosaic"
+    assert data["results"][0]["id"] == "demosaic"
+    assert data["results"][0]["title_highlights"]
+
+    data = client.get("/search", params={"q": "Demosaci", "fuzzy": "false"}).json()
+    assert data["corrected_query"] is None
+
+
+def test_batch_search_keeps_request_order(client):
+    """测试批量搜索按请求顺序返回，相同查询只检索一次，各自应用过滤和数量限制"""
+    response = client.post("/search/batch", json={"queries": [
+        {"q": "白平衡", "limit": 1},
+        {"q": "bayer"},
+        {"q": "白平衡", "status": "pending"},
+    ]})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total_queries"] == 3 and data["unique_queries"] == 2
+    first, second, third = data["results"]
+    assert len(first["results"]) == 1 and first["total"] == 3 and first["next_cursor"]
+    assert [result["id"] for result in second["results"]] == ["demosaic"]
+    assert [result["id"] for result in third["results"]] == ["awb"] and third["total"] == 1
+
+
+def test_batch_search_limits_query_count(client):
+    """测试单次批量搜索的查询数量上限"""
+    assert client.post("/search/batch", json={"queries": [{"q": "awb"}] * 51}).status_code == 422
+    assert client.post("/search/batch", json={"queries": []}).status_code == 422
+
+
+def test_enhanced_search_goes_through_admission(client, monkeypatch):
+    """测试AI增强搜索在准入名额内调用大模型，超过每用户速率时返回429"""
+    admission = AdmissionController(max_concurrent=1, max_queue=0, queue_timeout=1.0, user_rate=0.01, user_burst=1)
+    monkeypatch.setattr(search.ai_service, "admission", admission)
+    active = []
+
+    async def enhance(query, results):
+        active.append(admission.active)
+        return {"success": True, "response": f"{query}: {len(results)}条"}
+
+    monkeypatch.setattr(search.ai_service, "search_enhancement", enhance)
+
+    @client.app.middleware("http")
+    async def login(request, call_next):
+        request.state.user = {"id": "u1"}
+        return await call_next(request)
+
+    data = client.get("/search/enhanced", params={"q": "白平衡"}).json()
+    assert data["ai_enhancement"] == "白平衡: 3条"
+    assert active == [1] and admission.active == 0
+
+    response = client.get("/search/enhanced", params={"q": "白平衡"})
+    assert response.status_code == 429
+    assert response.headers["Retry-After"]
+    assert active == [1]
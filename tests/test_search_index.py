@@ -0,0 +1,325 @@
+"""
+搜索索引测试
+"""
+import threading
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from src.database import Base
+from src.models import KnowledgeCategory, KnowledgeItem, KnowledgeDetail
+from src.search_index import IndexVersion, SearchIndex, tokenize, tokenize_query, normalize_text, highlight
+
+
+engine = create_engine(
+    "sqlite://",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture
+def db():
+    """测试数据库会话"""
+    Base.metadata.create_all(bind=engine)
+    session = TestingSessionLocal()
+    session.add_all([
+        KnowledgeCategory(id="cat-isp", title="ISP算法", is_active=True),
+        KnowledgeCategory(id="cat-old", title="已下线", is_active=False),
+        KnowledgeItem(
+            id="item-demosaic", category_id="cat-isp", title="去马赛克",
+            description="Bayer域插值还原RGB", content="Demosaic算法将Bayer pattern转换为全彩图像",
+            status="completed", sort_order=2
+        ),
+        KnowledgeItem(
+            id="item-awb", category_id="cat-isp", title="自动白平衡",
+            description="AWB估计光源色温", content="灰度世界假设",
+            status="pending", sort_order=1
+        ),
+        KnowledgeItem(
+            id="item-hidden", category_id="cat-old", title="旧版去马赛克",
+            description="已废弃", status="future", sort_order=3
+        ),
+        KnowledgeDetail(
+            id="detail-1", knowledge_id="item-awb", title="白平衡增益",
+            external_link="https://example.com/awb", sort_order=0
+        ),
+    ])
+    session.commit()
+    yield session
+    session.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def index(db):
+    """已构建的搜索索引"""
+    search_index = SearchIndex()
+    search_index.build(db)
+    return search_index
+
+
+def test_tokenize_mixed_text():
+    """测试中英文混合切分"""
+    assert tokenize("去马赛克 AWB") == ["去", "去马", "马", "马赛", "赛", "赛克", "克", "awb"]
+    assert tokenize_query("马赛克") == ["马赛", "赛克"]
+    assert tokenize_query("色") == ["色"]
+
+
+def test_normalize_full_width():
+    """测试全角字符规范化且长度不变"""
+    text = "ＡＷＢ算法"
+    assert normalize_text(text) == "awb算法"
+    assert len(normalize_text(text)) == len(text)
+
+
+def test_match_all_fields(index):
+    """测试标题、描述、内容、详情均可命中"""
+    assert {doc.id for doc in index.match("马赛克")} == {"item-demosaic", "item-hidden"}
+    assert [doc.id for doc in index.match("bayer")] == ["item-demosaic"]
+    assert [doc.id for doc in index.match("灰度世界")] == ["item-awb"]
+    assert [doc.id for doc in index.match("增益")] == ["item-awb"]
+
+
+def test_match_requires_all_terms(index):
+    """测试多词查询需全部命中"""
+    assert [doc.id for doc in index.match("bayer rgb")] == ["item-demosaic"]
+    assert index.match("bayer 色温") == []
+    assert index.match("！？") == []
+
+
+def test_document_metadata(index):
+    """测试文档元数据"""
+    doc = index.documents[index.doc_ids["item-awb"]]
+    assert doc.external_link == "https://example.com/awb"
+    assert index.category_title(doc.category_id) == "ISP算法"
+    assert not index.is_category_active("cat-old")
+
+
+def test_rebuild_keeps_serving_old_index(db, index, monkeypatch):
+    """测试全量构建在锁外进行，构建期间其他线程仍可查询旧索引"""
+    seen = []
+    add_document = IndexVersion._add_document
+
+    def add(self, item):
+        reader = threading.Thread(target=lambda: seen.append([doc.id for doc in index.match("白平衡")]))
+        reader.start()
+        reader.join(timeout=1)
+        add_document(self, item)
+
+    monkeypatch.setattr(IndexVersion, "_add_document", add)
+    index.build(db)
+    assert seen and all(ids == ["item-awb"] for ids in seen)
+    assert index.version == 2
+
+
+def test_changes_during_build_replayed(db, index, monkeypatch):
+    """测试全量构建读取数据库之后提交的变更在替换前重放到新版本，监听器看到的也是重放后的索引"""
+    from src.index_sync import ChangeSet
+
+    changes = ChangeSet()
+    changes.items["item-nr"] = {"id": "item-nr", "category_id": "cat-isp", "title": "时域降噪", "status": "completed"}
+    changes.deleted_items.add("item-awb")
+    add_document = IndexVersion._add_document
+
+    def add(self, item):
+        if index.building and not index._pending_changes:
+            # 构建已读取数据库，此时提交的事务触发增量更新
+            index.apply_changes(changes)
+        add_document(self, item)
+
+    class Listener:
+        def on_rebuild(self, rebuilt):
+            self.ids = sorted(rebuilt.item_ids())
+
+        def on_change(self, changed, upserted, removed):
+            pass
+
+    listener = Listener()
+    index.add_listener(listener)
+    monkeypatch.setattr(IndexVersion, "_add_document", add)
+    index.build(db)
+
+    assert not index.building
+    assert [doc.id for doc in index.match("降噪")] == ["item-nr"]
+    assert index.match("白平衡") == []
+    assert listener.ids == ["item-demosaic", "item-hidden", "item-nr"]
+
+
+def test_bm25_ranks_title_matches_first(db, index):
+    """测试标题命中排在内容命中之前"""
+    db.add(KnowledgeItem(
+        id="item-notes", category_id="cat-isp", title="插值笔记",
+        content="去马赛克 " + "插值 " * 50, sort_order=0
+    ))
+    db.commit()
+    index.build(db)
+
+    hits = index.search("马赛克")
+    assert [doc.id for doc, _ in hits][:2] == ["item-demosaic", "item-hidden"]
+    assert hits[0][1] > hits[-1][1] > 0
+
+
+def test_search_ranks_before_limit(index):
+    """测试先排序后截断，并支持过滤条件"""
+    hits = index.search("马赛克", limit=1, predicate=lambda doc: index.is_category_active(doc.category_id))
+    assert [doc.id for doc, _ in hits] == ["item-demosaic"]
+
+
+def test_search_any_term(index):
+    """测试任意词命中模式"""
+    assert index.search("bayer 色温") == []
+    hits = index.search("bayer 色温", require_all=False)
+    assert {doc.id for doc, _ in hits} == {"item-demosaic", "item-awb"}
+
+
+def test_facet_counts_from_bitsets(index):
+    """测试分面计数：每个分面应用其余分面的过滤条件"""
+    matched = index.match_bits("马赛克")
+    filters = {"category_id": None, "status": "completed"}
+    docs = index.documents_from_bits(index.filter_bits(matched, filters))
+    assert [doc.id for doc in docs] == ["item-demosaic"]
+
+    counts = index.facet_counts(matched, filters)
+    assert counts["category_id"] == {"cat-isp": 1}
+    assert counts["status"] == {"completed": 1, "future": 1}
+
+
+def test_snippet_and_highlights(index):
+    """测试摘要截取最佳片段，高亮偏移相对摘要文本"""
+    doc = index.get_document("item-demosaic")
+    marks = highlight(doc, "Bayer 全彩", max_length=30)
+    snippet = marks["snippet"]
+    assert len(snippet.strip("…")) <= 30
+    assert [snippet[start:end] for start, end in marks["highlights"]] == ["Bayer", "全彩"]
+
+    marks = highlight(doc, "马赛克", max_length=50)
+    assert marks["title_highlights"] == [[1, 4]]
+    assert marks["snippet"] == "Bayer域插值还原RGB"
+
+
+def test_highlight_and_removal_use_stored_offsets(index, monkeypatch):
+    """测试高亮和移除文档读取索引中保存的偏移量，不重新切分文本"""
+    from src import search_index as index_module
+
+    doc = index.get_document("item-demosaic")
+    assert list(doc.token_offsets["content"]["bayer"]) == [11]
+
+    iter_tokens = index_module.iter_tokens
+
+    def query_only(text, unigrams=True):
+        # 查询按二元组切分；切分文档文本（含单字）时失败
+        assert not unigrams, "不应重新切分文档文本"
+        return iter_tokens(text, unigrams)
+
+    monkeypatch.setattr(index_module, "iter_tokens", query_only)
+    marks = highlight(doc, "Bayer 全彩", max_length=30)
+    assert [marks["snippet"][start:end] for start, end in marks["highlights"]] == ["Bayer", "全彩"]
+
+    with index._lock:
+        index._remove_document("item-demosaic")
+    assert "bayer" not in index.postings
+    assert {doc.id for doc in index.match("马赛克")} == {"item-hidden"}
+
+
+def test_snapshot_keeps_version_without_blocking_writers(db, index):
+    """测试快照固定版本但不持有锁：快照期间其他线程的增量更新照常发布，快照内仍读取旧版本"""
+    from src.index_sync import ChangeSet
+
+    changes = ChangeSet()
+    changes.items["item-nr"] = {"id": "item-nr", "category_id": "cat-isp", "title": "时域降噪"}
+    changes.deleted_items.add("item-awb")
+    writer = threading.Thread(target=index.apply_changes, args=(changes,))
+    with index.snapshot() as pinned:
+        writer.start()
+        writer.join(timeout=5)
+        assert not writer.is_alive()
+        assert index.match("降噪") == [] and index.version == pinned.version
+        # 其他线程读取最新版本
+        seen = []
+        reader = threading.Thread(target=lambda: seen.extend(doc.id for doc in index.match("降噪")))
+        reader.start()
+        reader.join(timeout=5)
+        assert seen == ["item-nr"]
+    assert [doc.id for doc in index.match("降噪")] == ["item-nr"]
+    assert index.version == pinned.version + 1
+    assert index.match("白平衡") == []
+    # 旧版本（与新版本共享未修改的倒排表）未被修改
+    assert pinned.match("降噪") == []
+    assert [doc.id for doc in pinned.match("白平衡")] == ["item-awb"]
+    assert pinned.facet_counts(pinned.item_bits(["item-awb"]))["status"] == {"pending": 1}
+
+
+@pytest.fixture
+def synced_index(db):
+    """已注册增量同步的全局搜索索引"""
+    from src.search_index import search_index
+    from src.index_sync import register_index_sync
+
+    search_index.build(db)
+    register_index_sync()
+    yield search_index
+    search_index.ready = False
+
+
+def test_incremental_item_changes(db, synced_index):
+    """测试知识项增删改后索引增量更新"""
+    version = synced_index.version
+    db.add(KnowledgeItem(id="item-nr", category_id="cat-isp", title="时域降噪", content="TNR"))
+    db.commit()
+    assert [doc.id for doc in synced_index.match("降噪")] == ["item-nr"]
+    assert synced_index.version == version + 1
+
+    item = db.query(KnowledgeItem).filter(KnowledgeItem.id == "item-nr").first()
+    item.title = "空域降噪"
+    db.commit()
+    assert synced_index.match("时域") == []
+    assert [doc.id for doc in synced_index.match("空域降噪")] == ["item-nr"]
+    assert [doc.id for doc in synced_index.match("tnr")] == ["item-nr"]
+
+    db.delete(item)
+    db.commit()
+    assert synced_index.match("降噪") == []
+    assert synced_index.facet_counts(synced_index.item_bits(["item-nr", "item-awb"]))["status"] == {"pending": 1}
+
+
+def test_incremental_detail_and_category_changes(db, synced_index):
+    """测试详情和分类变更同步到索引"""
+    db.add(KnowledgeDetail(id="detail-2", knowledge_id="item-demosaic", title="边缘导向插值"))
+    db.commit()
+    assert [doc.id for doc in synced_index.match("边缘导向")] == ["item-demosaic"]
+
+    detail = db.query(KnowledgeDetail).filter(KnowledgeDetail.id == "detail-2").first()
+    db.delete(detail)
+    db.commit()
+    assert synced_index.match("边缘导向") == []
+
+    category = db.query(KnowledgeCategory).filter(KnowledgeCategory.id == "cat-old").first()
+    category.is_active = True
+    db.commit()
+    assert synced_index.is_category_active("cat-old")
+
+
+def test_rollback_discards_changes(db, synced_index):
+    """测试回滚的变更不会写入索引"""
+    version = synced_index.version
+    db.add(KnowledgeItem(id="item-tmp", category_id="cat-isp", title="临时条目"))
+    db.flush()
+    db.rollback()
+    assert synced_index.match("临时条目") == []
+    assert synced_index.version == version
+
+
+def test_updates_reuse_docnos(db, synced_index):
+    """测试反复更新知识项时复用文档编号，位图不会随更新次数增长"""
+    item = db.query(KnowledgeItem).filter(KnowledgeItem.id == "item-awb").first()
+    for title in ("白平衡一", "白平衡二", "白平衡三"):
+        item.title = title
+        db.commit()
+    assert max(synced_index.documents) == len(synced_index.documents) - 1
+    assert [doc.id for doc in synced_index.match("白平衡三")] == ["item-awb"]
+    assert synced_index.match("白平衡一") == []
+    assert len(synced_index.postings["灰度"]) == 1
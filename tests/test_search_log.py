@@ -0,0 +1,65 @@
+"""
+搜索日志与热门搜索统计测试
+"""
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.config import settings
+from src.database import Base
+from src.models import SearchLog, User
+from src.search_log import SearchLogger, SpaceSaving, TrendingQueries, normalize_query
+
+
+def test_normalize_query():
+    """测试查询规范化"""
+    assert normalize_query("  ＡＷＢ   算法 ") == "awb 算法"
+
+
+def test_space_saving_keeps_heavy_hitters():
+    """测试有界计数器保留高频项"""
+    sketch = SpaceSaving(capacity=10)
+    for query in ["awb"] * 50 + ["demosaic"] * 30 + [f"rare-{i}" for i in range(100)]:
+        sketch.offer(query)
+
+    assert len(sketch.counts) == 10
+    top = [query for query, _ in sketch.top(2)]
+    assert top == ["awb", "demosaic"]
+
+
+def test_trending_windows_expire():
+    """测试过期窗口不再计入热门统计"""
+    trending = TrendingQueries(window_seconds=60, window_count=2, capacity=10)
+    trending.record("awb", now=0)
+    trending.record("awb", now=10)
+    trending.record("降噪", now=70)
+
+    assert trending.top(5, now=70) == [("awb", 2), ("降噪", 1)]
+    assert trending.top(5, now=130) == [("降噪", 1)]
+
+
+def test_load_restores_windows_by_timestamp():
+    """测试启动时按记录时间把历史日志放回各自窗口，过期后不再计入"""
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine, tables=[User.__table__, SearchLog.__table__])
+    db = sessionmaker(bind=engine)()
+    now = datetime.now(timezone.utc)
+    window = timedelta(seconds=settings.search_trending_window_seconds)
+    rows = [("awb", now - window * 3)] * 3 + [("降噪", now)] * 2 + [("无结果", now)]
+    db.add_all([
+        SearchLog(query=query, normalized_query=query, result_count=0 if query == "无结果" else 1, created_at=created_at)
+        for query, created_at in rows
+    ])
+    db.commit()
+
+    logger = SearchLogger()
+    logger.load(db)
+    assert logger.total_searches == 6
+    assert logger.trending.top(5) == [("awb", 3), ("降噪", 2)]
+
+    # 三个窗口之前的记录在窗口数-2个窗口后过期，近期记录仍保留
+    later = now.timestamp() + window.total_seconds() * (settings.search_trending_windows - 2)
+    assert logger.trending.top(5, now=later) == [("降噪", 2)]
+    db.close()
+    engine.dispose()
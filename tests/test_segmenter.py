@@ -0,0 +1,43 @@
+"""
+中文分词测试
+"""
+from src.index_sync import ChangeSet
+from src.search_index import SearchIndex
+from src.segmenter import Segmenter, Trie
+
+
+def test_trie_enumerates_word_ends():
+    """测试字典树枚举所有成词终点"""
+    trie = Trie()
+    trie.add("白平衡", 10)
+    trie.add("自动白平衡", 5)
+    trie.add("自动", 1)
+    assert list(trie.ends("自动白平衡算法", 0)) == [(2, 1), (5, 5)]
+    assert "白平衡" in trie and "白平" not in trie
+
+
+def test_cut_question_and_extract_keywords():
+    """测试问句按词典切分，关键词去掉停用词"""
+    segmenter = Segmenter()
+    question = "自动白平衡在低色温光源下偏色怎么调整？"
+    assert segmenter.cut(question)[:2] == ["自动白平衡", "在"]
+    assert segmenter.extract_keywords(question) == ["自动白平衡", "色温", "光源", "偏色", "调整"]
+    assert segmenter.extract_keywords("ＡＷＢ增益怎么设置") == ["awb", "增益", "设置"]
+
+
+def test_dictionary_follows_index_titles():
+    """测试词典自动收录知识项和分类标题"""
+    index = SearchIndex()
+    segmenter = Segmenter()
+    index.add_listener(segmenter)
+    with index._lock:
+        index.categories["c1"] = {"id": "c1", "title": "图像增强", "is_active": True}
+        index._add_document({"id": "i1", "category_id": "c1", "title": "局部色调映射"})
+    for listener in index._listeners:
+        listener.on_rebuild(index)
+    assert "局部色调映射" in segmenter.cut("局部色调映射参数")
+
+    changes = ChangeSet()
+    changes.items["i2"] = {"id": "i2", "category_id": "c1", "title": "双边滤波"}
+    index.apply_changes(changes)
+    assert segmenter.cut("双边滤波的作用")[0] == "双边滤波"
@@ -0,0 +1,109 @@
+"""
+请求合并测试
+"""
+import asyncio
+
+import pytest
+
+from src.cache import cache_manager
+from src.singleflight import SingleFlight
+from tests.test_answer_cache import FakeRedis
+
+
+@pytest.fixture(autouse=True)
+def no_redis(monkeypatch):
+    monkeypatch.setattr(cache_manager, "redis_client", None)
+
+
+def test_concurrent_calls_share_one_execution():
+    """测试相同key的并发调用只执行一次"""
+    flights = SingleFlight("test")
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"response": "ok"}
+
+    async def run():
+        return await asyncio.gather(*[flights.do("k", fetch) for _ in range(5)])
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert all(result == {"response": "ok"} for result in results)
+    assert flights.stats()["followers"] == 4
+    assert flights.stats()["in_flight"] == 0
+
+
+def test_stream_is_broadcast_to_late_subscribers():
+    """测试流式调用共享事件流，后加入者补收已产出的事件"""
+    flights = SingleFlight("test")
+    calls = []
+
+    async def source():
+        calls.append(1)
+        for text in ["自动", "白平衡"]:
+            yield {"type": "delta", "text": text}
+            await asyncio.sleep(0.01)
+        yield {"type": "done", "response": "自动白平衡"}
+
+    async def consume(delay):
+        await asyncio.sleep(delay)
+        return [event async for event in flights.stream("k", source)]
+
+    async def run():
+        return await asyncio.gather(consume(0), consume(0.005))
+
+    first, second = asyncio.run(run())
+    assert len(calls) == 1
+    assert first == second
+    assert first[-1]["response"] == "自动白平衡"
+
+
+def test_stream_cancelled_when_all_subscribers_leave():
+    """测试所有订阅者离开后取消上游"""
+    flights = SingleFlight("test")
+    closed = []
+
+    async def source():
+        try:
+            while True:
+                yield {"type": "delta", "text": "x"}
+                await asyncio.sleep(0.01)
+        finally:
+            closed.append(1)
+
+    async def run():
+        stream = flights.stream("k", source)
+        await stream.__anext__()
+        await stream.aclose()
+        await asyncio.sleep(0.02)
+
+    asyncio.run(run())
+    assert closed == [1]
+    assert flights.stats()["in_flight"] == 0
+
+
+def test_remote_result_shared_across_processes(monkeypatch):
+    """测试其他进程持锁时等待并复用其结果"""
+    redis = FakeRedis()
+    monkeypatch.setattr(cache_manager, "redis_client", redis)
+    leader = SingleFlight("test", poll_interval=0.01)
+    follower = SingleFlight("test", poll_interval=0.01)
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.03)
+        return {"success": True, "response": "ok"}
+
+    async def run():
+        first = asyncio.ensure_future(leader.do("k", fetch))
+        await asyncio.sleep(0.005)
+        second = await follower.do("k", fetch)
+        return await first, second
+
+    first, second = asyncio.run(run())
+    assert len(calls) == 1
+    assert second == first
+    assert follower.stats()["remote_followers"] == 1
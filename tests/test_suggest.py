@@ -0,0 +1,96 @@
+"""
+搜索建议测试
+"""
+from src.search_index import SearchIndex
+from src.index_sync import ChangeSet
+from src.suggest import Suggester, pinyin_initials
+
+
+class FakeSession:
+    """模拟数据库会话（只返回预置数据）"""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def query(self, model):
+        return self
+
+    def all(self):
+        return self.rows.pop(0)
+
+
+class Row:
+    """模拟ORM对象"""
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def build_index():
+    """构建带建议监听器的索引"""
+    index = SearchIndex()
+    suggester = Suggester()
+    index.add_listener(suggester)
+    index.build(FakeSession([
+        [Row(id="c1", title="色彩处理", is_active=True)],
+        [Row(id="d1", knowledge_id="i2", title="白平衡增益", description=None,
+             external_link=None, sort_order=0)],
+        [
+            Row(id="i1", category_id="c1", title="去马赛克", description=None,
+                content=None, status="completed", sort_order=0),
+            Row(id="i2", category_id="c1", title="自动白平衡", description=None,
+                content=None, status="completed", sort_order=1),
+        ],
+    ]))
+    return index, suggester
+
+
+def test_pinyin_initials():
+    """测试拼音首字母"""
+    assert pinyin_initials("自动白平衡") == "zdbph"
+    assert pinyin_initials("AWB算法") == "awbsf"
+
+
+def test_prefix_and_infix_suggestions():
+    """测试前缀优先、中间位置也能匹配"""
+    _, suggester = build_index()
+    assert suggester.suggest("白平衡") == ["白平衡增益", "自动白平衡"]
+    assert suggester.suggest("马赛") == ["去马赛克"]
+    assert suggester.suggest("zdb") == ["自动白平衡"]
+    assert suggester.suggest("色彩") == ["色彩处理"]
+
+
+def test_popularity_weighting():
+    """测试热度影响排序"""
+    _, suggester = build_index()
+    suggester.bump("自动白平衡", 20)
+    assert suggester.suggest("白平衡") == ["自动白平衡", "白平衡增益"]
+
+
+def test_incremental_refresh():
+    """测试知识项变更后建议增量刷新"""
+    index, suggester = build_index()
+    changes = ChangeSet()
+    changes.items["i1"] = {"title": "去马赛克插值"}
+    changes.deleted_details["d1"] = "i2"
+    index.apply_changes(changes)
+
+    assert suggester.suggest("去马") == ["去马赛克插值"]
+    assert suggester.suggest("白平衡") == ["自动白平衡"]
+
+
+def test_cached_short_prefixes_match_full_scan():
+    """测试短前缀的预计算结果在热度变化和增量更新后与逐条打分一致"""
+    index, suggester = build_index()
+    suggester.bump("白平衡增益", 2)
+    suggester.bump("zdbph", 5)
+    changes = ChangeSet()
+    changes.items["i3"] = {"id": "i3", "category_id": "c1", "title": "白点校正"}
+    index.apply_changes(changes)
+
+    prefixes = {key[:n] for key, _, _ in suggester._keys for n in range(1, 4)}
+    for prefix in prefixes:
+        expected = [phrase for phrase, _ in suggester._rank(suggester._scan(prefix), 10)]
+        assert suggester.suggest(prefix) == expected
+    assert suggester.suggest("白") == ["白平衡增益", "白点校正", "自动白平衡"]
+    assert suggester.stats()["cached_prefixes"] >= len(prefixes)
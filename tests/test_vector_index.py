@@ -0,0 +1,176 @@
+"""
+向量检索测试
+"""
+import json
+import os
+
+import numpy as np
+
+from src.search_index import SearchIndex
+from src.index_sync import ChangeSet
+from src.vector_index import HashingEmbedder, VectorIndex
+
+
+def build_index(items):
+    """构建带向量监听器的索引"""
+    index = SearchIndex()
+    vectors = VectorIndex(HashingEmbedder(dim=256))
+    index.add_listener(vectors)
+    with index._lock:
+        index.categories["c1"] = {"id": "c1", "title": "ISP", "is_active": True}
+        for item in items:
+            index._add_document({"category_id": "c1", "status": "completed", **item})
+    for listener in index._listeners:
+        listener.on_rebuild(index)
+    return index, vectors
+
+
+ITEMS = [
+    {"id": "demosaic", "title": "去马赛克", "content": "将Bayer阵列插值为全彩色图像"},
+    {"id": "awb", "title": "自动白平衡", "content": "估计光源色温并校正颜色偏差"},
+    {"id": "nr", "title": "降噪", "content": "抑制图像中的随机噪声"},
+]
+
+
+def test_embeddings_are_normalized():
+    """测试向量为L2归一化的float32"""
+    embedder = HashingEmbedder(dim=64)
+    vectors = embedder.embed(["自动白平衡", "AWB", ""])
+    assert vectors.dtype == np.float32
+    assert np.allclose(np.linalg.norm(vectors[:2], axis=1), 1.0)
+    assert not vectors[2].any()
+
+
+def test_semantic_search_ranks_related_items():
+    """测试语义检索返回最相关的知识项"""
+    _, vectors = build_index(ITEMS)
+    hits = vectors.search("如何校正图像颜色偏差", limit=2)
+    assert hits[0][0] == "awb"
+    assert hits[0][1] > hits[1][1]
+
+
+def test_incremental_vectors_and_predicate():
+    """测试增量更新与过滤条件"""
+    index, vectors = build_index(ITEMS)
+    changes = ChangeSet()
+    changes.deleted_items.add("awb")
+    changes.items["sharpen"] = {"id": "sharpen", "category_id": "c1", "title": "锐化", "content": "增强图像边缘细节"}
+    index.apply_changes(changes)
+
+    assert "awb" not in [item_id for item_id, _ in vectors.search("颜色偏差")]
+    assert vectors.search("边缘细节", limit=1)[0][0] == "sharpen"
+    assert vectors.search("边缘细节", predicate=lambda item_id: item_id != "sharpen")[0][0] != "sharpen"
+
+
+def test_rebuild_swaps_fitted_embedder(monkeypatch):
+    """测试全量构建在新的向量化实例上拟合IDF并与矩阵一起替换；检索期间发生替换时按新IDF重新向量化查询"""
+    index, vectors = build_index(ITEMS)
+    old = vectors.embedder
+    old_idf = old.idf.copy()
+    changes = ChangeSet()
+    changes.items["sharpen"] = {"id": "sharpen", "category_id": "c1", "title": "锐化", "content": "增强图像边缘细节"}
+    index.apply_changes(changes)
+
+    rebuilt = []
+    embed = HashingEmbedder.embed
+
+    def embed_then_rebuild(self, texts):
+        vectors_out = embed(self, texts)
+        if self is old and not rebuilt:
+            # 查询已用旧实例向量化，此时全量构建完成
+            rebuilt.append(True)
+            vectors.on_rebuild(index)
+        return vectors_out
+
+    monkeypatch.setattr(HashingEmbedder, "embed", embed_then_rebuild)
+    hits = vectors.search("图像边缘", limit=4)
+    monkeypatch.undo()
+    assert rebuilt and vectors.embedder is not old
+    assert np.array_equal(old.idf, old_idf)
+    assert hits == vectors.search("图像边缘", limit=4)
+
+
+def test_predicate_runs_outside_lock():
+    """测试过滤条件在释放向量锁后执行（过滤条件会访问搜索索引，持锁调用会与批量搜索形成相反的加锁顺序）"""
+    index, vectors = build_index(ITEMS)
+    owned = []
+
+    def predicate(item_id):
+        owned.append(vectors._lock._is_owned())
+        return index.is_item_active(item_id)
+
+    assert vectors.search("颜色偏差", predicate=predicate)
+    assert owned and not any(owned)
+
+
+def test_memory_mapped_vectors_reloaded_when_unchanged(tmp_path):
+    """测试磁盘上的向量与文档一致时直接加载，文档变化后重新向量化，扩容时原子替换文件"""
+    path = str(tmp_path / "vectors.npy")
+    index = SearchIndex()
+    with index._lock:
+        index.categories["c1"] = {"id": "c1", "title": "ISP", "is_active": True}
+        for item in ITEMS:
+            index._add_document({"category_id": "c1", "status": "completed", **item})
+
+    first = VectorIndex(HashingEmbedder(dim=256), path=path)
+    first.on_rebuild(index)
+    expected = first.search("颜色偏差", limit=3)
+    assert not first.loaded_from_disk
+
+    second = VectorIndex(HashingEmbedder(dim=256), path=path)
+    second.on_rebuild(index)
+    assert second.loaded_from_disk
+    assert second.search("颜色偏差", limit=3) == expected
+
+    # 增量更新后元数据同步，扩容不会在旧映射未释放时覆盖文件
+    second._grow(200)
+    changes = ChangeSet()
+    changes.items["nr"] = {"id": "nr", "category_id": "c1", "title": "时域降噪", "content": "多帧融合降噪"}
+    index.apply_changes(changes)
+    second.on_change(index, {"nr"}, set())
+    assert second.matrix.shape[0] == 200
+
+    third = VectorIndex(HashingEmbedder(dim=256), path=path)
+    third.on_rebuild(index)
+    assert third.loaded_from_disk
+    assert third.search("多帧融合", limit=1)[0][0] == "nr"
+
+    other = VectorIndex(HashingEmbedder(dim=128), path=path)
+    other.on_rebuild(index)
+    assert not other.loaded_from_disk
+
+
+def test_incremental_change_appends_journal(tmp_path):
+    """测试增量更新只追加变更行的元数据，重新加载时回放日志"""
+    path = str(tmp_path / "vectors.npy")
+    index = SearchIndex()
+    with index._lock:
+        index.categories["c1"] = {"id": "c1", "title": "ISP", "is_active": True}
+        for item in ITEMS:
+            index._add_document({"category_id": "c1", "status": "completed", **item})
+
+    first = VectorIndex(HashingEmbedder(dim=256), path=path)
+    first.on_rebuild(index)
+    with open(first.meta_path, encoding="utf-8") as f:
+        meta = f.read()
+
+    changes = ChangeSet()
+    changes.items["hdr"] = {"id": "hdr", "category_id": "c1", "title": "高动态范围", "content": "多曝光融合"}
+    changes.deleted_items.add("nr")
+    index.apply_changes(changes)
+    first.on_change(index, {"hdr"}, {"nr"})
+
+    with open(first.meta_path, encoding="utf-8") as f:
+        assert f.read() == meta
+    with open(first.journal_path, encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f]
+    # 删除腾出的行被新知识项复用，日志只有这一行
+    assert [(entry["row"], entry["id"]) for entry in entries] == [(first.rows["hdr"], "hdr")]
+
+    second = VectorIndex(HashingEmbedder(dim=256), path=path)
+    second.on_rebuild(index)
+    assert second.loaded_from_disk
+    assert second.search("多曝光融合", limit=1)[0][0] == "hdr"
+    assert "nr" not in second.rows
+    # 加载后日志已合并进完整元数据
+    assert os.path.getsize(second.journal_path) == 0